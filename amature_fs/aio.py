@@ -0,0 +1,527 @@
+"""
+fsspec の AsyncFileSystem 上で動作する asyncio ネイティブなストア。
+
+ブロックはチャンクオブジェクトとして非同期に書き込み、ハッシュ計算は executor で行う。
+1 つのイベントループで多数の転送を並行して扱える。
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from os import path
+
+from fsspec.asyn import AsyncFileSystem
+
+from .blockpool import get_stored_block_hashes
+from .compression import decode_block, is_compressed
+from .exceptions import RFC7807Error
+from .hashing import BlockHasher, chain_hashes
+from .lease import get_owner_id, is_expired
+from .models import MetaData
+from .reader import get_block_source, verify_block
+from .store import StoreBluePrint, get_layout, get_chunk_location
+from .utils import chunk_name, uuid7
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_blocks(file, block_size: int):
+    """ファイルから block_size ごとのブロックを読み込む。
+
+    file は非同期イテラブル（bytes を返す）、async read(size) を持つオブジェクト、
+    または同期の read(size) を持つオブジェクトのいずれか。
+    """
+    if hasattr(file, "__aiter__"):
+        buf = bytearray()
+        async for data in file:
+            buf += data
+            while block_size <= len(buf):
+                yield bytes(buf[:block_size])
+                del buf[:block_size]
+        if buf:
+            yield bytes(buf)
+        return
+
+    while True:
+        # read はブロック長に満たないデータを返すことがあるので EOF まで詰める
+        buf = bytearray()
+        while len(buf) < block_size:
+            data = file.read(block_size - len(buf))
+            if inspect.isawaitable(data):
+                data = await data
+            if not data:
+                break
+            buf += data
+        if not buf:
+            break
+        yield bytes(buf)
+        if len(buf) < block_size:
+            break
+
+
+class AsyncBlockReader:
+    def __init__(
+        self,
+        fs: AsyncFileSystem,
+        meta: dict,
+        data_path: str,
+        verify: bool = False,
+        executor=None,
+    ):
+        self._fs = fs
+        self._meta = meta
+        self._data_path = data_path
+        self._verify = verify
+        self._executor = executor
+        self._block_size = int(meta["system"]["chunks"]["block_size"])
+        self._size = int(meta["system"]["size"])
+        self._pos = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos: int):
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+        self._pos = pos
+        return self._pos
+
+    async def _fetch_block(self, index):
+        block_path, start, end = get_block_source(self._meta, index, self._data_path)
+        block = await self._fs._cat_file(block_path, start=start, end=end)
+        if self._verify or is_compressed(self._meta):
+            # 展開と検証は CPU を使うため、イベントループの外で行う
+            loop = asyncio.get_running_loop()
+            block = await loop.run_in_executor(
+                self._executor, self._decode_block, index, block
+            )
+        return block
+
+    def _decode_block(self, index, block):
+        block = decode_block(self._meta, index, block)
+        if self._verify:
+            verify_block(self._meta, index, block)
+        return block
+
+    async def read_range(self, offset: int, length: int = -1) -> bytes:
+        end = self._size if length < 0 else min(offset + length, self._size)
+        if end <= offset:
+            return b""
+
+        first = offset // self._block_size
+        last = (end - 1) // self._block_size
+        blocks = await asyncio.gather(
+            *(self._fetch_block(index) for index in range(first, last + 1))
+        )
+        start = offset - first * self._block_size
+        return b"".join(blocks)[start : start + end - offset]
+
+    async def read(self, size: int = -1) -> bytes:
+        data = await self.read_range(self._pos, size)
+        self._pos += len(data)
+        return data
+
+    async def __aiter__(self):
+        """現在位置からブロック単位でデータを返す"""
+        while self._pos < self._size:
+            length = self._block_size - self._pos % self._block_size
+            yield await self.read(length)
+
+
+class AsyncMyStore:
+    @classmethod
+    def from_fsspec(
+        cls,
+        client: AsyncFileSystem,
+        blueprint: StoreBluePrint,
+        max_concurrency: int = None,
+    ):
+        return cls(client, blueprint, max_concurrency=max_concurrency)
+
+    def __init__(
+        self,
+        client: AsyncFileSystem,
+        blueprint: StoreBluePrint,
+        max_concurrency: int = None,
+        executor=None,
+    ):
+        if not getattr(client, "async_impl", False):
+            raise RFC7807Error.internalservererror("AsyncFileSystem is required.")
+
+        self._client = client
+        self._blueprint = blueprint
+        self._max_concurrency = max_concurrency or blueprint.get_upload_workers()
+        self._executor = executor or ThreadPoolExecutor(self._max_concurrency)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _load_meta(self, meta_path):
+        try:
+            return json.loads(await self._client._cat_file(meta_path))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    async def _dump_meta(self, meta_path, meta):
+        await self._client._pipe_file(meta_path, json.dumps(meta).encode())
+
+    async def _notify(self, event, key, *args):
+        """StoreBluePrint._notify の非同期版（ベストエフォート）"""
+        for listener in self._blueprint._listeners:
+            try:
+                handler = getattr(listener, f"{event}_async", None)
+                if handler is not None:
+                    await handler(self._client, key, *args)
+                else:
+                    await self._run(getattr(listener, event), self._client, key, *args)
+            except Exception:
+                logger.exception("Listener %r failed on %s: %s", listener, event, key)
+
+    async def _release_chunks(self, meta):
+        fs = self._client
+        layout = get_layout(meta)
+        if layout == "chunked":
+            location = get_chunk_location(meta)
+            if location and await fs._exists(location):
+                await fs._rm(location, recursive=True)
+        elif layout == "cas" and meta["system"].get("id"):
+            pool = self._blueprint.get_block_pool(fs)
+            await pool.decref_async(meta["system"]["id"], get_stored_block_hashes(meta))
+
+    def _get_lease(self, meta):
+        if not meta:
+            return None
+        return meta.get("system", {}).get("lease")
+
+    async def _reap_lease(self, key) -> bool:
+        """StoreBluePrint.reap_lease の非同期版"""
+        fs = self._client
+        bp = self._blueprint
+        path = bp.get_processing_meta_path(key)
+        if not await fs._exists(path):
+            return True
+
+        meta = await self._load_meta(path)
+        lease = self._get_lease(meta)
+        if not is_expired(lease):
+            return False
+        if self._get_lease(await self._load_meta(path)) != lease:
+            return False
+
+        await self._release_chunks(meta)
+        for p in (bp.get_processing_data_path(key), path):
+            if await fs._exists(p):
+                await fs._rm(p, recursive=True)
+        return True
+
+    async def _heartbeat(self, key, meta):
+        """リースを ttl / 3 ごとに延長する。リースを失った場合は終了する"""
+        path = self._blueprint.get_processing_meta_path(key)
+        ttl = self._blueprint.get_lease_ttl()
+        lease = meta["system"]["lease"]
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                stored = self._get_lease(await self._load_meta(path))
+                if not stored or stored.get("token") != lease["token"]:
+                    return
+                lease["expires"] = time.time() + ttl
+                await self._dump_meta(path, meta)
+            except (OSError, ValueError):
+                # 一時的な障害は次の周期で再試行する
+                continue
+
+    async def _verify_lease(self, key, meta):
+        lease = self._get_lease(meta)
+        if lease is None:
+            return
+        path = self._blueprint.get_processing_meta_path(key)
+        stored = self._get_lease(await self._load_meta(path))
+        if not stored or stored.get("token") != lease["token"]:
+            raise RFC7807Error.lease_expired("Lease was taken over by another writer.")
+        if is_expired(stored):
+            raise RFC7807Error.lease_expired("Lease expired.")
+
+    @asynccontextmanager
+    async def begin(self, key, usermeta: dict):
+        """書き込みロックをリースとして取得する（StoreBluePrint.begin と同じ形式）"""
+        path = self._blueprint.get_processing_meta_path(key)
+        ttl = self._blueprint.get_lease_ttl()
+        meta = MetaData(user=usermeta).model_dump()
+        for retry in (True, False):
+            meta["system"]["lease"] = {
+                "owner": get_owner_id(),
+                "token": uuid7(),
+                "expires": time.time() + ttl,
+            }
+            try:
+                await self._client._pipe_file(
+                    path, json.dumps(meta).encode(), mode="create"
+                )
+                break
+            except FileExistsError:
+                if not (retry and await self._reap_lease(key)):
+                    raise RFC7807Error.resource_locked()
+
+        token = meta["system"]["lease"]["token"]
+        heartbeat = asyncio.create_task(self._heartbeat(key, meta))
+        try:
+            yield meta
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            validated = await self._publish(key, meta)
+        except Exception as e:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            try:
+                stored = self._get_lease(await self._load_meta(path))
+                if stored and stored.get("token") != token:
+                    # ロックは既に他の書き込みのものなので、自身のチャンクのみ解放する
+                    await self._release_chunks(meta)
+                else:
+                    await self.rollback(key, token)
+            except Exception as e2:
+                raise RFC7807Error.internalservererror(
+                    extensions={"errors": [e, e2]}
+                ) from e2
+
+            raise
+
+        # 公開したコミットはリスナーの失敗でロールバックしない
+        await self._notify("on_commit", key, validated)
+
+    async def commit(self, key, meta):
+        validated = await self._publish(key, meta)
+        await self._notify("on_commit", key, validated)
+
+    async def _publish(self, key, meta) -> dict:
+        """StoreBluePrint._publish の非同期版"""
+        fs = self._client
+        bp = self._blueprint
+        await self._verify_lease(key, meta)
+        validated = MetaData.model_validate(meta).model_dump()
+        if get_layout(validated) != "chunked":
+            raise RFC7807Error.internalservererror(
+                f"Not supported layout: {get_layout(validated)}"
+            )
+
+        meta_path = bp.get_processing_meta_path(key)
+        completed_data_path = bp.get_completed_data_path(key)
+        completed_meta_path = bp.get_completed_meta_path(key)
+
+        await self._dump_meta(meta_path, validated)
+        prev_meta = await self._load_meta(completed_meta_path)
+        superseded = (
+            prev_meta is not None
+            and prev_meta["system"].get("id") != validated["system"]["id"]
+        )
+        versioning = bp.get_versioning()
+        if versioning and superseded:
+            await self._archive_version(key, prev_meta)
+
+        if await fs._exists(completed_data_path):
+            await fs._rm(completed_data_path, recursive=True)
+        await fs._mv_file(meta_path, completed_meta_path)
+
+        if versioning:
+            await self._record_version(key, validated)
+        # 上書きされた旧バージョンのチャンクを破棄する
+        elif superseded:
+            await self._release_chunks(prev_meta)
+
+        meta["system"].pop("lease", None)
+        return validated
+
+    async def _record_version(self, key, meta):
+        """StoreBluePrint._record_version の非同期版"""
+        fs = self._client
+        bp = self._blueprint
+        meta_path = bp.get_version_meta_path(key, meta["system"]["id"])
+        if await fs._exists(meta_path):
+            return
+        await fs._makedirs(bp.get_version_meta_path(key), exist_ok=True)
+        await self._dump_meta(meta_path, meta)
+
+    async def _archive_version(self, key, meta):
+        """StoreBluePrint._archive_version の非同期版"""
+        fs = self._client
+        bp = self._blueprint
+        await self._record_version(key, meta)
+        completed_data_path = bp.get_completed_data_path(key)
+        if get_layout(meta) == "file" and await fs._exists(completed_data_path):
+            await fs._makedirs(bp.get_version_data_path(key), exist_ok=True)
+            await fs._mv_file(
+                completed_data_path, bp.get_version_data_path(key, meta["system"]["id"])
+            )
+
+    async def _restore_current(self, key):
+        """StoreBluePrint._restore_current の非同期版"""
+        fs = self._client
+        bp = self._blueprint
+        meta = await self._load_meta(bp.get_completed_meta_path(key))
+        if meta is None or get_layout(meta) != "file":
+            return
+        archived = bp.get_version_data_path(key, meta["system"]["id"])
+        completed_data_path = bp.get_completed_data_path(key)
+        if not await fs._exists(completed_data_path) and await fs._exists(archived):
+            await fs._mv_file(archived, completed_data_path)
+
+    async def rollback(self, key, token: str = None):
+        """token は自身が保持するリースのトークン。他の有効なリースがある場合はロールバックしない"""
+        fs = self._client
+        bp = self._blueprint
+        processing_meta_path = bp.get_processing_meta_path(key)
+        completed_meta_path = bp.get_completed_meta_path(key)
+
+        processing_meta = await self._load_meta(processing_meta_path)
+        stored = self._get_lease(processing_meta)
+        if stored and not is_expired(stored) and stored.get("token") != token:
+            raise RFC7807Error.resource_locked()
+
+        if bp.get_versioning():
+            # コミット済みのバージョンは不変のため、書き込み途中の状態だけを破棄する
+            completed = await self._load_meta(completed_meta_path)
+            system = (processing_meta or {}).get("system", {})
+            if system and (
+                completed is None or completed["system"].get("id") != system.get("id")
+            ):
+                await self._release_chunks(processing_meta)
+            for p in (bp.get_processing_data_path(key), processing_meta_path):
+                if await fs._exists(p):
+                    await fs._rm(p, recursive=True)
+            await self._restore_current(key)
+            return
+
+        for meta_path in (processing_meta_path, completed_meta_path):
+            meta = await self._load_meta(meta_path)
+            if meta is not None:
+                await self._release_chunks(meta)
+
+        for p in (
+            bp.get_completed_data_path(key),
+            completed_meta_path,
+            bp.get_processing_data_path(key),
+            processing_meta_path,
+        ):
+            if await fs._exists(p):
+                await fs._rm(p, recursive=True)
+
+        await self._notify("on_rollback", key)
+
+    async def write_file(
+        self,
+        key: str,
+        file,
+        usermeta: dict = {},
+        block_size: int = None,
+        chunks_version: int = None,
+    ):
+        """ブロックをチャンクオブジェクトとして並行に書き込む。
+
+        ブロックごとのハッシュは executor で、書き込みはイベントループ上で並行に行う。
+        未完了のブロック数は max_concurrency で制限する。
+        chunks_version=2 の場合、累計ハッシュは全ブロックの完了後にブロックハッシュから求める。
+        """
+        fs = self._client
+        bp = self._blueprint
+        block_size = block_size or bp.get_block_size()
+        hashargs = usermeta.get("hash", "sha256:").split(":")
+        algorithm = hashargs[0] or "sha256"
+
+        version = bp.get_chunks_version(chunks_version)
+        hasher = BlockHasher(algorithm, version)
+        cumulative_hashes = []
+        size = 0
+
+        id = uuid7()
+        location = bp.get_chunked_data_path(id)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def put_block(index, buf):
+            try:
+                block_hash = await self._run(hasher.hash_block, buf)
+                await fs._pipe_file(path.join(location, chunk_name(index)), buf)
+                return block_hash
+            finally:
+                semaphore.release()
+
+        async with self.begin(key, usermeta) as meta:
+            meta["system"]["id"] = id
+            meta["system"]["chunks"]["layout"] = "chunked"
+            meta["system"]["chunks"]["location"] = location
+            await self._dump_meta(bp.get_processing_meta_path(key), meta)
+            await fs._makedirs(location, exist_ok=True)
+
+            tasks = []
+            try:
+                async for buf in iter_blocks(file, block_size):
+                    await semaphore.acquire()
+                    for task in tasks:
+                        if task.done() and task.exception() is not None:
+                            raise task.exception()
+
+                    tasks.append(asyncio.create_task(put_block(len(tasks), buf)))
+                    size += len(buf)
+                    if hasher.needs_bytes:
+                        cumulative_hashes.append(await self._run(hasher.update, buf))
+
+                block_hashes = list(await asyncio.gather(*tasks))
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            if not hasher.needs_bytes:
+                cumulative_hashes = chain_hashes(block_hashes)
+            bp._finalize_meta(
+                meta,
+                algorithm,
+                size,
+                block_size,
+                block_hashes,
+                cumulative_hashes,
+                version,
+            )
+
+        return meta
+
+    async def read_meta(self, key: str):
+        bp = self._blueprint
+        if await self._client._exists(bp.get_processing_meta_path(key)):
+            raise RFC7807Error.resource_locked()
+
+        meta = await self._load_meta(bp.get_completed_meta_path(key))
+        if meta is None:
+            raise RFC7807Error.not_found()
+        return meta
+
+    async def open(self, key: str, verify: bool = False):
+        meta = await self.read_meta(key)
+        return AsyncBlockReader(
+            self._client,
+            meta,
+            self._blueprint.get_completed_data_path(key),
+            verify=verify,
+            executor=self._executor,
+        )
+
+    async def ls(self, key: str = ""):
+        completed_meta_path = self._blueprint.get_completed_meta_path(key)
+        names = await self._client._ls(completed_meta_path, detail=False)
+        return [k.replace("completed/meta/", "") for k in names]
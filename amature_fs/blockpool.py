@@ -0,0 +1,146 @@
+from os import path
+
+import fsspec
+
+from .hashing import split_multihash
+from .utils import uuid7
+
+
+def get_block_path(root: str, block_hash: str) -> str:
+    """ブロックハッシュ "algo:digest" からプール内のパスを返す"""
+    algorithm, digest = split_multihash(block_hash)
+    return path.join(root, algorithm, digest[:2], digest)
+
+
+def get_stored_block_hashes(meta: dict) -> list:
+    """実際にブロックとして格納されているハッシュを返す（0 size の場合は空）"""
+    chunks = meta["system"]["chunks"]
+    size = meta["system"].get("size") or 0
+    count = -(-size // int(chunks["block_size"]))
+    return chunks.get("block_hashes", [])[:count]
+
+
+class BlockPool:
+    """ブロックハッシュをキーとするコンテンツアドレス型のブロックプール。
+
+    参照は参照元（マニフェストの system.id）ごとのマーカーオブジェクトで管理する。
+    参照の追加・削除は冪等。参照を削除してもブロックはすぐには削除せず、
+    参照のなくなったブロックは GC が猶予期間の後に remove で削除する。
+    """
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, data_dir: str, meta_dir: str):
+        self._fs = fs
+        self._data_dir = data_dir
+        self._meta_dir = meta_dir
+
+    @property
+    def data_dir(self):
+        return self._data_dir
+
+    @property
+    def meta_dir(self):
+        return self._meta_dir
+
+    def get_block_path(self, block_hash: str) -> str:
+        return get_block_path(self._data_dir, block_hash)
+
+    def get_refs_path(self, block_hash: str) -> str:
+        return get_block_path(self._meta_dir, block_hash)
+
+    def exists(self, block_hash: str) -> bool:
+        return self._fs.exists(self.get_block_path(block_hash))
+
+    def put(self, block_hash: str, data, ref_id: str = None) -> bool:
+        """ブロックを格納する。既に存在する場合は書き込まずに False を返す。
+
+        ref_id を指定した場合は存在を確認する前に参照を追加し、再利用を決めたブロックが
+        コミットまでの間に decref や GC で削除されないようにする。
+        ブロックは一時的な名前に書き込んでから移動するため、途中で失敗しても
+        内容アドレスに不完全なブロックは残らない。
+        """
+        if ref_id is not None:
+            self.incref(ref_id, [block_hash])
+        block_path = self.get_block_path(block_hash)
+        if self._fs.exists(block_path):
+            return False
+
+        self._fs.makedirs(path.dirname(block_path), exist_ok=True)
+        # 残った一時ファイルは参照のないブロックとして GC が回収する
+        tmp_path = f"{block_path}.{uuid7()}.tmp"
+        try:
+            with self._fs.open(tmp_path, "wb") as f:
+                f.write(data)
+            self._fs.mv(tmp_path, block_path)
+        except BaseException:
+            if self._fs.exists(tmp_path):
+                self._fs.rm(tmp_path)
+            raise
+        return True
+
+    def get(self, block_hash: str) -> bytes:
+        return self._fs.cat_file(self.get_block_path(block_hash))
+
+    def refs(self, block_hash: str) -> list[str]:
+        refs_path = self.get_refs_path(block_hash)
+        if not self._fs.exists(refs_path):
+            return []
+        return sorted(path.basename(p) for p in self._fs.ls(refs_path, detail=False))
+
+    def incref(self, ref_id: str, block_hashes: list):
+        for block_hash in set(block_hashes):
+            refs_path = self.get_refs_path(block_hash)
+            self._fs.makedirs(refs_path, exist_ok=True)
+            self._fs.touch(path.join(refs_path, ref_id))
+
+    def decref(self, ref_id: str, block_hashes: list):
+        """参照を削除する。
+
+        参照がなくなったかの確認と削除の間に put が参照を追加すると、再利用を決めたブロックを
+        削除してしまうため、ブロックの削除は GC（remove）に任せる。
+        """
+        for block_hash in set(block_hashes):
+            ref_path = path.join(self.get_refs_path(block_hash), ref_id)
+            if self._fs.exists(ref_path):
+                self._fs.rm(ref_path)
+
+    def remove(self, block_hash: str) -> bool:
+        """参照のないブロックを削除し、削除した場合は True を返す。
+
+        ブロックを墓標（tombstone）の名前に移動してから参照を確認し直し、
+        その間に参照が追加されていれば元に戻す。put は参照を追加してから存在を確認するため、
+        移動の前に存在を確認した書き込みの参照は確認し直す時点で必ず見える。
+        移動の後に確認した書き込みはブロックを書き込み直す。
+        """
+        block_path = self.get_block_path(block_hash)
+        if self.refs(block_hash) or not self._fs.exists(block_path):
+            return False
+        tombstone = f"{block_path}.{uuid7()}.deleted"
+        try:
+            self._fs.mv(block_path, tombstone)
+        except FileNotFoundError:
+            return False
+        if self.refs(block_hash):
+            if self._fs.exists(block_path):
+                # 書き込み直された場合は同じ内容なので墓標を削除する
+                self._fs.rm(tombstone)
+            else:
+                self._fs.mv(tombstone, block_path)
+            return False
+        self._fs.rm(tombstone)
+        return True
+
+    # fsspec の AsyncFileSystem（asynchronous=True）向け
+
+    async def refs_async(self, block_hash: str) -> list[str]:
+        refs_path = self.get_refs_path(block_hash)
+        if not await self._fs._exists(refs_path):
+            return []
+        names = await self._fs._ls(refs_path, detail=False)
+        return sorted(path.basename(p) for p in names)
+
+    async def decref_async(self, ref_id: str, block_hashes: list):
+        """decref の非同期版。ブロックの削除は GC に任せる"""
+        for block_hash in set(block_hashes):
+            ref_path = path.join(self.get_refs_path(block_hash), ref_id)
+            if await self._fs._exists(ref_path):
+                await self._fs._rm(ref_path)
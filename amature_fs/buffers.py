@@ -0,0 +1,123 @@
+"""
+ブロック読み込み用の再利用可能なバッファプール。
+
+書き込み時に file.read(block_size) でブロックごとに bytes を生成する代わりに、
+プールから借りた bytearray に readinto で読み込み、memoryview のスライスを
+そのままハッシュ計算と書き込みに渡す。プール全体で確保するメモリは max_bytes を
+上限とし、同時に実行されるアップロードの数に関わらずピークメモリを抑える。
+"""
+
+import io
+import threading
+from contextlib import contextmanager
+
+
+class BufferPool:
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._allocated = 0  # 確保済み（貸出中 + 未使用）のバイト数
+        self._in_use = 0
+        self._free = []
+        self._cond = threading.Condition()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def allocated_bytes(self):
+        return self._allocated
+
+    @property
+    def in_use_bytes(self):
+        return self._in_use
+
+    def acquire(self, size: int, timeout: float = None) -> bytearray:
+        """size バイトのバッファを借りる。上限に達している場合は返却されるまで待つ。
+
+        size が max_bytes を超える場合でも、他に貸出中のバッファがなければ貸し出す。
+        """
+        with self._cond:
+            while True:
+                for i, buf in enumerate(self._free):
+                    if len(buf) == size:
+                        del self._free[i]
+                        self._in_use += size
+                        return buf
+
+                # サイズの合わない未使用のバッファを解放して空きを作る
+                while self._free and self._max_bytes < self._allocated + size:
+                    self._allocated -= len(self._free.pop())
+
+                if self._allocated + size <= self._max_bytes or not self._in_use:
+                    self._allocated += size
+                    self._in_use += size
+                    return bytearray(size)
+
+                if not self._cond.wait(timeout):
+                    raise TimeoutError("Buffer pool exhausted.")
+
+    def release(self, buf: bytearray):
+        with self._cond:
+            self._in_use -= len(buf)
+            if self._allocated <= self._max_bytes:
+                self._free.append(buf)
+            else:
+                self._allocated -= len(buf)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, size: int, timeout: float = None):
+        buf = self.acquire(size, timeout)
+        try:
+            yield buf
+        finally:
+            self.release(buf)
+
+    def clear(self):
+        """未使用のバッファを解放する"""
+        with self._cond:
+            while self._free:
+                self._allocated -= len(self._free.pop())
+
+
+def read_block(file, buf: bytearray) -> memoryview:
+    """file から buf を満たすまで読み込み、読み込んだ範囲の memoryview を返す。
+
+    readinto を持つファイルはコピーせずに直接読み込む。
+    readinto も read も要求より少ないバイト数を返すことがあるため、
+    buf が満ちるか EOF に達するまで繰り返す。
+    """
+    view = memoryview(buf)
+    readinto = getattr(file, "readinto", None)
+    n = 0
+    while n < len(buf):
+        if readinto is None:
+            data = file.read(len(buf) - n)
+            read = len(data) if data else 0
+            view[n : n + read] = data or b""
+        else:
+            read = readinto(view[n:])
+        if not read:
+            break
+        n += read
+    return view[:n]
+
+
+class PrefixedReader(io.RawIOBase):
+    """先読みした prefix の後に file の残りを読み込むリーダー"""
+
+    def __init__(self, prefix: bytes, file):
+        self._prefix = memoryview(prefix)
+        self._file = file
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        return len(read_block(self._file, memoryview(b).cast("B")))
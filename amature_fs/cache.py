@@ -0,0 +1,167 @@
+"""
+read_meta / open のためのプロセス内メタデータキャッシュ。
+
+件数・バイト数で上限を設けた LRU で、エントリは TTL で失効する。
+自プロセスの commit / rollback で該当キーを無効化し、さらにストアの世代マーカーを
+更新する。他プロセスの更新は、世代マーカーを check_interval 秒ごとに確認して検知する。
+
+読み込みの途中で無効化された古いメタデータを書き戻さないよう、読み込みの前に epoch を取得し、
+put はその間に無効化がなかった場合だけ保存する。
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import fsspec
+
+from .utils import uuid7
+
+GENERATION_PATH = "generation.json"
+
+
+class MetaCache:
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 60.0,
+        generation_path: str | None = GENERATION_PATH,
+        check_interval: float = 1.0,
+    ):
+        """
+        :param generation_path: 世代マーカーのパス。None の場合はプロセス間の無効化を行わない
+        :param check_interval: 世代マーカーを確認する間隔（秒）
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._generation_path = generation_path
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        # key -> (meta, nbytes, expires_at)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._checked_at = None
+        # 無効化のたびに増やす。put に渡された epoch と異なる場合は保存しない
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _read_generation(self, fs: fsspec.AbstractFileSystem):
+        try:
+            return fs.cat_file(self._generation_path)
+        except FileNotFoundError:
+            return None
+
+    def check_generation(self, fs: fsspec.AbstractFileSystem):
+        """世代マーカーが変わっていればキャッシュを破棄する"""
+        if self._generation_path is None:
+            return
+
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self._check_interval:
+            return
+
+        generation = self._read_generation(fs)
+        with self._lock:
+            if generation != self._generation:
+                self._clear()
+                self._generation = generation
+            self._checked_at = now
+
+    def bump_generation(self, fs: fsspec.AbstractFileSystem):
+        if self._generation_path is None:
+            return
+
+        generation = json.dumps(uuid7()).encode()
+        fs.pipe_file(self._generation_path, generation)
+        with self._lock:
+            self._generation = generation
+
+    async def bump_generation_async(self, fs: fsspec.AbstractFileSystem):
+        if self._generation_path is None:
+            return
+
+        generation = json.dumps(uuid7()).encode()
+        await fs._pipe_file(self._generation_path, generation)
+        with self._lock:
+            self._generation = generation
+
+    def get(self, fs: fsspec.AbstractFileSystem, key: str) -> dict | None:
+        self.check_generation(fs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def epoch(self) -> int:
+        """読み込みの前に取得して put に渡す"""
+        with self._lock:
+            return self._epoch
+
+    def put(self, key: str, meta: dict, epoch: int = None):
+        """meta を保存する。epoch を取得した後に無効化があった場合は保存しない"""
+        nbytes = len(json.dumps(meta))
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._pop(key)
+            if self._max_bytes < nbytes:
+                return
+
+            self._entries[key] = (meta, nbytes, time.monotonic() + self._ttl)
+            self._bytes += nbytes
+            while self._max_entries < len(self._entries) or self._max_bytes < self._bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._pop(key)
+            self._epoch += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def on_commit(self, fs, key, meta):
+        self.invalidate(key)
+        self.bump_generation(fs)
+
+    def on_rollback(self, fs, key):
+        self.invalidate(key)
+        self.bump_generation(fs)
+
+    async def on_commit_async(self, fs, key, meta):
+        self.invalidate(key)
+        await self.bump_generation_async(fs)
+
+    async def on_rollback_async(self, fs, key):
+        self.invalidate(key)
+        await self.bump_generation_async(fs)
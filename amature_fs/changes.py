@@ -0,0 +1,178 @@
+"""
+commit / rollback の変更ログ（チェンジフィード）。
+
+    python -m amature_fs.changes read dir::local://.cache/catalog --since 0190...
+    python -m amature_fs.changes follow dir::local://.cache/catalog
+
+ChangeFeed を StoreBluePrint のリスナーとして登録すると、commit / rollback ごとに
+イベント {"id", "key", "op", "object_id", "size", "hash"} を changes/<セグメント>/<id> に書き込む。
+id はイベントの uuid7 で、セグメントは id の時刻を segment_seconds 秒ごとに区切ったもの。
+オブジェクトストアは追記できないため、イベントは作成のみで書き換えない個別のオブジェクトとし、
+複数のプロセスが同時に書き込んでも競合しない。
+
+read_changes(since) はセグメントの一覧を二分探索して since を含むセグメント以降だけを読み込む。
+follow は最後に読んだ id から新しいイベントを待ち続ける（tail -f のように使う）。
+"""
+
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+
+import fsspec
+
+from .utils import uuid7, uuid7_time
+
+CHANGES_DIR = "changes"
+
+
+class ChangeFeed:
+    def __init__(self, root: str = CHANGES_DIR, segment_seconds: int = 60):
+        """
+        :param root: イベントを書き込むディレクトリ
+        :param segment_seconds: 1 つのセグメントにまとめる秒数
+        """
+        self._root = root
+        self._segment_seconds = int(segment_seconds)
+
+    def get_segment(self, timestamp: float) -> str:
+        """timestamp を含むセグメントの名前（開始時刻のエポック秒。名前順 = 時刻順）"""
+        start = int(timestamp // self._segment_seconds) * self._segment_seconds
+        return str(start).zfill(12)
+
+    def list_segments(self, fs: fsspec.AbstractFileSystem) -> list[str]:
+        names = fs.ls(self._root, detail=False) if fs.exists(self._root) else []
+        return sorted(os.path.basename(p) for p in names)
+
+    def append(self, fs: fsspec.AbstractFileSystem, key: str, op: str, meta: dict = None):
+        system = (meta or {}).get("system", {})
+        id = uuid7()
+        event = {
+            "id": id,
+            "key": key,
+            "op": op,
+            "object_id": system.get("id"),
+            "size": system.get("size"),
+            "hash": system.get("hash"),
+        }
+        segment_dir = os.path.join(self._root, self.get_segment(uuid7_time(id)))
+        fs.makedirs(segment_dir, exist_ok=True)
+        fs.pipe_file(os.path.join(segment_dir, id), json.dumps(event).encode())
+        return event
+
+    def read_changes(
+        self, fs: fsspec.AbstractFileSystem, since=None, limit: int = None
+    ) -> list[dict]:
+        """since より後のイベントを古い順に返す。
+
+        since はイベントの id（その id より後）またはエポック秒（その時刻以降）。
+        None の場合は全てのイベント。
+        """
+        segments = self.list_segments(fs)
+        if isinstance(since, str):
+            after = since
+            since = uuid7_time(since)
+        else:
+            after = None
+        if since is not None:
+            segments = segments[bisect.bisect_left(segments, self.get_segment(since)) :]
+
+        events = []
+        for segment in segments:
+            segment_dir = os.path.join(self._root, segment)
+            ids = sorted(os.path.basename(p) for p in fs.ls(segment_dir, detail=False))
+            if after is not None:
+                ids = ids[bisect.bisect_right(ids, after) :]
+            elif since is not None:
+                ids = [id for id in ids if since <= uuid7_time(id)]
+            if limit is not None:
+                ids = ids[: limit - len(events)]
+            if not ids:
+                continue
+
+            paths = [os.path.join(segment_dir, id) for id in ids]
+            contents = fs.cat(paths, on_error="omit")
+            for p in paths:
+                if p in contents:
+                    events.append(json.loads(contents[p]))
+            if limit is not None and limit <= len(events):
+                break
+        return events
+
+    def follow(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        since=None,
+        poll_interval: float = 1.0,
+        settle: float = 1.0,
+        stop: threading.Event = None,
+    ):
+        """since（None の場合は現在）より後のイベントを届いた順に返し続けるジェネレータ。
+
+        書き込みの遅れで古い id のイベントが後から届くことがあるため、
+        settle 秒より新しいイベントは次のポーリングまで返さない。
+        stop がセットされると終了する。
+        """
+        cursor = time.time() if since is None else since
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            horizon = time.time() - settle
+            for event in self.read_changes(fs, since=cursor):
+                if horizon < uuid7_time(event["id"]):
+                    break
+                yield event
+                cursor = event["id"]
+                if stop.is_set():
+                    return
+            stop.wait(poll_interval)
+
+    def trim(self, fs: fsspec.AbstractFileSystem, before: float) -> int:
+        """before（エポック秒）より前に終わったセグメントを削除し、削除した数を返す"""
+        expired = [
+            os.path.join(self._root, segment)
+            for segment in self.list_segments(fs)
+            if int(segment) + self._segment_seconds <= before
+        ]
+        if expired:
+            fs.rm(expired, recursive=True)
+        return len(expired)
+
+    def on_commit(self, fs, key, meta):
+        self.append(fs, key, "commit", meta)
+
+    def on_rollback(self, fs, key):
+        self.append(fs, key, "rollback")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.changes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    read = subparsers.add_parser("read", help="変更ログを読み込む")
+    follow = subparsers.add_parser("follow", help="新しい変更を待ち続ける")
+    for sub in (read, follow):
+        sub.add_argument("url", help="カタログの fsspec URL（例: dir::local://.cache/catalog）")
+        sub.add_argument("--since", default=None, help="イベントの id またはエポック秒")
+    read.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fs, _ = fsspec.url_to_fs(args.url)
+    since = args.since
+    if since is not None and uuid7_time(since) is None:
+        since = float(since)
+    feed = ChangeFeed()
+    if args.command == "read":
+        events = feed.read_changes(fs, since=since, limit=args.limit)
+    else:
+        events = feed.follow(fs, since=since)
+    try:
+        for event in events:
+            print(json.dumps(event), flush=True)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
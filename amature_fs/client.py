@@ -0,0 +1,117 @@
+"""
+amature_fs.server の HTTP クライアント（server 依存グループが必要）。
+
+    with httpx.Client(base_url="http://localhost:8000") as client:
+        with open("large.bin", "rb") as f:
+            meta = upload_multipart(client, "large.bin", f, max_workers=8)
+
+upload_multipart はファイルをブロック単位のパートに分割し、複数の接続で並列に送信する。
+失敗したパートは retries 回まで再送し、それでも失敗した場合はアップロードを中止する。
+"""
+
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from .buffers import read_block
+from .exceptions import RFC7807Error
+from .hashing import BlockHasher
+
+
+def raise_for_problem(res: httpx.Response):
+    """エラーの応答（application/problem+json）を RFC7807Error として送出する"""
+    if not res.is_error:
+        return
+    try:
+        problem = res.json()
+    except ValueError:
+        problem = {}
+    raise RFC7807Error(
+        title=problem.get("title", res.reason_phrase),
+        status=problem.get("status", res.status_code),
+        type=problem.get("type", "about:blank"),
+        detail=problem.get("detail"),
+        instance=problem.get("instance"),
+        extensions=problem.get("extensions"),
+    )
+
+
+def upload_multipart(
+    client: httpx.Client,
+    key: str,
+    file,
+    usermeta: dict = {},
+    max_workers: int = 4,
+    retries: int = 3,
+):
+    """file をマルチパートアップロードで書き込み、完了したメタデータを返す。
+
+    読み込み済みで未送信のパートは max_workers * 2 個までに制限し、メモリ使用量を抑える。
+    """
+    url = f"/uploads/{key}"
+    headers = {"x-meta-" + name: str(value) for name, value in usermeta.items()}
+    headers.pop("x-meta-hash", None)
+    headers.pop("x-meta-size", None)
+    if "hash" in usermeta:
+        headers["x-hash"] = usermeta["hash"]
+    if "size" in usermeta:
+        headers["x-size"] = str(usermeta["size"])
+
+    res = client.post(url, headers=headers)
+    raise_for_problem(res)
+    upload = res.json()
+    params = {"upload_id": upload["upload_id"]}
+    block_size = upload["block_size"]
+    hasher = BlockHasher(upload["algorithm"])
+
+    def put_part(index, buf):
+        block_hash = hasher.hash_block(buf)
+        for attempt in range(retries + 1):
+            try:
+                res = client.put(
+                    url,
+                    params={**params, "part": index},
+                    content=buf,
+                    headers={"x-hash": block_hash},
+                )
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                continue
+            # サーバー側の一時的な障害は再送する
+            if res.status_code < 500 or attempt == retries:
+                break
+        raise_for_problem(res)
+        return block_hash
+
+    inflight = threading.BoundedSemaphore(max_workers * 2)
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                while True:
+                    inflight.acquire()
+                    if any(f.done() and f.exception() for f in futures):
+                        break
+                    buf = bytes(read_block(file, bytearray(block_size)))
+                    if not buf:
+                        inflight.release()
+                        break
+                    future = executor.submit(put_part, len(futures), buf)
+                    future.add_done_callback(lambda _: inflight.release())
+                    futures.append(future)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        parts = [future.result() for future in futures]
+
+        res = client.post(url, params=params, json={"parts": parts})
+        raise_for_problem(res)
+        return res.json()
+    except BaseException:
+        with contextlib.suppress(httpx.HTTPError):
+            client.delete(url, params=params)
+        raise
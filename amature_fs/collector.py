@@ -0,0 +1,391 @@
+"""
+ガベージコレクタと修復。
+
+クラッシュなどで残った書き込み途中の状態、コミットの途中で停止したキー、
+どのメタデータからも参照されていないチャンクを回収する。
+
+    python -m amature_fs.collector run dir::local://.cache/catalog
+    python -m amature_fs.collector run dir::local://.cache/catalog --loop 300 --rate 50
+
+1 回の走査（サイクル）は PHASES の順に進み、各フェーズの対象を名前順に処理する。
+進捗（カーソル）は state_path に保存するため、中断しても続きから再開できる。
+フェーズの対象はサイクルごとに 1 回だけ一覧し、各ステップはカーソルの位置から続きを処理する
+（サイクル中に増えた対象は次のサイクルで処理する）。
+削除などの I/O と、参照の確認のためのメタデータの走査は rate（1 秒あたりの操作数）で制限し、
+通常の読み書きを妨げないようにする。
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import threading
+import time
+from os import path
+
+import fsspec
+
+from .lease import is_expired
+from .store import StoreBluePrint
+from .utils import RateLimiter, get_mtime, uuid7, uuid7_time
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = "gc.json"
+
+# processing: 書き込み途中のキー（失効したリース、コミット途中、放置された再開可能アップロード）
+# orphans: メタデータのない processing のデータ
+# versions: 保持期間（versions_keep, versions_max_age）を過ぎたバージョン
+# chunks: 参照されていない chunked レイアウトのチャンクディレクトリ
+# refs: 参照元が存在しないブロックプールの参照マーカー
+# blocks: 参照のないブロックプールのブロック（decref は参照のみを削除し、ブロックはここで削除する）
+# packs: どのメタデータからも参照されていないパックセグメント
+PHASES = ("processing", "orphans", "versions", "chunks", "refs", "blocks", "packs")
+
+
+class GarbageCollector:
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        grace: float = 3600.0,
+        session_max_age: float = 7 * 24 * 3600.0,
+        rate: float = None,
+        state_path: str = STATE_PATH,
+    ):
+        """
+        :param grace: 作成からこの秒数が経過していない対象は回収しない（書き込み中のものを保護する）
+        :param session_max_age: 再開可能アップロードを放置されたとみなすまでの秒数
+        :param rate: 1 秒あたりの操作数の上限。None の場合は制限しない
+        """
+        self._fs = fs
+        self._blueprint = blueprint
+        self._grace = grace
+        self._session_max_age = session_max_age
+        self._limiter = RateLimiter(rate)
+        self._state_path = state_path
+        self._referenced = None
+        self._segments = None
+        # ((サイクル, フェーズ), 対象の一覧)
+        self._listing = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # カーソル
+
+    def load_state(self) -> dict:
+        try:
+            state = json.loads(self._fs.cat_file(self._state_path))
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = None
+        return state or self._new_state()
+
+    def save_state(self, state: dict):
+        self._fs.pipe_file(self._state_path, json.dumps(state).encode())
+
+    def _new_state(self):
+        return {
+            "cycle": uuid7(),
+            "phase": PHASES[0],
+            "after": None,
+            "stats": {},
+            "completed": None,
+        }
+
+    # 実行
+
+    def step(self, max_items: int = 100) -> dict:
+        """カーソルから最大 max_items 件を処理してカーソルを保存し、状態を返す。
+
+        サイクルが完了した場合、state["completed"] に統計を記録して次のサイクルを始める。
+        """
+        state = self.load_state()
+        processed = 0
+        while processed < max_items:
+            phase = state["phase"]
+            items = self._get_listing(state)
+            start = 0
+            if state["after"] is not None:
+                start = bisect.bisect_right(items, state["after"])
+            budget = max_items - processed
+            for item in items[start : start + budget]:
+                self._limiter.acquire()
+                result = getattr(self, f"_collect_{phase}")(item)
+                if result:
+                    state["stats"][result] = state["stats"].get(result, 0) + 1
+                state["after"] = item
+                processed += 1
+
+            if budget < len(items) - start:
+                break
+
+            # フェーズの対象を全て処理した
+            self._listing = None
+            if phase == "versions":
+                # 回収したバージョンの参照は、フェーズの終了時にまとめて反映する
+                self._referenced = None
+                self._segments = None
+            index = PHASES.index(phase) + 1
+            if index == len(PHASES):
+                completed = {"cycle": state["cycle"], "stats": state["stats"]}
+                state = self._new_state()
+                state["completed"] = completed
+                self._referenced = None
+                self._segments = None
+                break
+            state["phase"] = PHASES[index]
+            state["after"] = None
+
+        self.save_state(state)
+        return state
+
+    def run_cycle(self, batch_size: int = 100) -> dict:
+        """現在のサイクルを最後まで実行し、サイクルの統計を返す"""
+        # 状態がない場合に step が別のサイクルを始めないよう、先に保存する
+        state = self.load_state()
+        self.save_state(state)
+        cycle = state["cycle"]
+        while True:
+            state = self.step(batch_size)
+            if state["cycle"] != cycle or self._stop.is_set():
+                return (state["completed"] or {}).get("stats", {})
+
+    def start(self, interval: float = 300.0, batch_size: int = 100):
+        """バックグラウンドのワーカーでサイクルを interval 秒ごとに実行する"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.run_cycle(batch_size)
+                except Exception:
+                    # 一時的な障害は次のサイクルで再試行する
+                    logger.exception("Garbage collection cycle failed.")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # 対象の一覧
+
+    def _relative(self, root: str, p: str) -> str:
+        return p.split(root, 1)[-1].lstrip("/")
+
+    def _get_listing(self, state: dict) -> list[str]:
+        """現在のサイクル・フェーズの対象の一覧（名前順）。フェーズごとに 1 回だけ一覧する"""
+        listing_key = (state["cycle"], state["phase"])
+        if self._listing is None or self._listing[0] != listing_key:
+            self._listing = (listing_key, self._list(state["phase"]))
+        return self._listing[1]
+
+    def _list(self, phase: str) -> list[str]:
+        bp = self._blueprint
+        fs = self._fs
+        if phase == "processing":
+            root = bp.get_processing_meta_path("")
+            return sorted(self._relative(root, p) for p in fs.find(root))
+        elif phase == "orphans":
+            root = bp.get_processing_data_path("")
+            names = fs.ls(root, detail=False) if fs.exists(root) else []
+            return sorted(self._relative(root, p) for p in names)
+        elif phase == "versions":
+            root = bp.get_version_meta_path("")
+            return sorted({path.dirname(self._relative(root, p)) for p in fs.find(root)})
+        elif phase == "chunks":
+            root = bp.get_chunked_data_path()
+            names = fs.ls(root, detail=False) if fs.exists(root) else []
+            return sorted(
+                p
+                for p in (self._relative(root, p) for p in names)
+                if p not in ("blocks", "packs")
+            )
+        elif phase == "refs":
+            root = bp.get_block_pool(fs).meta_dir
+            return sorted(self._relative(root, p) for p in fs.find(root))
+        elif phase == "blocks":
+            root = bp.get_block_pool(fs).data_dir
+            return sorted(self._relative(root, p) for p in fs.find(root))
+        else:
+            root = bp.get_pack_dir()
+            names = fs.ls(root, detail=False) if fs.exists(root) else []
+            return sorted(self._relative(root, p) for p in names)
+
+    def referenced_ids(self) -> set[str]:
+        """完了済み・書き込み中のメタデータとバージョンが参照する system.id（チャンクの所有者）"""
+        if self._referenced is None:
+            self._load_references()
+        return self._referenced
+
+    def referenced_segments(self) -> set[str]:
+        """完了済みのメタデータとバージョンが参照するパックセグメント名"""
+        if self._segments is None:
+            self._load_references()
+        return self._segments
+
+    def _load_references(self, batch_size: int = 100):
+        """メタデータを 1 回だけ走査して referenced_ids と referenced_segments を求める。
+
+        全メタデータの読み込みは回収の I/O と同じく rate で制限する。
+        """
+        bp = self._blueprint
+        fs = self._fs
+        ids = set()
+        segments = set()
+
+        def add_segment(meta):
+            chunks = meta["system"].get("chunks", {})
+            if chunks.get("layout") == "pack":
+                segments.add(path.basename(chunks["location"]))
+
+        for _, meta in bp.scan(fs, batch_size):
+            self._limiter.acquire()
+            ids.add(meta["system"].get("id"))
+            add_segment(meta)
+        root = bp.get_processing_meta_path("")
+        for p in fs.find(root):
+            self._limiter.acquire()
+            meta = bp._load_meta(fs, p) or {}
+            ids.add(meta.get("system", {}).get("id"))
+        # バージョンのメタデータは system.id を名前とする
+        version_paths = fs.find(bp.get_version_meta_path(""))
+        ids.update(path.basename(p) for p in version_paths)
+        for i in range(0, len(version_paths), batch_size):
+            batch = version_paths[i : i + batch_size]
+            self._limiter.acquire(len(batch))
+            for data in fs.cat(batch, on_error="omit").values():
+                meta = bp._parse_meta(data)
+                if meta is not None:
+                    add_segment(meta)
+        ids.discard(None)
+        self._referenced = ids
+        self._segments = segments
+
+    def _is_old(self, created: float | None, max_age: float = None) -> bool:
+        max_age = self._grace if max_age is None else max_age
+        return created is not None and created + max_age < time.time()
+
+    def _mtime(self, p: str) -> float | None:
+        try:
+            return get_mtime(self._fs.info(p))
+        except FileNotFoundError:
+            return None
+
+    # 回収
+
+    def _collect_processing(self, key: str) -> str | None:
+        bp = self._blueprint
+        fs = self._fs
+        meta_path = bp.get_processing_meta_path(key)
+        meta = bp._load_meta(fs, meta_path)
+        if meta is None:
+            # 書き込みが途中で失敗した壊れたメタデータ
+            if self._is_old(self._mtime(meta_path)):
+                bp._discard_processing(fs, key, None)
+                return "discarded"
+            return None
+
+        system = meta.get("system", {})
+        if system.get("lease"):
+            if is_expired(system["lease"]) and bp.reap_lease(fs, key):
+                return "reaped"
+        elif system.get("upload"):
+            created = uuid7_time(system.get("id") or "")
+            if self._is_old(created, self._session_max_age):
+                bp._discard_processing(fs, key, meta)
+                return "expired_sessions"
+        elif system.get("hash"):
+            # リースを外して確定済みのメタデータが残っている = コミットの途中で停止した
+            if self._is_old(self._mtime(meta_path)):
+                return bp.recover_commit(fs, key, meta)
+        elif self._is_old(self._mtime(meta_path)):
+            bp._discard_processing(fs, key, meta)
+            return "discarded"
+        return None
+
+    def _collect_orphans(self, key: str) -> str | None:
+        bp = self._blueprint
+        fs = self._fs
+        data_path = bp.get_processing_data_path(key)
+        if fs.exists(bp.get_processing_meta_path(key)):
+            return None
+        if not self._is_old(self._mtime(data_path)):
+            return None
+        # 削除の直前に書き込みが始まっていないことを確認する
+        if fs.exists(bp.get_processing_meta_path(key)):
+            return None
+        fs.rm(data_path, recursive=True)
+        return "orphans"
+
+    def _collect_versions(self, key: str) -> str | None:
+        if self._blueprint.expire_versions(self._fs, key):
+            return "versions"
+        return None
+
+    def _collect_chunks(self, id: str) -> str | None:
+        if id in self.referenced_ids() or not self._is_old(uuid7_time(id)):
+            return None
+        self._fs.rm(self._blueprint.get_chunked_data_path(id), recursive=True)
+        return "chunks"
+
+    def _collect_refs(self, marker: str) -> str | None:
+        ref_id = path.basename(marker)
+        if ref_id in self.referenced_ids() or not self._is_old(uuid7_time(ref_id)):
+            return None
+        pool = self._blueprint.get_block_pool(self._fs)
+        self._fs.rm(path.join(pool.meta_dir, marker))
+        return "refs"
+
+    def _collect_blocks(self, block: str) -> str | None:
+        algorithm, _, digest = block.split("/", 2)
+        block_hash = algorithm + ":" + digest
+        pool = self._blueprint.get_block_pool(self._fs)
+        if pool.refs(block_hash):
+            return None
+        # ブロックは参照（コミット時）より先に書き込まれるため、新しいものは回収しない
+        if not self._is_old(self._mtime(pool.get_block_path(block_hash))):
+            return None
+        # 削除の間に書き込みが参照を追加した場合、remove はブロックを残す
+        if not pool.remove(block_hash):
+            return None
+        return "blocks"
+
+    def _collect_packs(self, segment: str) -> str | None:
+        # 書き込み中のセグメントはメタデータより先に作成されるため、新しいものは回収しない
+        if segment in self.referenced_segments() or not self._is_old(uuid7_time(segment)):
+            return None
+        self._fs.rm(path.join(self._blueprint.get_pack_dir(), segment))
+        return "packs"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.collector")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="ガベージコレクタと修復を実行する")
+    run.add_argument("url", help="カタログの fsspec URL（例: dir::local://.cache/catalog）")
+    run.add_argument("--grace", type=float, default=3600.0, help="回収を猶予する秒数")
+    run.add_argument("--rate", type=float, default=None, help="1 秒あたりの操作数の上限")
+    run.add_argument("--batch-size", type=int, default=100)
+    run.add_argument("--loop", type=float, default=None, help="指定した秒数ごとに繰り返す")
+    args = parser.parse_args(argv)
+
+    fs, _ = fsspec.url_to_fs(args.url)
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    collector = GarbageCollector(fs, blueprint, grace=args.grace, rate=args.rate)
+    while True:
+        stats = collector.run_cycle(args.batch_size)
+        print(json.dumps(stats))
+        if args.loop is None:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+ブロック単位の圧縮コーデックのレジストリ。
+
+各ブロックを独立に圧縮し、system.chunks の codecs（ブロックごとのコーデック名）と
+compressed_sizes（格納サイズ）に記録する。block_hashes は圧縮前のデータのハッシュのため、
+検証・重複排除・累計ハッシュは圧縮の有無に依存しない。ブロックは独立に展開できるため、
+範囲読み込みや並列の展開はそのまま動作する。
+
+zlib は常に利用でき、インストールされていれば zstd（zstandard）、lz4 を利用できる
+（compress 依存グループ）。"auto" は先頭ブロックを圧縮してみて、
+縮む場合は優先順位の最も高いコーデックを、縮まない場合は "none" を選ぶ。
+圧縮しても小さくならないブロックは "none" として格納する。
+"""
+
+import threading
+import zlib
+from itertools import accumulate
+
+from .exceptions import RFC7807Error
+
+NONE = "none"
+AUTO = "auto"
+# auto で選ぶコーデックの優先順位
+AUTO_CODECS = ("zstd", "lz4", "zlib")
+# auto で圧縮するとみなす、サンプルの圧縮率の上限
+AUTO_MIN_RATIO = 0.9
+
+_codecs = {}
+
+
+class Codec:
+    """compress(data) -> bytes と decompress(data, size) -> bytes を持つコーデック"""
+
+    def __init__(self, name: str, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+def register_codec(name: str, compress, decompress, replace: bool = False):
+    """コーデックを登録する。decompress には展開後のサイズも渡す"""
+    if name in _codecs and not replace:
+        raise RFC7807Error.internalservererror(f"Codec already registered: {name}")
+    _codecs[name] = Codec(name, compress, decompress)
+
+
+def unregister_codec(name: str):
+    _codecs.pop(name, None)
+
+
+def available_codecs() -> set[str]:
+    return set(_codecs)
+
+
+def get_codec(name: str) -> Codec:
+    if name not in _codecs:
+        raise RFC7807Error.internalservererror(f"Not supported codec: {name}")
+    return _codecs[name]
+
+
+def validate_compression(compression: str):
+    """書き込みの compression 設定（コーデック名、"auto"、"none"）を検証する"""
+    if compression not in (AUTO, NONE):
+        get_codec(compression)
+
+
+def choose_codec(
+    sample, candidates=AUTO_CODECS, min_ratio: float = AUTO_MIN_RATIO
+) -> str:
+    """sample を圧縮し、縮む場合は candidates のうち利用できる最初のコーデックを返す"""
+    name = next((name for name in candidates if name in _codecs), None)
+    if name is None or not sample:
+        return NONE
+    if len(get_codec(name).compress(sample)) <= len(sample) * min_ratio:
+        return name
+    return NONE
+
+
+def encode_block(codec: str, buf) -> tuple[str, bytes]:
+    """ブロックを圧縮し、(格納したコーデック名, 格納するデータ) を返す"""
+    if codec == NONE:
+        return NONE, buf
+    data = get_codec(codec).compress(buf)
+    if len(buf) <= len(data):
+        return NONE, buf
+    return codec, data
+
+
+def is_compressed(meta: dict) -> bool:
+    return bool(meta["system"]["chunks"].get("codecs"))
+
+
+def get_stored_offsets(meta: dict) -> list[int]:
+    """圧縮されたブロックの格納先でのオフセット（末尾を含む block_count + 1 個）"""
+    return [0, *accumulate(int(n) for n in meta["system"]["chunks"]["compressed_sizes"])]
+
+
+def get_stored_size(meta: dict) -> int:
+    if is_compressed(meta):
+        return get_stored_offsets(meta)[-1]
+    return int(meta["system"]["size"])
+
+
+def decode_block(meta: dict, index: int, data) -> bytes:
+    """格納されたブロックを展開する。圧縮されていない場合はそのまま返す"""
+    chunks = meta["system"]["chunks"]
+    codecs = chunks.get("codecs")
+    if not codecs or codecs[index] == NONE:
+        return data
+
+    block_size = int(chunks["block_size"])
+    size = min(block_size, int(meta["system"]["size"]) - index * block_size)
+    codec = get_codec(codecs[index])
+    try:
+        return codec.decompress(data, size)
+    except Exception as e:
+        raise RFC7807Error.file_integrity_error(
+            f"Failed to decompress block at offset {index * block_size}."
+        ) from e
+
+
+def _register_builtin_codecs():
+    register_codec(
+        "zlib", lambda data: zlib.compress(data, 1), lambda data, size: zlib.decompress(data)
+    )
+
+    try:
+        import zstandard
+    except ImportError:
+        pass
+    else:
+        # 圧縮・展開のコンテキストはスレッド間で共有できないため、スレッドごとに作成する
+        local = threading.local()
+
+        def zstd_compress(data):
+            if not hasattr(local, "compressor"):
+                local.compressor = zstandard.ZstdCompressor(level=3)
+            return local.compressor.compress(data)
+
+        def zstd_decompress(data, size):
+            if not hasattr(local, "decompressor"):
+                local.decompressor = zstandard.ZstdDecompressor()
+            return local.decompressor.decompress(data, max_output_size=size)
+
+        register_codec("zstd", zstd_compress, zstd_decompress)
+
+    try:
+        import lz4.frame
+    except ImportError:
+        pass
+    else:
+        register_codec(
+            "lz4", lz4.frame.compress, lambda data, size: lz4.frame.decompress(data)
+        )
+
+
+_register_builtin_codecs()
@@ -39,9 +39,9 @@ class RFC7807Error(Exception):
     # title は エラー種別毎に固定されるべき。エラー種別は type: https://example.com/probs/resource-locked などの単位。
     # status_code の粒度とは少し違うけれど、その単位に合わせておく方がスタートアップでは現実的。
     @classmethod
-    def internalservererror(cls, *args, **kwargs):
+    def internalservererror(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/internalservererror",
             title="Internal Server Error.",
             status=500,
@@ -49,10 +49,10 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def not_catalog(cls, *args, **kwargs):
+    def not_catalog(cls, detail=None, **kwargs):
         """カタログとして想定するディレクトリ構造やファイル構造でない場合に生じるエラー"""
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/not_catalog",
             title="Not Catalog Error.",
             status=500,
@@ -60,9 +60,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def load_catalog_json_error(cls, *args, **kwargs):
+    def load_catalog_json_error(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/load_catalog_json_error",
             title="Can't load catalog.json.",
             status=500,
@@ -70,9 +70,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def dump_catalog_json_error(cls, *args, **kwargs):
+    def dump_catalog_json_error(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/dump_catalog_json_error",
             title="Can't dump catalog.json.",
             status=500,
@@ -80,9 +80,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def catalog_json_already_exists_error(cls, *args, **kwargs):
+    def catalog_json_already_exists_error(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/catalog_json__already_exists_error",
             title="Already exists catalog.json.",
             status=500,
@@ -90,9 +90,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def jsondecodeerror(cls, *args, **kwargs):
+    def jsondecodeerror(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/jsondecodeerror",
             title="Json decode error.",
             status=500,
@@ -100,9 +100,19 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def unauthorized(cls, *args, **kwargs):
+    def bad_request(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
+            type="https://example.com/probs/bad-request",
+            title="Bad Request.",
+            status=400,
+            **kwargs,
+        )
+
+    @classmethod
+    def unauthorized(cls, detail=None, **kwargs):
+        return cls(
+            detail=detail,
             type="https://example.com/probs/unauthorized",
             title="Unauthorized.",
             status=401,
@@ -110,9 +120,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def forbidden(cls, *args, **kwargs):
+    def forbidden(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/resource-forbidden",
             title="Resource forbidden.",
             status=403,
@@ -120,9 +130,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def not_found(cls, *args, **kwargs):
+    def not_found(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/resource-notfound",
             title="Resource Not Found.",
             status=404,
@@ -130,9 +140,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def resource_locked(cls, *args, **kwargs):
+    def resource_locked(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/resource-locked",
             title="Resource Locked.",
             status=409,
@@ -140,9 +150,41 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def unprocessableEntity(cls, *args, **kwargs):
+    def lease_expired(cls, detail=None, **kwargs):
+        """書き込みロックのリースを失った（失効した、または他の書き込みに奪われた）場合のエラー"""
+        return cls(
+            detail=detail,
+            type="https://example.com/probs/lease-expired",
+            title="Lease Expired.",
+            status=409,
+            **kwargs,
+        )
+
+    @classmethod
+    def range_not_satisfiable(cls, detail=None, **kwargs):
+        return cls(
+            detail=detail,
+            type="https://example.com/probs/range-not-satisfiable",
+            title="Range Not Satisfiable.",
+            status=416,
+            **kwargs,
+        )
+
+    @classmethod
+    def too_many_requests(cls, detail=None, **kwargs):
+        """同じリソースへの同時リクエストが上限を超えた場合のエラー"""
+        return cls(
+            detail=detail,
+            type="https://example.com/probs/too-many-requests",
+            title="Too Many Requests.",
+            status=429,
+            **kwargs,
+        )
+
+    @classmethod
+    def unprocessableEntity(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/unprocessableEntity",
             title="UnprocessableEntity.",
             status=422,
@@ -150,9 +192,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def serializeerror(cls, *args, **kwargs):
+    def serializeerror(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/serializeerror",
             title="Serialize Error.",
             status=422,
@@ -160,9 +202,9 @@ class RFC7807Error(Exception):
         )
 
     @classmethod
-    def file_integrity_error(cls, *args, **kwargs):
+    def file_integrity_error(cls, detail=None, **kwargs):
         return cls(
-            *args,
+            detail=detail,
             type="https://example.com/probs/file_integrity_error",
             title="File Integrity Error.",
             status=500,
@@ -0,0 +1,240 @@
+"""
+ハッシュアルゴリズムのレジストリ。
+
+multihash 形式 "algo:digest" の algo からハッシュオブジェクトのファクトリを解決する。
+hashlib のアルゴリズムに加え、インストールされていれば blake3（マルチスレッド）、
+xxh3（xxhash）、crc32c を利用できる。書き込み時の計算と検証は同じレジストリを使う。
+
+hashlib・blake3・zlib はある程度大きなバッファのハッシュ計算中に GIL を解放するため、
+スレッドプールでのハッシュ計算と I/O を重ねることができる。
+"""
+
+import functools
+import hashlib
+import zlib
+
+from .exceptions import RFC7807Error
+
+_backends = {}
+
+
+class ChecksumHash:
+    """チェックサム関数 func(data, value) -> int を hashlib 互換のオブジェクトにする"""
+
+    def __init__(self, name: str, func, value: int = 0, digest_size: int = 4):
+        self.name = name
+        self.digest_size = digest_size
+        self._func = func
+        self._value = value
+
+    def update(self, data):
+        self._value = self._func(data, self._value)
+
+    def digest(self) -> bytes:
+        return self._value.to_bytes(self.digest_size, "big")
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    def copy(self):
+        return ChecksumHash(self.name, self._func, self._value, self.digest_size)
+
+
+def register_hash_backend(name: str, factory, replace: bool = False):
+    """algo 名にハッシュオブジェクトのファクトリを登録する。
+
+    ファクトリは引数なしで update / hexdigest を持つオブジェクトを返すこと。
+    hexdigest は途中経過の取得に使うため、呼び出してもハッシュの状態を確定させないこと。
+    """
+    if name in _backends and not replace:
+        raise RFC7807Error.internalservererror(
+            f"Hash algorithm already registered: {name}"
+        )
+    _backends[name] = factory
+
+
+def unregister_hash_backend(name: str):
+    _backends.pop(name, None)
+
+
+def available_algorithms() -> set[str]:
+    return set(_backends) | set(hashlib.algorithms_available)
+
+
+def get_hash_cls(algorithm):
+    if algorithm in _backends:
+        return _backends[algorithm]
+
+    if algorithm not in hashlib.algorithms_available:
+        raise RFC7807Error.internalservererror(
+            f"Not supported hash algorithm: {algorithm}"
+        )
+    cls = getattr(hashlib, algorithm, None)
+    return cls or functools.partial(hashlib.new, algorithm)
+
+
+def calculate_hash(algorithm, data) -> str:
+    h = get_hash_cls(algorithm)()
+    h.update(data)
+    return h.hexdigest()
+
+
+def split_multihash(value: str) -> tuple[str, str]:
+    """multihash 形式 "algo:digest" のハッシュを (algo, digest) に分解する"""
+    algorithm, _, digest = value.partition(":")
+    return algorithm, digest
+
+
+def verify_hash(expected: str, data) -> bool:
+    """multihash 形式 "algo:digest" の期待値とデータのハッシュが一致するか検証する"""
+    algorithm, digest = split_multihash(expected)
+    return calculate_hash(algorithm, data) == digest
+
+
+class BlockHasher:
+    """ブロックごとのハッシュと累計ハッシュを計算する。
+
+    version 1: 累計ハッシュはファイル先頭からの全バイトのハッシュ（system.hash は
+    ファイル全体のハッシュと一致する）。各バイトはブロックと累計で 2 回ハッシュされる。
+
+    version 2: 累計ハッシュはブロックハッシュの連鎖 c_i = H(c_{i-1} || d_i)
+    （c_{-1} は空、d_i はブロック i のダイジェスト）。各バイトは 1 回だけハッシュされ、
+    累計ハッシュはブロックハッシュのみから求まる。0 size の場合はどちらも H(b"")。
+    """
+
+    def __init__(self, algorithm: str, version: int = 1):
+        if version not in (1, 2):
+            raise RFC7807Error.internalservererror(
+                f"Not supported chunks version: {version}"
+            )
+        self.algorithm = algorithm
+        self.version = version
+        self._hashcls = get_hash_cls(algorithm)
+        self._cumulative = self._hashcls() if version == 1 else None
+        self._chain = b""
+
+    @property
+    def needs_bytes(self) -> bool:
+        """累計ハッシュの計算にブロックのバイト列が必要か"""
+        return self.version == 1
+
+    def hash_block(self, buf) -> str:
+        """ブロックのハッシュを返す。状態を持たないため並列に呼び出せる"""
+        hashobj = self._hashcls()
+        hashobj.update(buf)
+        return self.algorithm + ":" + hashobj.hexdigest()
+
+    def update(self, buf=None, block_hash: str = None) -> str:
+        """ブロックを順に追加し、その時点の累計ハッシュを返す。
+
+        version 1 では buf を、version 2 では block_hash を渡す。
+        """
+        if self.version == 1:
+            self._cumulative.update(buf)
+            return self.algorithm + ":" + self._cumulative.hexdigest()
+
+        hashobj = self._hashcls()
+        hashobj.update(self._chain + bytes.fromhex(split_multihash(block_hash)[1]))
+        digest = hashobj.hexdigest()
+        self._chain = bytes.fromhex(digest)
+        return self.algorithm + ":" + digest
+
+    def restore(self, cumulative_hash: str):
+        """記録済みの累計ハッシュから状態を復元する（version 2 のみ）"""
+        if self.version != 2:
+            raise RFC7807Error.internalservererror(
+                "Only chunks version 2 can be restored from a cumulative hash."
+            )
+        self._chain = bytes.fromhex(split_multihash(cumulative_hash)[1])
+
+    def empty_hash(self) -> str:
+        return self.algorithm + ":" + self._hashcls().hexdigest()
+
+
+def chain_hashes(block_hashes: list) -> list:
+    """version 2 のブロックハッシュの列から累計ハッシュの列を求める"""
+    if not block_hashes:
+        return []
+    algorithm = split_multihash(block_hashes[0])[0]
+    hasher = BlockHasher(algorithm, version=2)
+    return [hasher.update(block_hash=block_hash) for block_hash in block_hashes]
+
+
+def get_chunks_version(meta: dict) -> int:
+    return int(meta["system"]["chunks"].get("version", 1))
+
+
+def verify_chunk_table(meta: dict) -> bool:
+    """チャンクテーブルの整合性（累計ハッシュと system.hash）を検証する。
+
+    version 2 ではブロックハッシュから累計ハッシュを再計算して照合する。
+    version 1 の累計ハッシュはバイト列がないと再計算できないため、
+    末尾の累計ハッシュと system.hash の一致のみを確認する。
+    """
+    chunks = meta["system"]["chunks"]
+    block_hashes = chunks.get("block_hashes", [])
+    cumulative_hashes = chunks.get("cumulative_hashes", [])
+    if not cumulative_hashes or len(block_hashes) != len(cumulative_hashes):
+        return False
+    if cumulative_hashes[-1] != meta["system"]["hash"]:
+        return False
+
+    if get_chunks_version(meta) == 2 and (meta["system"].get("size") or 0) > 0:
+        return chain_hashes(block_hashes) == cumulative_hashes
+    return True
+
+
+def calculate_file_hash(
+    algorithm: str, file, block_size: int, version: int = 1
+) -> str:
+    """ファイルの system.hash を計算する（クライアント側で期待値を求める用途）"""
+    hasher = BlockHasher(algorithm, version)
+    hash = None
+    while True:
+        buf = file.read(block_size)
+        if not buf:
+            break
+        block_hash = None if hasher.needs_bytes else hasher.hash_block(buf)
+        hash = hasher.update(buf, block_hash)
+    return hash or hasher.empty_hash()
+
+
+def _register_builtin_backends():
+    register_hash_backend(
+        "crc32", lambda: ChecksumHash("crc32", lambda data, value: zlib.crc32(data, value))
+    )
+
+    try:
+        import blake3
+    except ImportError:
+        pass
+    else:
+        register_hash_backend(
+            "blake3", lambda: blake3.blake3(max_threads=blake3.blake3.AUTO)
+        )
+
+    try:
+        import xxhash
+    except ImportError:
+        pass
+    else:
+        register_hash_backend("xxh3", xxhash.xxh3_64)
+        register_hash_backend("xxh3_64", xxhash.xxh3_64)
+        register_hash_backend("xxh3_128", xxhash.xxh3_128)
+        register_hash_backend("xxh64", xxhash.xxh64)
+
+    try:
+        import crc32c
+    except ImportError:
+        try:
+            import google_crc32c
+        except ImportError:
+            return
+        crc32c_func = lambda data, value: google_crc32c.extend(value, bytes(data))  # noqa: E731
+    else:
+        crc32c_func = lambda data, value: crc32c.crc32c(data, value)  # noqa: E731
+
+    register_hash_backend("crc32c", lambda: ChecksumHash("crc32c", crc32c_func))
+
+
+_register_builtin_backends()
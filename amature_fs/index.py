@@ -0,0 +1,184 @@
+"""
+完了済みオブジェクトのメタデータを SQLite に保持するカタログインデックス。
+
+commit / rollback で差分更新され、ディレクトリ一覧やメタデータごとの JSON 読み込みを
+行わずに、プレフィックス検索・ページング・メタデータによる絞り込みを行う。
+インデックスが壊れた場合や不整合がある場合は rebuild で再構築する。
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+
+from .exceptions import RFC7807Error
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    id TEXT,
+    size INTEGER,
+    hash TEXT,
+    meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_id ON objects (id);
+CREATE INDEX IF NOT EXISTS objects_hash ON objects (hash);
+CREATE INDEX IF NOT EXISTS objects_size ON objects (size);
+"""
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """prefix で始まる文字列の上限（これ未満）を返す"""
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _user_path(field: str) -> str:
+    return '$.user."' + field.replace('"', '\\"') + '"'
+
+
+class CatalogIndex:
+    def __init__(self, path: str = ":memory:"):
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _row(self, key, meta):
+        system = meta.get("system", {})
+        return (key, system.get("id"), system.get("size"), system.get("hash"), json.dumps(meta))
+
+    def upsert(self, key: str, meta: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (key, id, size, hash, meta) VALUES (?, ?, ?, ?, ?)",
+                self._row(key, meta),
+            )
+
+    def remove(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meta FROM objects WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+    def _select(
+        self,
+        columns: str,
+        prefix: str = "",
+        after: str = None,
+        limit: int = None,
+        size_min: int = None,
+        size_max: int = None,
+        hash: str = None,
+        id: str = None,
+        user: dict = None,
+    ):
+        clauses = []
+        params = []
+        if prefix:
+            clauses.append("key >= ? AND key < ?")
+            params += [prefix, _prefix_upper_bound(prefix)]
+        if after is not None:
+            clauses.append("key > ?")
+            params.append(after)
+        if size_min is not None:
+            clauses.append("size >= ?")
+            params.append(size_min)
+        if size_max is not None:
+            clauses.append("size <= ?")
+            params.append(size_max)
+        if hash is not None:
+            clauses.append("hash = ?")
+            params.append(hash)
+        if id is not None:
+            clauses.append("id = ?")
+            params.append(id)
+        for field, value in (user or {}).items():
+            clauses.append("json_extract(meta, ?) = ?")
+            params += [_user_path(field), value]
+
+        sql = f"SELECT {columns} FROM objects"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY key"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def ls(self, prefix: str = "", after: str = None, limit: int = None, **filters):
+        """条件に一致するキーをキー順に返す。after には前ページの最後のキーを渡す"""
+        rows = self._select("key", prefix, after, limit, **filters)
+        return [row[0] for row in rows]
+
+    def query(self, prefix: str = "", after: str = None, limit: int = None, **filters):
+        """条件に一致する (key, meta) をキー順に返す。
+
+        filters には size_min, size_max, hash, id と、user メタデータの
+        完全一致条件 user={"field": value} を指定できる。
+        """
+        rows = self._select("key, meta", prefix, after, limit, **filters)
+        return [(key, json.loads(meta)) for key, meta in rows]
+
+    def rebuild(self, items) -> int:
+        """(key, meta) のイテラブルからインデックスを再構築する"""
+        count = 0
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM objects")
+            for key, meta in items:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO objects (key, id, size, hash, meta) VALUES (?, ?, ?, ?, ?)",
+                    self._row(key, meta),
+                )
+                count += 1
+        return count
+
+    def on_commit(self, fs, key, meta):
+        self.upsert(key, meta)
+
+    def on_rollback(self, fs, key):
+        self.remove(key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="カタログを走査してインデックスを再構築する")
+    rebuild.add_argument("url", help="カタログの fsspec URL（例: dir::local://.cache/catalog）")
+    rebuild.add_argument("index", help="SQLite インデックスのパス")
+    args = parser.parse_args(argv)
+
+    import fsspec
+    from .store import StoreBluePrint
+
+    fs, _ = fsspec.url_to_fs(args.url)
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    index = CatalogIndex(args.index)
+    try:
+        count = index.rebuild(blueprint.scan(fs))
+    finally:
+        index.close()
+    print(f"indexed {count} keys")
+
+
+if __name__ == "__main__":
+    main()
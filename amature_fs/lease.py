@@ -0,0 +1,214 @@
+"""
+書き込みロックのリース。
+
+processing/meta/<key> をロックオブジェクトとし、存在しない場合のみ作成する
+アトミックな操作で取得する。ローカルは一時ファイルからの os.link（既に存在すれば失敗する）、
+それ以外は fsspec の pipe_file(mode="create")（S3 の条件付き PUT など、対応する
+バックエンドでのみアトミック）。ロックオブジェクトの system.lease に
+所有者・フェンシングトークン・有効期限を記録し、書き込み中はハートビートで延長する。
+
+ロックオブジェクトの上書き（延長）は条件付きにできないため、期限まで ttl / 4 以上
+残っているリースのみ延長し、書き込み後にトークンを確認する。失効したリースは
+回収されて他の書き込みが取得している可能性があるため、延長しない。
+
+有効期限はエポック秒（壁時計）で比較するため、ttl はホスト間の時刻のずれより十分長くすること。
+トークンは uuid7 で、取得するたびに単調に増加する。コミット時にロックオブジェクトの
+トークンが自身のものと一致し、期限内であることを確認する（フェンシング）。
+system.lease を持たないロックオブジェクト（再開可能アップロードなど）は失効しない。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+import fsspec
+
+from .exceptions import RFC7807Error
+from .local import get_local_path
+from .utils import uuid7
+
+
+def create_exclusive(fs: fsspec.AbstractFileSystem, path: str, data: bytes):
+    """path が存在しない場合のみ作成する。存在する場合は FileExistsError"""
+    local_path = get_local_path(fs, path)
+    if local_path is None:
+        fs.pipe_file(path, data, mode="create")
+        return
+
+    # 完全な内容の一時ファイルをリンクするため、作成されたロックは常に読み込める
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_path = f"{local_path}.{uuid7()}.tmp"
+    with open(tmp_path, "xb") as f:
+        f.write(data)
+    try:
+        os.link(tmp_path, local_path)
+    finally:
+        os.unlink(tmp_path)
+
+
+def get_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def is_expired(lease: dict | None, now: float = None) -> bool:
+    """リースが失効しているか。リースがない場合は失効しない"""
+    if not lease:
+        return False
+    now = time.time() if now is None else now
+    return float(lease["expires"]) <= now
+
+
+def load_lease(fs: fsspec.AbstractFileSystem, path: str) -> dict | None:
+    """ロックオブジェクトに記録されたリースを返す。ロックがない場合は FileNotFoundError"""
+    try:
+        meta = json.loads(fs.cat_file(path))
+    except json.JSONDecodeError:
+        return None
+    return meta.get("system", {}).get("lease")
+
+
+class Lease:
+    """取得済みのリース。meta はロックオブジェクトに書き込むメタデータ（書き込み側と共有する）"""
+
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        path: str,
+        meta: dict,
+        ttl: float,
+        owner: str = None,
+    ):
+        self._fs = fs
+        self._path = path
+        self._meta = meta
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._paused = False
+        self.owner = owner or get_owner_id()
+        self.token = uuid7()
+        self.expires = time.time() + ttl
+
+    @property
+    def path(self):
+        return self._path
+
+    def to_dict(self):
+        return {"owner": self.owner, "token": self.token, "expires": self.expires}
+
+    def acquire(self):
+        """ロックオブジェクトを作成する。既に存在する場合は FileExistsError"""
+        with self._lock:
+            self._meta["system"]["lease"] = self.to_dict()
+            create_exclusive(self._fs, self._path, json.dumps(self._meta).encode())
+
+    def write(self, meta: dict = None):
+        """メタデータを最新のリースとともにロックオブジェクトに書き込む。
+
+        リースを失っている場合は lease_expired（他の書き込みのロックを上書きしない）。
+        """
+        with self._lock:
+            if not self._can_overwrite():
+                raise RFC7807Error.lease_expired("Lease expired.")
+            if meta is not None:
+                self._meta = meta
+            self._meta["system"]["lease"] = self.to_dict()
+            self._fs.pipe_file(self._path, json.dumps(self._meta).encode())
+            if not self.is_owned():
+                raise RFC7807Error.lease_expired("Lease was taken over by another writer.")
+
+    def load(self) -> dict | None:
+        try:
+            return load_lease(self._fs, self._path)
+        except FileNotFoundError:
+            return None
+
+    def is_owned(self) -> bool:
+        """ロックオブジェクトが自身のリースのものか（期限は問わない）"""
+        lease = self.load()
+        return bool(lease) and lease.get("token") == self.token
+
+    def verify(self):
+        """ロックオブジェクトが自身のリースで、期限内であることを確認する"""
+        lease = self.load()
+        if not lease or lease.get("token") != self.token:
+            raise RFC7807Error.lease_expired("Lease was taken over by another writer.")
+        if is_expired(lease):
+            raise RFC7807Error.lease_expired("Lease expired.")
+
+    def _can_overwrite(self) -> bool:
+        """ロックオブジェクトを上書きしてよいか。
+
+        回収されるのは失効したリースのみのため、期限まで余裕があり、
+        自身のリースである間は他の書き込みのロックを上書きしない。
+        """
+        return time.time() + self._ttl / 4 < self.expires and self.is_owned()
+
+    def renew(self) -> bool:
+        """有効期限を延長する。停止済みの場合は何もせず True、リースを失った場合は False"""
+        with self._lock:
+            if self._paused:
+                return True
+            if not self._can_overwrite():
+                self._paused = True
+                return False
+
+            self.expires = time.time() + self._ttl
+            self._meta["system"]["lease"] = self.to_dict()
+            self._fs.pipe_file(self._path, json.dumps(self._meta).encode())
+            # 書き込みの間に奪われていないことを確認する
+            if not self.is_owned():
+                self._paused = True
+                return False
+            return True
+
+    def pause(self):
+        """以降の延長を停止する（実行中の延長は完了を待つ）"""
+        with self._lock:
+            self._paused = True
+
+
+class LeaseKeeper:
+    """登録されたリースを interval 秒ごとに延長するデーモンスレッド"""
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._leases)
+
+    def get(self, name):
+        return self._leases.get(name)
+
+    def add(self, name, lease: Lease):
+        with self._lock:
+            self._leases[name] = lease
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def pop(self, name):
+        with self._lock:
+            return self._leases.pop(name, None)
+
+    def renew_all(self):
+        # リースを失った場合も登録は残し、コミット時の検証で失敗させる
+        for lease in list(self._leases.values()):
+            try:
+                lease.renew()
+            except Exception:
+                # 一時的な障害は次の周期で再試行する
+                pass
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.renew_all()
+            with self._lock:
+                if not self._leases:
+                    self._thread = None
+                    return
@@ -0,0 +1,222 @@
+"""
+ローカルファイルシステム向けの高速経路。
+
+fsspec の LocalFileSystem（DirFileSystem 経由を含む）の場合、OS のパスを直接扱い、
+読み込みは mmap、書き込みは copy_file_range / sendfile でカーネル内のコピーを行う。
+Python のバッファを経由しないため、大きなファイルのコピーと読み込みが速くなる。
+"""
+
+import errno
+import io
+import mmap
+import os
+import stat
+
+import fsspec
+from fsspec.implementations.dirfs import DirFileSystem
+from fsspec.implementations.local import LocalFileSystem
+
+from .reader import verify_block
+
+# カーネル内コピーが使えない場合にフォールバックする errno
+_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSOCK,
+    errno.EBADF,
+}
+
+
+def get_local_path(fs: fsspec.AbstractFileSystem, path: str) -> str | None:
+    """fs がローカルファイルシステムの場合、path の OS のパスを返す。それ以外は None"""
+    if isinstance(fs, DirFileSystem):
+        if not isinstance(fs.fs, LocalFileSystem):
+            return None
+        return fs.fs._strip_protocol(fs._join(path))
+    if isinstance(fs, LocalFileSystem):
+        return fs._strip_protocol(path)
+    return None
+
+
+def get_fileno(file) -> int | None:
+    """file が通常ファイルのディスクリプタを持つ場合はそれを返す。それ以外は None"""
+    try:
+        fileno = file.fileno()
+        if not file.seekable():
+            return None
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(os.fstat(fileno).st_mode):
+        return None
+    return fileno
+
+
+def _copy_chunk(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            return os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+    return os.write(dst_fd, os.pread(src_fd, min(count, 1024 * 1024), offset))
+
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int):
+    """src_fd の offset から count バイトを dst_fd の現在位置に書き込む"""
+    while count:
+        n = _copy_chunk(src_fd, dst_fd, offset, count)
+        if not n:
+            raise EOFError(f"Unexpected end of file at offset {offset}.")
+        offset += n
+        count -= n
+
+
+def stage_local_file(file, fileno: int, dst_path: str, block_size: int, hasher):
+    """ローカルファイルを dst_path にコピーし、(size, block_hashes, cumulative_hashes) を返す。
+
+    ハッシュは mmap したファイルのビューで計算し、コピーはカーネル内で行う。
+    file の現在位置から末尾までをコピーし、file の位置は末尾に進める。
+    """
+    start = file.tell()
+    end = max(start, os.fstat(fileno).st_size)
+    block_hashes = []
+    cumulative_hashes = []
+
+    with open(dst_path, "wb") as out:
+        if start < end:
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for offset in range(start, end, block_size):
+                        n = min(block_size, end - offset)
+                        block = view[offset : offset + n]
+                        block_hash = hasher.hash_block(block)
+                        block_hashes.append(block_hash)
+                        cumulative_hashes.append(hasher.update(block, block_hash))
+                        block.release()
+                        copy_range(fileno, out.fileno(), offset, n)
+                finally:
+                    view.release()
+
+    file.seek(end)
+    return end - start, block_hashes, cumulative_hashes
+
+
+class MmapBlockReader(io.RawIOBase):
+    """ローカルの完了済みデータ（layout: file）を mmap して読み込むリーダー。
+
+    BlockReader と同じく read_range でランダムアクセスでき、verify=True の場合は
+    読み込んだ範囲のブロックを mmap のビュー上で検証する（ブロックごとに 1 回）。
+    """
+
+    def __init__(self, local_path: str, meta: dict, verify: bool = False):
+        chunks = meta["system"]["chunks"]
+        self._meta = meta
+        self._block_size = int(chunks["block_size"])
+        self._size = int(meta["system"]["size"])
+        self._verify = verify
+        self._verified = set()
+        self._pos = 0
+        self._mmap = None
+        self._view = memoryview(b"")
+        if self._size:
+            with open(local_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)[: self._size]
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def block_count(self):
+        return -(-self._size // self._block_size)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+
+        self._pos = pos
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+            if self._mmap is not None:
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    # view() で返したビューが残っている場合は GC に任せる
+                    pass
+        super().close()
+
+    def _verify_range(self, offset: int, end: int):
+        first = offset // self._block_size
+        last = (end - 1) // self._block_size
+        for index in range(first, last + 1):
+            if index in self._verified:
+                continue
+            start = index * self._block_size
+            block = self._view[start : start + self._block_size]
+            try:
+                verify_block(self._meta, index, block)
+            finally:
+                block.release()
+            self._verified.add(index)
+
+    def view(self, offset: int, length: int = -1) -> memoryview:
+        """offset から length バイトのビューをコピーせずに返す。
+
+        返したビューはリーダーを閉じる前に release すること。
+        """
+        if offset < 0:
+            raise ValueError(f"Negative offset: {offset}")
+
+        end = self._size if length < 0 else min(offset + length, self._size)
+        if end <= offset:
+            return memoryview(b"")
+        if self._verify:
+            self._verify_range(offset, end)
+        return self._view[offset:end]
+
+    def read_range(self, offset: int, length: int = -1) -> bytes:
+        with self.view(offset, length) as view:
+            return bytes(view)
+
+    def readinto(self, b):
+        with self.view(self._pos, len(b)) as view:
+            n = len(view)
+            b[:n] = view
+        self._pos += n
+        return n
+
+    def readall(self):
+        data = self.read_range(self._pos)
+        self._pos += len(data)
+        return data
@@ -19,6 +19,7 @@ blueprint = {
                 # "allow_subdirectories": True
             },
             "chunked": {"data_dir": "chunked/data", "meta_dir": "chunked/meta"},
+            "versions": {"data_dir": "versions/data", "meta_dir": "versions/meta"},
         },
         "system": {
             "default_block_size": 1024 * 1024 * 32,
@@ -26,6 +27,24 @@ blueprint = {
             "multihash_format": True,
             "chunked_enabled": True,
             "prefer_chunked_read": True,
+            "upload_workers": 8,
+            "chunks_version": 1,
+            # 書き込み用バッファプールの上限（default_block_size のブロック数）
+            "buffer_pool_blocks": 16,
+            # ローカルファイルシステムで mmap / copy_file_range を利用する
+            "local_fast_path": True,
+            # 書き込みロックのリースの有効期限（秒）。ttl / 3 ごとに延長する
+            "lease_ttl": 60.0,
+            # write_file のブロック単位の圧縮（none / auto / zlib / zstd / lz4）
+            "compression": "none",
+            # write_many でこのバイト数以下のファイルをパックにまとめる（0 の場合は無効）
+            "pack_threshold": 0,
+            # コミットごとに system.id で参照できる不変のバージョンを残す
+            "versioning": False,
+            # 残す最新でないバージョンの数（0 の場合は制限しない）
+            "versions_keep": 0,
+            # 最新でなくなってからこの秒数が経過したバージョンを回収する（0 の場合は回収しない）
+            "versions_max_age": 0,
         },
     }
 }
@@ -36,6 +55,16 @@ from pydantic import BaseModel
 class SystemBluePrint(BaseModel):
     default_block_size: int = 1024 * 1024 * 32
     default_hash_algorithm: str = "sha256"
+    upload_workers: int = 8
+    chunks_version: int = 1
+    buffer_pool_blocks: int = 16
+    local_fast_path: bool = True
+    lease_ttl: float = 60.0
+    compression: str = "none"
+    pack_threshold: int = 0
+    versioning: bool = False
+    versions_keep: int = 0
+    versions_max_age: float = 0
 
 
 class FilesBluePrint(BaseModel):
@@ -82,6 +111,10 @@ class BluePrintConfig(BaseModel):
                         "meta_dir": "chunked/meta",
                         "doc_dir": "chunked/doc",
                     },
+                    "versions": {
+                        "data_dir": "versions/data",
+                        "meta_dir": "versions/meta",
+                    },
                 },
             }
         )
@@ -91,12 +124,35 @@ class ChunksMetaData(BaseModel):
     block_size: int = 1024 * 1024 * 32
     block_hashes: list = []
     cumulative_hashes: list = []
+    # file: 単一ファイル / chunked: ブロックごとのオブジェクト / cas: ブロックプールへの参照
+    # pack: 複数の小さなオブジェクトを連結したパックセグメントの一部
+    layout: str = "file"
+    # chunked, cas の場合のブロック格納ディレクトリ、pack の場合のセグメント
+    location: str | None = None
+    offset: int = 0  # pack の場合のセグメント内のオフセット
+    # 1: 累計ハッシュはファイル全体のハッシュ / 2: ブロックハッシュの連鎖（hashing.BlockHasher）
+    version: int = 1
+    # ブロックごとのコーデックと格納サイズ（compression）。空の場合は圧縮なし
+    codecs: list = []
+    compressed_sizes: list = []
+
+
+class ReplicaSource(BaseModel):
+    """レプリカの複製元（tiers.TieredStore）"""
+
+    tier: str
+    id: str | None = None  # 複製元のオブジェクトの system.id
 
 
 class SystemMetaData(BaseModel):
+    id: str | None = None
     size: int | None = None
     hash: str | None = None
     chunks: dict = ChunksMetaData()
+    # ホットの場合のレプリカごとの複製状態 {tier: {"status": ..., ...}}（tiers.TieredStore）
+    replication: dict = {}
+    # レプリカの場合の複製元
+    replica_of: ReplicaSource | None = None
 
 
 class MetaData(BaseModel):
@@ -0,0 +1,203 @@
+"""
+小さなオブジェクトのパック。
+
+StoreBluePrint.write_packed は複数の小さなオブジェクトを 1 つのパックセグメント
+（chunked/data/packs/<uuid7>）に連結して書き込み、メタデータ（layout "pack"、
+セグメントと offset）を一括でコミットする。読み込みはセグメントへの 1 回の範囲読み込みになる。
+
+PackWriter は複数のスレッドからの write を短時間（max_delay 秒）まとめて
+write_packed に渡すグループコミットを行う。
+
+セグメントは追記専用で書き換えない。上書き・削除で参照の減ったセグメントは
+compact で生きているオブジェクトを新しいセグメントに詰め直し、参照がなくなった
+セグメントはガベージコレクタ（packs フェーズ）が猶予期間の後に回収する。
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import fsspec
+
+from .reader import get_block_source
+from .store import StoreBluePrint, get_layout
+from .utils import uuid7
+
+
+class PackWriter:
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        max_batch: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_delay: float = 0.005,
+        chunks_version: int = None,
+    ):
+        """
+        :param max_batch: 1 つのセグメントにまとめるオブジェクト数の上限
+        :param max_bytes: 1 つのセグメントの大きさの目安
+        :param max_delay: 最初の書き込みからセグメントを書き込むまでに待つ秒数
+        """
+        self._fs = fs
+        self._blueprint = blueprint
+        self._max_batch = max_batch
+        self._max_bytes = max_bytes
+        self._max_delay = max_delay
+        self._chunks_version = chunks_version
+        self._pending = []
+        self._futures = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def write(self, key, data: bytes, usermeta: dict = {}) -> dict:
+        """data をパックに書き込み、コミットされたメタデータを返す（コミットまで待つ）"""
+        return self.submit(key, data, usermeta).result()
+
+    def submit(self, key, data: bytes, usermeta: dict = {}) -> Future:
+        future = Future()
+        with self._cond:
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+            self._pending.append((key, bytes(data), usermeta, future, time.monotonic()))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _take_batch(self):
+        """キーが重複しないように先頭から取り出す（重複したものは次のセグメントに回す）"""
+        batch = []
+        keys = set()
+        nbytes = 0
+        rest = []
+        for item in self._pending:
+            key, data = item[0], item[1]
+            full = self._max_batch <= len(batch) or self._max_bytes <= nbytes
+            if not (key in keys or full):
+                batch.append(item)
+                nbytes += len(data)
+            else:
+                rest.append(item)
+            keys.add(key)
+        self._pending = rest
+        return batch
+
+    def _is_ready(self):
+        nbytes = sum(len(item[1]) for item in self._pending)
+        deadline = self._pending[0][4] + self._max_delay
+        return (
+            self._max_batch <= len(self._pending)
+            or self._max_bytes <= nbytes
+            or deadline <= time.monotonic()
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._thread = None
+                    return
+                while not self._is_ready():
+                    deadline = self._pending[0][4] + self._max_delay
+                    self._cond.wait(max(deadline - time.monotonic(), 0))
+                batch = self._take_batch()
+
+            try:
+                results = self._blueprint.write_packed(
+                    self._fs,
+                    [(key, data, usermeta) for key, data, usermeta, _, _ in batch],
+                    self._chunks_version,
+                )
+            except Exception as e:
+                for item in batch:
+                    item[3].set_exception(e)
+                continue
+
+            for key, _, _, future, _ in batch:
+                result = results[key]
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def flush(self):
+        """投入済みの書き込みが全てコミットされるまで待つ"""
+        with self._cond:
+            futures = list(self._futures)
+        for future in futures:
+            future.exception()
+
+
+def get_segment_usage(fs: fsspec.AbstractFileSystem, blueprint: StoreBluePrint):
+    """セグメントごとの {"size", "live", "objects": [(key, meta)]} を返す"""
+    pack_dir = blueprint.get_pack_dir()
+    usage = defaultdict(lambda: {"size": 0, "live": 0, "objects": []})
+    if fs.exists(pack_dir):
+        for info in fs.ls(pack_dir, detail=True):
+            segment = os.path.basename(info["name"])
+            usage[segment]["size"] = info["size"]
+
+    for key, meta in blueprint.scan(fs):
+        if get_layout(meta) != "pack":
+            continue
+        segment = os.path.basename(meta["system"]["chunks"]["location"])
+        usage[segment]["live"] += int(meta["system"]["size"])
+        usage[segment]["objects"].append((key, meta))
+    return dict(usage)
+
+
+def compact(
+    fs: fsspec.AbstractFileSystem,
+    blueprint: StoreBluePrint,
+    min_live_ratio: float = 0.5,
+) -> dict:
+    """生きているデータの割合が min_live_ratio 未満のセグメントを詰め直す。
+
+    生きているオブジェクトを新しいセグメントに書き込み、メタデータの location と offset を
+    system.id を確認しながら更新する。古いセグメントは読み込み中のリーダーのために残し、
+    参照がなくなった後にガベージコレクタが回収する。
+    """
+    stats = {"segments": 0, "moved": 0, "bytes": 0}
+    objects = []
+    for segment, usage in get_segment_usage(fs, blueprint).items():
+        if usage["objects"] and usage["live"] < usage["size"] * min_live_ratio:
+            stats["segments"] += 1
+            objects.extend(usage["objects"])
+    if not objects:
+        return stats
+
+    sources = [get_block_source(meta, 0) for _, meta in objects]
+    datas = fs.cat_ranges(
+        [source[0] for source in sources],
+        [source[1] for source in sources],
+        [source[2] for source in sources],
+    )
+
+    segment = os.path.join(blueprint.get_pack_dir(), uuid7())
+    offsets = []
+    offset = 0
+    for data in datas:
+        offsets.append(offset)
+        offset += len(data)
+    fs.pipe_file(segment, b"".join(datas))
+
+    for (key, meta), offset in zip(objects, offsets):
+
+        def update(meta, offset=offset):
+            meta["system"]["chunks"]["location"] = segment
+            meta["system"]["chunks"]["offset"] = offset
+
+        try:
+            id = meta["system"]["id"]
+            moved = blueprint.update_completed_meta(fs, key, id, update)
+        except Exception:
+            # 書き込み中のキーは次回に詰め直す
+            continue
+        if moved:
+            stats["moved"] += 1
+            stats["bytes"] += int(meta["system"]["size"])
+    return stats
@@ -0,0 +1,171 @@
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+import fsspec
+
+from .blockpool import get_block_path
+from .compression import decode_block, get_stored_offsets, is_compressed
+from .exceptions import RFC7807Error
+from .hashing import verify_hash
+from .utils import chunk_name
+
+
+def get_block_source(meta: dict, index: int, data_path: str = None):
+    """ブロックの取得元を (path, start, end) で返す。start, end が None の場合は全体。
+
+    圧縮されたブロックの場合は格納されたデータの範囲で、decode_block で展開する。
+    """
+    chunks = meta["system"]["chunks"]
+    layout = chunks.get("layout", "file")
+    location = chunks.get("location") or data_path
+    if layout == "file" and is_compressed(meta):
+        offsets = get_stored_offsets(meta)
+        return location, offsets[index], offsets[index + 1]
+    elif layout in ("file", "pack"):
+        # pack はセグメント内の offset から size バイト
+        base = int(chunks.get("offset") or 0) if layout == "pack" else 0
+        block_size = int(chunks["block_size"])
+        start = index * block_size
+        end = min(start + block_size, int(meta["system"]["size"]))
+        return location, base + start, base + end
+    elif layout == "cas":
+        return get_block_path(location, chunks["block_hashes"][index]), None, None
+    else:
+        return path.join(location, chunk_name(index)), None, None
+
+
+def verify_block(meta: dict, index: int, block):
+    block_hashes = meta["system"]["chunks"].get("block_hashes", [])
+    if index < len(block_hashes) and not verify_hash(block_hashes[index], block):
+        block_size = int(meta["system"]["chunks"]["block_size"])
+        raise RFC7807Error.file_integrity_error(
+            f"Block hash mismatch at offset {index * block_size}."
+        )
+
+
+class BlockReader(io.RawIOBase):
+    """チャンクテーブル（system.chunks）を利用してブロック単位で読み込むリーダー。
+
+    必要なブロックだけを取得し、後続ブロックを並列に先読みする。
+    verify=True の場合、取得したブロックを block_hashes で検証する。
+    """
+
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        meta: dict,
+        data_path: str = None,
+        verify: bool = False,
+        prefetch: int = 2,
+        max_workers: int = 4,
+    ):
+        chunks = meta["system"]["chunks"]
+        self._fs = fs
+        self._meta = meta
+        self._data_path = data_path
+        self._block_size = int(chunks["block_size"])
+        self._size = int(meta["system"]["size"])
+        self._verify = verify
+        self._prefetch = prefetch
+        self._pos = 0
+        # ブロック番号 -> Future（取得中・取得済みのブロック）
+        self._blocks = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def block_count(self):
+        return -(-self._size // self._block_size)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+
+        self._pos = pos
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._blocks.clear()
+        super().close()
+
+    def _fetch_block(self, index):
+        block_path, start, end = get_block_source(self._meta, index, self._data_path)
+        block = self._fs.cat_file(block_path, start=start, end=end)
+        block = decode_block(self._meta, index, block)
+        if self._verify:
+            verify_block(self._meta, index, block)
+        return block
+
+    def _schedule(self, index):
+        future = self._blocks.get(index)
+        if future is None:
+            future = self._executor.submit(self._fetch_block, index)
+            self._blocks[index] = future
+        return future
+
+    def _get_blocks(self, first, last):
+        """first..last のブロックを取得し、以降のブロックを先読みする"""
+        end = min(last + self._prefetch, self.block_count - 1)
+        futures = [self._schedule(index) for index in range(first, end + 1)]
+
+        # 先読み範囲外のブロックは破棄し、保持するブロック数を制限する
+        for index in list(self._blocks):
+            if index < first or end < index:
+                self._blocks.pop(index).cancel()
+
+        return [future.result() for future in futures[: last - first + 1]]
+
+    def read_range(self, offset: int, length: int = -1) -> bytes:
+        """offset から length バイトを読み込む。必要なブロックだけを取得する"""
+        if offset < 0:
+            raise ValueError(f"Negative offset: {offset}")
+
+        end = self._size if length < 0 else min(offset + length, self._size)
+        if end <= offset:
+            return b""
+
+        first = offset // self._block_size
+        last = (end - 1) // self._block_size
+        blocks = self._get_blocks(first, last)
+
+        start = offset - first * self._block_size
+        if len(blocks) == 1:
+            return bytes(blocks[0][start : start + end - offset])
+        return b"".join(blocks)[start : start + end - offset]
+
+    def readinto(self, b):
+        data = self.read_range(self._pos, len(b))
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def readall(self):
+        data = self.read_range(self._pos)
+        self._pos += len(data)
+        return data
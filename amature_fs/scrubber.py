@@ -0,0 +1,241 @@
+"""
+完了済みオブジェクトの整合性を検証するスクラバー。
+
+    python -m amature_fs.scrubber run dir::local://.cache/catalog --workers 8
+    python -m amature_fs.scrubber run dir::local://.cache/catalog --sample 0.1
+
+各オブジェクトのブロックを system.chunks.block_hashes で独立に検証するため、
+1 つの大きなファイルでも全てのワーカーで並列に検証できる。チャンクテーブル
+（累計ハッシュと system.hash）の整合性も確認する。
+
+キー順に batch_size 件ずつ検証し、バッチごとに進捗と結果を state_path に保存する。
+中断した場合は続きから再開する。結果の corrupt には、壊れたブロックのキー・番号・
+オフセット・長さ・格納先を記録する（修復の入力にできる）。
+
+ワーカーはプロセスプールで動作し、fs は pickle して渡す（memory:// のように
+プロセス間で共有されないファイルシステムでは use_threads=True を指定する）。
+"""
+
+import argparse
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import fsspec
+
+from .compression import decode_block
+from .exceptions import RFC7807Error
+from .hashing import get_chunks_version, verify_chunk_table, verify_hash
+from .reader import get_block_source
+from .store import StoreBluePrint
+from .utils import uuid7
+
+STATE_PATH = "scrub.json"
+
+
+def verify_blocks(fs: fsspec.AbstractFileSystem, key: str, meta: dict, data_path, indices):
+    """meta のブロック indices を検証し、(検証したバイト数, 壊れたブロックのリスト) を返す"""
+    chunks = meta["system"]["chunks"]
+    block_size = int(chunks["block_size"])
+    size = int(meta["system"]["size"])
+    nbytes = 0
+    corrupt = []
+    for index in indices:
+        offset = index * block_size
+        length = min(block_size, size - offset)
+        # 圧縮されたブロックは展開してから検証する（nbytes は格納サイズ）
+        source, start, end = get_block_source(meta, index, data_path)
+        expected = chunks["block_hashes"][index]
+        try:
+            block = fs.cat_file(source, start=start, end=end)
+        except FileNotFoundError:
+            block, error = None, "missing"
+        else:
+            nbytes += len(block)
+            try:
+                block = decode_block(meta, index, block)
+            except RFC7807Error:
+                block = None
+            if block is None:
+                error = "decode_error"
+            elif len(block) != length:
+                error = "size_mismatch"
+            elif not verify_hash(expected, block):
+                error = "hash_mismatch"
+            else:
+                continue
+
+        corrupt.append(
+            {
+                "key": key,
+                "id": meta["system"].get("id"),
+                "index": index,
+                "offset": offset,
+                "length": length,
+                "path": source,
+                "expected": expected,
+                "error": error,
+            }
+        )
+    return nbytes, corrupt
+
+
+def is_sampled(key: str, sample: float, seed: str = "") -> bool:
+    """key を検証対象とするか（キーのハッシュで決まるため、実行ごとに同じ部分集合になる）"""
+    if sample >= 1:
+        return True
+    digest = hashlib.sha256((seed + key).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 < sample
+
+
+class Scrubber:
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        max_workers: int = None,
+        sample: float = 1.0,
+        seed: str = "",
+        batch_size: int = 100,
+        blocks_per_task: int = 4,
+        use_threads: bool = False,
+        state_path: str = STATE_PATH,
+    ):
+        """
+        :param sample: 検証するオブジェクトの割合（0〜1）
+        :param blocks_per_task: 1 つのタスクで検証するブロック数
+        """
+        self._fs = fs
+        self._blueprint = blueprint
+        self._max_workers = max_workers
+        self._sample = sample
+        self._seed = seed
+        self._batch_size = batch_size
+        self._blocks_per_task = blocks_per_task
+        self._use_threads = use_threads
+        self._state_path = state_path
+
+    def load_state(self) -> dict | None:
+        try:
+            return json.loads(self._fs.cat_file(self._state_path))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_state(self, state: dict):
+        self._fs.pipe_file(self._state_path, json.dumps(state).encode())
+
+    def _new_state(self):
+        return {
+            "scrub": uuid7(),
+            "after": None,
+            "done": False,
+            "objects": 0,
+            "blocks": 0,
+            "bytes": 0,
+            "corrupt": [],
+        }
+
+    def _check_table(self, key: str, meta: dict) -> list:
+        if verify_chunk_table(meta):
+            return []
+        return [
+            {
+                "key": key,
+                "id": meta["system"].get("id"),
+                "index": None,
+                "offset": None,
+                "length": None,
+                "path": None,
+                "expected": meta["system"].get("hash"),
+                "error": f"chunk_table_mismatch (version {get_chunks_version(meta)})",
+            }
+        ]
+
+    def _tasks(self, key: str, meta: dict):
+        size = int(meta["system"].get("size") or 0)
+        count = -(-size // int(meta["system"]["chunks"]["block_size"]))
+        data_path = self._blueprint.get_completed_data_path(key)
+        for i in range(0, count, self._blocks_per_task):
+            indices = list(range(i, min(i + self._blocks_per_task, count)))
+            yield key, meta, data_path, indices
+
+    def run(self, max_objects: int = None, restart: bool = False) -> dict:
+        """スクラブを実行し（中断していれば再開し）、結果を返す。
+
+        max_objects を指定した場合、その件数を検証したところで中断する（done は False）。
+        """
+        state = None if restart else self.load_state()
+        if state is None or state["done"]:
+            state = self._new_state()
+
+        executor_cls = ThreadPoolExecutor if self._use_threads else ProcessPoolExecutor
+        checked = 0
+        with executor_cls(max_workers=self._max_workers) as executor:
+            batch = []
+            for key, meta in self._blueprint.scan(self._fs, self._batch_size):
+                if state["after"] is not None and key <= state["after"]:
+                    continue
+                batch.append((key, meta))
+                if len(batch) == self._batch_size:
+                    checked += self._run_batch(executor, batch, state)
+                    batch = []
+                    if max_objects is not None and max_objects <= checked:
+                        return state
+
+            if batch:
+                checked += self._run_batch(executor, batch, state)
+
+        state["done"] = True
+        self.save_state(state)
+        return state
+
+    def _run_batch(self, executor, batch, state) -> int:
+        futures = []
+        checked = 0
+        for key, meta in batch:
+            if not is_sampled(key, self._sample, self._seed):
+                continue
+            checked += 1
+            state["corrupt"].extend(self._check_table(key, meta))
+            for task in self._tasks(key, meta):
+                futures.append(executor.submit(verify_blocks, self._fs, *task))
+                state["blocks"] += len(task[-1])
+
+        for future in futures:
+            nbytes, corrupt = future.result()
+            state["bytes"] += nbytes
+            state["corrupt"].extend(corrupt)
+
+        state["objects"] += checked
+        state["after"] = batch[-1][0]
+        self.save_state(state)
+        return checked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.scrubber")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="完了済みオブジェクトを検証する")
+    run.add_argument("url", help="カタログの fsspec URL（例: dir::local://.cache/catalog）")
+    run.add_argument("--workers", type=int, default=None)
+    run.add_argument("--sample", type=float, default=1.0, help="検証するオブジェクトの割合")
+    run.add_argument("--threads", action="store_true", help="プロセスの代わりにスレッドを使う")
+    run.add_argument("--restart", action="store_true", help="中断したスクラブを破棄して最初から実行する")
+    args = parser.parse_args(argv)
+
+    fs, _ = fsspec.url_to_fs(args.url)
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    scrubber = Scrubber(
+        fs,
+        blueprint,
+        max_workers=args.workers,
+        sample=args.sample,
+        use_threads=args.threads,
+    )
+    state = scrubber.run(restart=args.restart)
+    print(json.dumps(state, indent=2))
+    return 1 if state["corrupt"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
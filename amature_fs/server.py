@@ -0,0 +1,308 @@
+"""
+MyStore を HTTP で公開する ASGI アプリケーション（server 依存グループが必要）。
+
+    uvicorn --factory amature_fs.server:create_app_from_env
+    AMATURE_FS_URL=dir::local://.cache/catalog
+
+    PUT  /objects/{key}  リクエストボディをストリーミングで write_file に渡す
+    GET  /objects/{key}  Range / If-None-Match に対応（ETag は system.hash）
+    HEAD /objects/{key}  read_meta からヘッダーのみを返す
+
+    POST   /uploads/{key}                               マルチパートアップロードを開始する
+    PUT    /uploads/{key}?upload_id=...&part=N          パート N を書き込む（X-Hash で照合）
+    GET    /uploads/{key}?upload_id=...                 書き込み済みのパートの一覧
+    POST   /uploads/{key}?upload_id=...                 完了する（ボディは {"parts": [...]}）
+    DELETE /uploads/{key}?upload_id=...                 中止する
+
+PUT のボディは write_file が読み込む分だけ受信するため、メモリに溜め込まない
+（受信が書き込みより速い場合は TCP のフロー制御でクライアントを待たせる）。
+同じキーへの同時リクエスト数は max_requests_per_key で制限し、超えた場合は 429 を返す。
+GET の枠はレスポンスの本文を送信し終えるまで保持する。
+カタログの外を指すキー（../x など）は 400 を返す。
+エラーは RFC7807Error.to_dict の形式（application/problem+json）で返す。
+"""
+
+import io
+import json
+import os
+import posixpath
+import re
+from contextlib import ExitStack, contextmanager
+
+import anyio.from_thread
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+from .exceptions import RFC7807Error
+from .store import MyStore
+
+USERMETA_PREFIX = "x-meta-"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class RequestBodyReader(io.RawIOBase):
+    """非同期のリクエストボディを、ワーカースレッドから同期的に読み込むファイル。
+
+    read / readinto のたびにイベントループから次のチャンクを受け取る。
+    """
+
+    def __init__(self, request: Request):
+        self._stream = request.stream().__aiter__()
+        self._buf = memoryview(b"")
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    async def _next(self):
+        try:
+            return await self._stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def readinto(self, b):
+        while not self._buf and not self._eof:
+            chunk = anyio.from_thread.run(self._next)
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buf = memoryview(chunk)
+
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+class KeyLimiter:
+    """キーごとの同時リクエスト数を制限する"""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._counts = {}
+
+    @contextmanager
+    def acquire(self, key: str):
+        count = self._counts.get(key, 0)
+        if self._limit <= count:
+            raise RFC7807Error.too_many_requests(f"Too many concurrent requests: {key}")
+        self._counts[key] = count + 1
+        try:
+            yield
+        finally:
+            self._counts[key] -= 1
+            if not self._counts[key]:
+                del self._counts[key]
+
+
+def validate_key(key: str) -> str:
+    """空のキーや、パスとして解釈するとカタログの外を指すキーを 400 とする"""
+    normalized = posixpath.normpath(key) if key else ""
+    if normalized in ("", ".", "..") or normalized.startswith(("/", "../")):
+        raise RFC7807Error.bad_request(f"Invalid key: {key!r}")
+    return key
+
+
+def get_etag(meta: dict) -> str:
+    return '"' + meta["system"]["hash"] + '"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or ("W/" + etag) in tags
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Range ヘッダー（単一範囲）を (start, end) に変換する。end は含まない。
+
+    解釈できない場合は None（全体を返す）、満たせない範囲の場合は 416 のエラー。
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    else:
+        start = max(size - int(last), 0)
+        end = size
+    if size <= start or end <= start:
+        raise RFC7807Error.range_not_satisfiable(f"Invalid range for size {size}.")
+    return start, end
+
+
+def get_meta_headers(meta: dict) -> dict:
+    headers = {
+        "etag": get_etag(meta),
+        "accept-ranges": "bytes",
+        "content-length": str(meta["system"]["size"]),
+    }
+    for name, value in meta["user"].items():
+        if name not in ("hash", "size"):
+            headers[USERMETA_PREFIX + name] = (
+                value if isinstance(value, str) else json.dumps(value)
+            )
+    return headers
+
+
+def get_usermeta(request: Request, size_header: str = "content-length") -> dict:
+    """x-meta-* ヘッダーをユーザーメタデータ、x-hash と size_header を期待値とする"""
+    usermeta = {
+        name[len(USERMETA_PREFIX) :]: value
+        for name, value in request.headers.items()
+        if name.startswith(USERMETA_PREFIX)
+    }
+    if "x-hash" in request.headers:
+        usermeta["hash"] = request.headers["x-hash"]
+    if size_header in request.headers:
+        usermeta["size"] = int(request.headers[size_header])
+    return usermeta
+
+
+def iter_range(reader, start: int, end: int, chunk_size: int = STREAM_CHUNK_SIZE):
+    with reader:
+        for offset in range(start, end, chunk_size):
+            yield reader.read_range(offset, min(chunk_size, end - offset))
+
+
+def iter_with_release(iterable, release):
+    """iterable を返し終えた（または中断された）ときに release を呼ぶ"""
+    try:
+        yield from iterable
+    finally:
+        release()
+
+
+def create_app(store: MyStore, max_requests_per_key: int = 4) -> FastAPI:
+    app = FastAPI()
+    app.state.store = store
+    limiter = app.state.limiter = KeyLimiter(max_requests_per_key)
+
+    @app.exception_handler(RFC7807Error)
+    async def handle_rfc7807_error(request: Request, e: RFC7807Error):
+        return JSONResponse(
+            e.to_dict(), status_code=e.status, media_type="application/problem+json"
+        )
+
+    @app.exception_handler(FileNotFoundError)
+    async def handle_not_found(request: Request, e: FileNotFoundError):
+        return await handle_rfc7807_error(request, RFC7807Error.not_found())
+
+    @app.put("/objects/{key:path}", status_code=201)
+    async def put_object(key: str, request: Request):
+        validate_key(key)
+        with limiter.acquire(key):
+            meta = await run_in_threadpool(
+                store.write_file, key, RequestBodyReader(request), get_usermeta(request)
+            )
+        return JSONResponse(meta, status_code=201, headers={"etag": get_etag(meta)})
+
+    @app.head("/objects/{key:path}")
+    async def head_object(key: str):
+        validate_key(key)
+        meta = await run_in_threadpool(store.read_meta, key)
+        return Response(headers=get_meta_headers(meta))
+
+    @app.get("/objects/{key:path}")
+    async def get_object(key: str, request: Request, verify: bool = False):
+        validate_key(key)
+        with ExitStack() as stack:
+            stack.enter_context(limiter.acquire(key))
+            meta = await run_in_threadpool(store.read_meta, key)
+            headers = get_meta_headers(meta)
+            if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+                return Response(status_code=304, headers={"etag": headers["etag"]})
+
+            local_path = await run_in_threadpool(store.get_local_path, key, meta)
+            if local_path is not None and not verify:
+                # ローカルの場合は sendfile（サーバーが対応していれば pathsend）で返す
+                del headers["content-length"]
+                # 枠は本文の送信後に解放する
+                release = stack.pop_all().close
+                return FileResponse(
+                    local_path, headers=headers, background=BackgroundTask(release)
+                )
+
+            size = meta["system"]["size"]
+            status_code = 200
+            start, end = 0, size
+            if "range" in request.headers:
+                byte_range = parse_range(request.headers["range"], size)
+                if byte_range is not None:
+                    start, end = byte_range
+                    status_code = 206
+                    headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            headers["content-length"] = str(end - start)
+
+            reader = store.open_block_reader(key, verify=verify, meta=meta)
+            # 枠は本文の送信後（切断時はイテレータの終了時）に解放する。解放は冪等
+            release = stack.pop_all().close
+            return StreamingResponse(
+                iter_with_release(iter_range(reader, start, end), release),
+                status_code=status_code,
+                headers=headers,
+                media_type="application/octet-stream",
+                background=BackgroundTask(release),
+            )
+
+    @app.post("/uploads/{key:path}")
+    async def post_upload(key: str, request: Request, upload_id: str = None):
+        validate_key(key)
+        if upload_id is None:
+            # 開始時はボディがないため、全体のサイズは X-Size で指定する
+            usermeta = get_usermeta(request, size_header="x-size")
+            upload = await run_in_threadpool(store.create_multipart_upload, key, usermeta)
+            return JSONResponse(upload, status_code=201)
+
+        body = await request.body()
+        parts = json.loads(body).get("parts") if body else None
+        with limiter.acquire(key):
+            meta = await run_in_threadpool(
+                store.complete_multipart_upload, key, upload_id, parts
+            )
+        return JSONResponse(meta, status_code=201, headers={"etag": get_etag(meta)})
+
+    @app.put("/uploads/{key:path}")
+    async def put_part(key: str, request: Request, upload_id: str, part: int):
+        validate_key(key)
+        # パートは並列に送信されるため、同時実行数はパートごとに制限する
+        with limiter.acquire(f"{key}?part={part}"):
+            record = await run_in_threadpool(
+                store.upload_part,
+                key,
+                upload_id,
+                part,
+                RequestBodyReader(request),
+                request.headers.get("x-hash"),
+            )
+        return JSONResponse(record, headers={"etag": '"' + record["block_hash"] + '"'})
+
+    @app.get("/uploads/{key:path}")
+    async def get_parts(key: str, upload_id: str):
+        validate_key(key)
+        return await run_in_threadpool(store.list_parts, key, upload_id)
+
+    @app.delete("/uploads/{key:path}", status_code=204)
+    async def delete_upload(key: str, upload_id: str):
+        validate_key(key)
+        await run_in_threadpool(store.abort_multipart_upload, key, upload_id)
+        return Response(status_code=204)
+
+    return app
+
+
+def create_app_from_env() -> FastAPI:
+    """環境変数 AMATURE_FS_URL のカタログを公開するアプリケーションを作成する"""
+    import fsspec
+
+    from .store import StoreBluePrint
+
+    url = os.environ.get("AMATURE_FS_URL", "dir::local://.cache/catalog")
+    fs, _ = fsspec.url_to_fs(url)
+    store = MyStore.from_fsspec(fs, StoreBluePrint(StoreBluePrint.get_default()))
+    return create_app(store)
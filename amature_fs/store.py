@@ -1,3 +1,5 @@
+import io
+import logging
 import os
 
 
@@ -11,37 +13,61 @@ from .models import (
     MetaData,
     blueprint,
 )
-from .utils import uuid7
+from .utils import uuid7, chunk_name
 
 import fsspec
 import json
 from os import path
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import hashlib
 import copy
+import bisect
+import time
 from .exceptions import RFC7807Error
+from .blockpool import BlockPool, get_stored_block_hashes
+from .buffers import BufferPool, PrefixedReader, read_block
+from .cache import MetaCache
+from .changes import ChangeFeed
+from .compression import (
+    AUTO,
+    NONE,
+    choose_codec,
+    encode_block,
+    get_stored_size,
+    is_compressed,
+    validate_compression,
+)
+from .hashing import BlockHasher, chain_hashes, split_multihash
+from .index import CatalogIndex
+from .lease import Lease, LeaseKeeper, create_exclusive, is_expired
+from .local import MmapBlockReader, get_fileno, get_local_path, stage_local_file
+from .reader import BlockReader, get_block_source
+from .tickers._uuid7 import to_timestamp
 
 CATALOG_JSON_PATH = "catalog.json"
 
+logger = logging.getLogger(__name__)
 
-def calculate_hash(algorithm, data) -> str:
-    if algorithm not in hashlib.algorithms_available:
-        raise RFC7807Error.internalservererror(
-            f"Not supported hash algorithm: {algorithm}"
-        )
 
-    h = getattr(hashlib, algorithm)()
-    h.update(data)
-    return h.hexdigest()
+def get_layout(meta) -> str:
+    return meta["system"]["chunks"].get("layout", "file")
 
 
-def get_hash_cls(algorithm):
-    if algorithm not in hashlib.algorithms_available:
-        raise RFC7807Error.internalservererror(
-            f"Not supported hash algorithm: {algorithm}"
-        )
-    cls = getattr(hashlib, algorithm)
-    return cls
+def get_chunk_location(meta) -> str | None:
+    if get_layout(meta) == "file":
+        return None
+    return meta["system"]["chunks"].get("location")
+
+
+def mv_many(fs: fsspec.AbstractFileSystem, paths1: list, paths2: list):
+    """一括 mv に対応していないファイルシステムでは 1 件ずつ mv する"""
+    try:
+        fs.mv(paths1, paths2)
+    except (TypeError, AttributeError, NotImplementedError):
+        for path1, path2 in zip(paths1, paths2):
+            fs.mv(path1, path2)
 
 
 class CatalogHelper:
@@ -62,20 +88,23 @@ class CatalogHelper:
 
 
 class LockDir:
+    """path のロックオブジェクトによる排他ロック。
+
+    ロックオブジェクトはアトミックに作成し、所有者（lock_id）を記録する。
+    解放時は自身のロックであることを確認してから削除する。
+    """
+
     def __init__(self, client: fsspec.AbstractFileSystem, path, lock_id: str):
         self._client = client
         self._path = path
         self._lock_id = lock_id
 
-    @contextmanager
     @classmethod
+    @contextmanager
     def create(cls, client, path, lock_id=None):
-        import uuid
-
-        lock_id = lock_id or str(uuid.uuid4())
-        lock = cls(client, path, lock_id)
-        with lock as lock:
-            return lock
+        lock_id = lock_id or uuid7()
+        with cls(client, path, lock_id) as lock:
+            yield lock
 
     def __enter__(self):
         self.lock()
@@ -88,13 +117,21 @@ class LockDir:
         return self._client.exists(self._path)
 
     def lock(self):
-        if self.is_locked():
+        try:
+            create_exclusive(
+                self._client, self._path, json.dumps({"owner": self._lock_id}).encode()
+            )
+        except FileExistsError:
             raise RFC7807Error.resource_locked()
 
-        self._client.mkdir(self._path, create_parents=True)
-
     def unlock(self):
-        self._client.rm(self._path, recursive=True)
+        try:
+            owner = json.loads(self._client.cat_file(self._path)).get("owner")
+        except FileNotFoundError:
+            return
+        if owner != self._lock_id:
+            raise RFC7807Error.resource_locked("Lock is owned by another owner.")
+        self._client.rm(self._path)
 
     def open(self, path): ...
 
@@ -114,6 +151,30 @@ class StoreBluePrint:
 
     def __init__(self, blueprint: dict):
         self._blueprint = blueprint
+        self._listeners = []
+        self._buffer_pool = None
+        self._buffer_pool_lock = threading.Lock()
+        self._lease_keeper = LeaseKeeper(self.get_lease_ttl() / 3)
+
+    def add_listener(self, listener):
+        """commit / rollback の通知先を登録する。
+
+        listener は on_commit(fs, key, meta) と on_rollback(fs, key) を実装する。
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, event: str, fs: fsspec.AbstractFileSystem, key, *args):
+        """リスナーに通知する。通知は確定した変更の後に行うベストエフォートで、
+        リスナーの例外はログに記録して無視する（コミットを取り消さない）
+        """
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(fs, key, *args)
+            except Exception:
+                logger.exception("Listener %r failed on %s: %s", listener, event, key)
 
     def cleanup(self, fs: fsspec.AbstractFileSystem, token: str):
         for name in fs.ls("", detail=False):
@@ -140,12 +201,80 @@ class StoreBluePrint:
     def get_block_size(self):
         return int(self._blueprint["rules"]["system"]["default_block_size"])
 
+    def get_upload_workers(self):
+        return int(self._blueprint["rules"]["system"].get("upload_workers", 8))
+
+    def get_buffer_pool(self) -> BufferPool:
+        """書き込みで共有するバッファプール（default_block_size × buffer_pool_blocks が上限）"""
+        with self._buffer_pool_lock:
+            if self._buffer_pool is None:
+                blocks = self._blueprint["rules"]["system"].get("buffer_pool_blocks", 16)
+                self._buffer_pool = BufferPool(int(blocks) * self.get_block_size())
+            return self._buffer_pool
+
+    def get_lease_ttl(self):
+        return float(self._blueprint["rules"]["system"].get("lease_ttl", 60.0))
+
+    def get_lease(self, fs: fsspec.AbstractFileSystem, key) -> Lease | None:
+        """このプロセスが保持している key の書き込みロックのリースを返す"""
+        return self._lease_keeper.get((id(fs), key))
+
+    def get_local_path(self, fs: fsspec.AbstractFileSystem, path: str):
+        """ローカルの高速経路が使える場合に OS のパスを返す。それ以外は None"""
+        if not self._blueprint["rules"]["system"].get("local_fast_path", True):
+            return None
+        return get_local_path(fs, path)
+
+    def get_chunks_version(self, version: int = None):
+        if version is None:
+            version = self._blueprint["rules"]["system"].get("chunks_version", 1)
+        return int(version)
+
+    def get_compression(self, compression: str = None):
+        if compression is None:
+            compression = self._blueprint["rules"]["system"].get("compression", NONE)
+        return compression
+
+    def get_pack_threshold(self):
+        return int(self._blueprint["rules"]["system"].get("pack_threshold", 0))
+
+    def get_pack_dir(self):
+        return self.get_chunked_data_path("packs")
+
+    def get_versioning(self):
+        return bool(self._blueprint["rules"]["system"].get("versioning", False))
+
+    def get_version_retention(self):
+        """(残す最新でないバージョンの数, 最新でなくなってから回収するまでの秒数)"""
+        system = self._blueprint["rules"]["system"]
+        return int(system.get("versions_keep", 0)), float(system.get("versions_max_age", 0))
+
+    def get_version_meta_path(self, key, id=""):
+        path = os.path.join(
+            self._blueprint["rules"]["dirs"]["versions"]["meta_dir"], key, id
+        )
+        return path
+
+    def get_version_data_path(self, key, id=""):
+        path = os.path.join(
+            self._blueprint["rules"]["dirs"]["versions"]["data_dir"], key, id
+        )
+        return path
+
     def get_processing_data_path(self, key):
         path = os.path.join(
             self._blueprint["rules"]["dirs"]["processing"]["data_dir"], key
         )
         return path
 
+    def get_staging_path(self, key, id):
+        """書き込み（system.id）ごとのステージングのパス。
+
+        リースを失った書き込みが新しい書き込みのデータを上書きしないよう、
+        processing/data/<key>/<id> に書き込みごとに分ける。
+        """
+        return os.path.join(self.get_processing_data_path(key), id)
+
     def get_processing_meta_path(self, key):
         path = os.path.join(
             self._blueprint["rules"]["dirs"]["processing"]["meta_dir"], key
@@ -164,22 +293,58 @@ class StoreBluePrint:
         )
         return path
 
-    @contextmanager
-    def begin(self, fs: fsspec.AbstractFileSystem, key, usermeta: dict):
-        path = self.get_processing_meta_path(key)
-        if fs.exists(path):
-            raise RFC7807Error.resource_locked()
+    def get_chunked_data_path(self, *parts):
+        path = os.path.join(
+            self._blueprint["rules"]["dirs"]["chunked"]["data_dir"], *parts
+        )
+        return path
+
+    def get_chunked_meta_path(self, *parts):
+        path = os.path.join(
+            self._blueprint["rules"]["dirs"]["chunked"]["meta_dir"], *parts
+        )
+        return path
+
+    def _create_processing_meta(self, fs: fsspec.AbstractFileSystem, key, usermeta):
+        """書き込みロック（processing のメタデータ）をリースとして取得する。
 
+        既存のロックのリースが失効している場合は回収してから取得し直す。
+        """
+        path = self.get_processing_meta_path(key)
         meta = MetaData(user=usermeta).model_dump()
-        with fs.open(path, "w") as f:
-            json.dump(meta, f)
+        # ステージングのパスを書き込みごとに分けるため、取得時に system.id を決める
+        meta["system"]["id"] = uuid7()
+        for retry in (True, False):
+            lease = Lease(fs, path, meta, self.get_lease_ttl())
+            try:
+                lease.acquire()
+                break
+            except FileExistsError:
+                if not (retry and self.reap_lease(fs, key)):
+                    raise RFC7807Error.resource_locked()
+
+        self._lease_keeper.add((id(fs), key), lease)
+        return meta
+
+    @contextmanager
+    def begin(self, fs: fsspec.AbstractFileSystem, key, usermeta: dict):
+        meta = self._create_processing_meta(fs, key, usermeta)
 
         try:
             yield meta
-            self.commit(fs, key, meta)
+            validated = self._publish(fs, key, meta)
         except Exception as e:
             try:
-                self.rollback(fs, key)
+                lease = self.get_lease(fs, key)
+                if lease is not None and not lease.is_owned():
+                    # ロックは既に他の書き込みのものなので、自身のデータとチャンクのみ解放する
+                    self._lease_keeper.pop((id(fs), key))
+                    self._release_chunks(fs, meta)
+                    staging_path = self.get_staging_path(key, meta["system"]["id"])
+                    if fs.exists(staging_path):
+                        fs.rm(staging_path)
+                else:
+                    self.rollback(fs, key)
             except Exception as e2:
                 raise RFC7807Error.internalservererror(
                     extensions={"errors": [e, e2]}
@@ -187,16 +352,64 @@ class StoreBluePrint:
 
             raise
 
+        # 公開したコミットはリスナーの失敗でロールバックしない
+        self._notify("on_commit", fs, key, validated)
+
     def commit(self, fs: fsspec.AbstractFileSystem, key, meta):
+        validated = self._publish(fs, key, meta)
+        self._notify("on_commit", fs, key, validated)
+
+    def _publish(self, fs: fsspec.AbstractFileSystem, key, meta) -> dict:
+        """コミットしてメタデータを公開し、公開したメタデータを返す（リスナーには通知しない）"""
+        # リースの延長を止めてから、ロックを保持していることを確認する（フェンシング）
+        lease = self.get_lease(fs, key)
+        if lease is not None:
+            lease.pause()
+            lease.verify()
+
         validated = MetaData.model_validate(meta).model_dump()
         meta_path = self.get_processing_meta_path(key)
         data_path = self.get_processing_data_path(key)
+        staging_path = self.get_staging_path(key, validated["system"]["id"])
 
         with fs.open(meta_path, "w") as f:
             json.dump(validated, f)
 
-        fs.mv(data_path, self.get_completed_data_path(key))
-        fs.mv(meta_path, self.get_completed_meta_path(key))
+        completed_data_path = self.get_completed_data_path(key)
+        completed_meta_path = self.get_completed_meta_path(key)
+        prev_meta = self._load_meta(fs, completed_meta_path)
+        versioning = self.get_versioning()
+        if versioning and prev_meta is not None:
+            if prev_meta["system"].get("id") != validated["system"]["id"]:
+                self._archive_version(fs, key, prev_meta)
+
+        if get_layout(validated) == "cas":
+            self.get_block_pool(fs).incref(
+                validated["system"]["id"], get_stored_block_hashes(validated)
+            )
+
+        if get_layout(validated) == "file":
+            # 自身の書き込みのデータだけを移動する
+            fs.mv(staging_path, completed_data_path)
+        # チャンク形式で上書きされた場合、旧形式のデータは不要
+        elif fs.exists(completed_data_path):
+            fs.rm(completed_data_path, recursive=True)
+        # 再開可能アップロードの進捗記録や、リースを失った書き込みのデータ
+        if fs.exists(data_path):
+            fs.rm(data_path, recursive=True)
+
+        fs.mv(meta_path, completed_meta_path)
+
+        if versioning:
+            self._record_version(fs, key, validated)
+        # 上書きされた旧バージョンのチャンクを破棄する
+        elif prev_meta is not None:
+            if prev_meta["system"].get("id") != validated["system"]["id"]:
+                self._release_chunks(fs, prev_meta)
+
+        self._lease_keeper.pop((id(fs), key))
+        meta["system"].pop("lease", None)
+        return validated
 
     def rollback(self, fs: fsspec.AbstractFileSystem, key):
         completed_data_path = self.get_completed_data_path(key)
@@ -204,6 +417,27 @@ class StoreBluePrint:
         processing_meta_path = self.get_processing_meta_path(key)
         processing_data_path = self.get_processing_data_path(key)
 
+        # 他の書き込みが有効なリースを保持している場合はロールバックしない
+        lease = self._lease_keeper.pop((id(fs), key))
+        if lease is not None:
+            lease.pause()
+        processing_meta = self._load_meta(fs, processing_meta_path) or {}
+        stored_lease = processing_meta.get("system", {}).get("lease")
+        if stored_lease and not is_expired(stored_lease):
+            if lease is None or stored_lease.get("token") != lease.token:
+                raise RFC7807Error.resource_locked()
+
+        if self.get_versioning():
+            # コミット済みのバージョンは不変のため、書き込み途中の状態だけを破棄する
+            self._discard_processing(fs, key, processing_meta or None)
+            self._restore_current(fs, key)
+            return
+
+        for meta_path in (processing_meta_path, completed_meta_path):
+            meta = self._load_meta(fs, meta_path)
+            if meta is not None:
+                self._release_chunks(fs, meta)
+
         if fs.exists(completed_data_path):
             fs.rm(completed_data_path, recursive=True)
 
@@ -216,6 +450,493 @@ class StoreBluePrint:
         if fs.exists(processing_meta_path):
             fs.rm(processing_meta_path, recursive=True)
 
+        self._notify("on_rollback", fs, key)
+
+    @contextmanager
+    def lock_key(self, fs: fsspec.AbstractFileSystem, key):
+        """書き込みと同じロックでキーを排他し、完了済みのメタデータ（ない場合は None）を渡す。
+
+        書き込み中の場合は resource_locked。完了済みのオブジェクトの更新・削除に使う。
+        """
+        self._create_processing_meta(fs, key, {})
+        try:
+            yield self._load_meta(fs, self.get_completed_meta_path(key))
+        finally:
+            self._release_lock(fs, key)
+
+    def _release_lock(self, fs: fsspec.AbstractFileSystem, key):
+        """lock_key などで取得したロックを、自身のリースの場合のみ解放する"""
+        lease = self._lease_keeper.pop((id(fs), key))
+        lease.pause()
+        if lease.is_owned():
+            fs.rm(lease.path)
+
+    def update_completed_meta(self, fs: fsspec.AbstractFileSystem, key, id, update):
+        """完了済みのメタデータを update(meta) で更新する。
+
+        オブジェクトが上書き・削除されていた（system.id が id と異なる）場合は False。
+        """
+        with self.lock_key(fs, key) as meta:
+            if meta is None or meta["system"].get("id") != id:
+                return False
+            update(meta)
+            validated = MetaData.model_validate(meta).model_dump()
+            fs.pipe_file(
+                self.get_completed_meta_path(key), json.dumps(validated).encode()
+            )
+
+        self._notify("on_commit", fs, key, validated)
+        return True
+
+    def delete(self, fs: fsspec.AbstractFileSystem, key, id=None):
+        """完了済みのオブジェクトを削除する。
+
+        id を指定した場合、system.id が一致する場合のみ削除する。削除した場合は True。
+        """
+        with self.lock_key(fs, key) as meta:
+            if meta is None or (id is not None and meta["system"].get("id") != id):
+                return False
+            if self.get_versioning():
+                # 削除マーカーを残し、過去のバージョンは保持する
+                self._archive_version(fs, key, meta)
+                self._record_version(fs, key, {"system": {"id": uuid7(), "deleted": True}})
+            completed_data_path = self.get_completed_data_path(key)
+            if fs.exists(completed_data_path):
+                fs.rm(completed_data_path, recursive=True)
+            if not self.get_versioning():
+                self._release_chunks(fs, meta)
+            fs.rm(self.get_completed_meta_path(key))
+
+        self._notify("on_rollback", fs, key)
+        return True
+
+    def evict(self, fs: fsspec.AbstractFileSystem, key, id) -> bool:
+        """他の場所にコピーがあるオブジェクト（tiers のホットなど）をこの fs から取り除く。
+
+        delete と異なり削除マーカーを残さず、リスナーにも通知しない。
+        ロックを取得してから system.id が id と一致することを確認し、一致した場合のみ取り除く。
+        versioning が有効な場合、取り除いたオブジェクトはバージョンとして残す。
+        """
+        with self.lock_key(fs, key) as meta:
+            if meta is None or meta["system"].get("id") != id:
+                return False
+            if self.get_versioning():
+                self._archive_version(fs, key, meta)
+            completed_data_path = self.get_completed_data_path(key)
+            if fs.exists(completed_data_path):
+                fs.rm(completed_data_path, recursive=True)
+            if not self.get_versioning():
+                self._release_chunks(fs, meta)
+            fs.rm(self.get_completed_meta_path(key))
+        return True
+
+    # バージョン
+    #
+    # versioning を有効にすると、コミットごとのメタデータを versions/meta/<key>/<id> に
+    # 不変のバージョンとして残す。最新のバージョンは従来どおり completed のメタデータ
+    # （ポインタ）から O(1) で読み込む。上書き・削除された file レイアウトのデータは
+    # versions/data/<key>/<id> に移動し、chunked・cas のチャンクは解放せずに残す。
+    # 削除はマーカー（system.deleted）を残す。古いバージョンは versions_keep・
+    # versions_max_age に従い expire_versions（ガベージコレクタの versions フェーズ）が回収する。
+
+    def _record_version(self, fs: fsspec.AbstractFileSystem, key, meta):
+        """meta をバージョンとして書き込む（既にある場合は何もしない）"""
+        meta_path = self.get_version_meta_path(key, meta["system"]["id"])
+        if fs.exists(meta_path):
+            return
+        fs.makedirs(self.get_version_meta_path(key), exist_ok=True)
+        fs.pipe_file(meta_path, json.dumps(meta).encode())
+
+    def _archive_version(self, fs: fsspec.AbstractFileSystem, key, meta):
+        """最新のバージョン（meta）を上書き・削除の前に退避する"""
+        self._record_version(fs, key, meta)
+        completed_data_path = self.get_completed_data_path(key)
+        if get_layout(meta) == "file" and fs.exists(completed_data_path):
+            fs.makedirs(self.get_version_data_path(key), exist_ok=True)
+            fs.mv(
+                completed_data_path,
+                self.get_version_data_path(key, meta["system"]["id"]),
+            )
+
+    def _restore_current(self, fs: fsspec.AbstractFileSystem, key):
+        """コミットの途中で失敗し、退避したままの最新のバージョンのデータを戻す"""
+        meta = self._load_meta(fs, self.get_completed_meta_path(key))
+        if meta is None or get_layout(meta) != "file":
+            return
+        archived = self.get_version_data_path(key, meta["system"]["id"])
+        completed_data_path = self.get_completed_data_path(key)
+        if not fs.exists(completed_data_path) and fs.exists(archived):
+            fs.mv(archived, completed_data_path)
+
+    def list_versions(self, fs: fsspec.AbstractFileSystem, key) -> list[str]:
+        """key のバージョンの system.id を古い順に返す（削除マーカーを含む）"""
+        root = self.get_version_meta_path(key)
+        names = fs.ls(root, detail=False) if fs.exists(root) else []
+        ids = {path.basename(p) for p in names}
+        current = self._load_meta(fs, self.get_completed_meta_path(key))
+        if current is not None and current["system"].get("id"):
+            ids.add(current["system"]["id"])
+        return sorted(ids)
+
+    def resolve_version(self, fs: fsspec.AbstractFileSystem, key, as_of: float) -> str:
+        """as_of（エポック秒）の時点で最新だったバージョンの system.id を返す。
+
+        uuid7 の id は時刻順に並ぶため、id に埋め込まれた時刻（書き込みの開始時刻）で二分探索する。
+        """
+        ids = self.list_versions(fs, key)
+        index = bisect.bisect_right(ids, as_of, key=to_timestamp)
+        if index == 0:
+            raise RFC7807Error.not_found(key)
+        return ids[index - 1]
+
+    def read_version_meta(self, fs: fsspec.AbstractFileSystem, key, id):
+        """バージョンのメタデータを返す。
+
+        退避された file レイアウトのバージョンは chunks.location に退避先のパスを設定する。
+        """
+        current = self._load_meta(fs, self.get_completed_meta_path(key))
+        if current is not None and current["system"].get("id") == id:
+            return current
+
+        meta = self._load_meta(fs, self.get_version_meta_path(key, id))
+        if meta is None or meta["system"].get("deleted"):
+            raise RFC7807Error.not_found(key)
+        if get_layout(meta) == "file":
+            meta["system"]["chunks"]["location"] = self.get_version_data_path(key, id)
+        return meta
+
+    def open_version(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key,
+        id: str = None,
+        as_of: float = None,
+        verify: bool = False,
+    ):
+        """バージョン（id、または as_of の時点のバージョン）のリーダーを返す"""
+        if id is None:
+            id = self.resolve_version(fs, key, as_of)
+        meta = self.read_version_meta(fs, key, id)
+        if get_layout(meta) == "file" and meta["system"]["chunks"].get("location"):
+            return BlockReader(fs, meta, verify=verify)
+        return self.open_block_reader(fs, key, verify=verify, meta=meta)
+
+    def expire_versions(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key,
+        keep: int = None,
+        max_age: float = None,
+        now: float = None,
+    ) -> int:
+        """保持期間を過ぎた最新でないバージョンをまとめて削除し、削除した数を返す。
+
+        keep は残す最新でないバージョンの数、max_age は最新でなくなってから
+        （次のバージョンの時刻から）の秒数。None の場合は設計図の設定を使い、0 は制限しない。
+        最新のバージョンは回収せず、過去のバージョンが残っていない削除マーカーは削除する。
+        """
+        default_keep, default_max_age = self.get_version_retention()
+        keep = default_keep if keep is None else keep
+        max_age = default_max_age if max_age is None else max_age
+        now = time.time() if now is None else now
+
+        ids = self.list_versions(fs, key)
+        expired = set()
+        # 最新でないバージョンを新しい順に（次のバージョンの時刻 = 最新でなくなった時刻）
+        noncurrent = list(zip(ids[:-1], ids[1:]))[::-1]
+        for rank, (id, next_id) in enumerate(noncurrent):
+            if (keep and keep <= rank) or (
+                max_age and to_timestamp(next_id) + max_age < now
+            ):
+                expired.add(id)
+        if not expired:
+            return 0
+
+        meta_paths = [self.get_version_meta_path(key, id) for id in sorted(expired)]
+        metas = fs.cat(meta_paths, on_error="omit")
+        data_root = self.get_version_data_path(key)
+        names = fs.ls(data_root, detail=False) if fs.exists(data_root) else []
+        archived = {path.basename(p) for p in names}
+        paths = [p for p in meta_paths if p in metas]
+        paths += [self.get_version_data_path(key, id) for id in expired & archived]
+        if paths:
+            fs.rm(paths)
+        for data in metas.values():
+            meta = self._parse_meta(data)
+            if meta is not None and not meta["system"].get("deleted"):
+                self._release_chunks(fs, meta)
+
+        # 削除マーカーだけが残った場合はマーカーも削除する
+        remaining = [id for id in ids if id not in expired]
+        if len(remaining) == 1 and not fs.exists(self.get_completed_meta_path(key)):
+            fs.rm(self.get_version_meta_path(key), recursive=True)
+            if fs.exists(data_root):
+                fs.rm(data_root, recursive=True)
+            expired.add(remaining[0])
+        return len(expired)
+
+    def _load_meta(self, fs: fsspec.AbstractFileSystem, meta_path):
+        """メタデータを読み込む。存在しない・壊れている場合は None を返す"""
+        try:
+            with fs.open(meta_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _parse_meta(self, data):
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return None
+
+    def _write_processing_meta(self, fs: fsspec.AbstractFileSystem, key, meta):
+        lease = self.get_lease(fs, key)
+        if lease is not None:
+            lease.write(meta)
+            return
+        with fs.open(self.get_processing_meta_path(key), "w") as f:
+            json.dump(meta, f)
+
+    def reap_lease(self, fs: fsspec.AbstractFileSystem, key, now: float = None) -> bool:
+        """key のロックのリースが失効していれば、書き込み途中の状態を破棄してロックを解放する。
+
+        ロックがない、または解放した場合は True を返す。
+        """
+        path = self.get_processing_meta_path(key)
+        if not fs.exists(path):
+            return True
+
+        meta = self._load_meta(fs, path) or {}
+        lease = meta.get("system", {}).get("lease")
+        if not is_expired(lease, now):
+            return False
+
+        # 削除の直前に、同じリースのままであることを確認する
+        current = self._load_meta(fs, path) or {}
+        if current.get("system", {}).get("lease") != lease:
+            return False
+
+        self._discard_processing(fs, key, meta)
+        return True
+
+    def _discard_processing(self, fs: fsspec.AbstractFileSystem, key, meta):
+        """書き込み途中の状態（processing のデータ・メタデータとチャンク）を破棄する。
+
+        完了済みのメタデータが同じチャンクを参照している場合、チャンクは解放しない。
+        """
+        completed = self._load_meta(fs, self.get_completed_meta_path(key))
+        system = (meta or {}).get("system", {})
+        if system and (completed is None or completed["system"].get("id") != system.get("id")):
+            self._release_chunks(fs, meta)
+
+        for p in (self.get_processing_data_path(key), self.get_processing_meta_path(key)):
+            if fs.exists(p):
+                fs.rm(p, recursive=True)
+
+    def recover_commit(self, fs: fsspec.AbstractFileSystem, key, meta) -> str:
+        """コミットの途中で停止したキーを修復する。
+
+        データの移動が完了していればコミットを完了させ（"rolled_forward"）、
+        そうでなければ書き込み途中の状態を破棄する（"rolled_back"）。
+        meta はリースを持たず、確定済み（system.hash を持つ）の processing のメタデータ。
+        """
+        validated = MetaData.model_validate(meta).model_dump()
+        layout = get_layout(validated)
+        if layout == "file":
+            info = None
+            staging_path = self.get_staging_path(key, validated["system"]["id"])
+            if not fs.exists(staging_path):
+                try:
+                    info = fs.info(self.get_completed_data_path(key))
+                except FileNotFoundError:
+                    pass
+            complete = info is not None and info["size"] == get_stored_size(validated)
+        else:
+            block_size = int(validated["system"]["chunks"]["block_size"])
+            count = -(-validated["system"]["size"] // block_size)
+            complete = all(
+                fs.exists(get_block_source(validated, index)[0]) for index in range(count)
+            )
+
+        if not complete:
+            self._discard_processing(fs, key, meta)
+            if self.get_versioning():
+                self._restore_current(fs, key)
+            return "rolled_back"
+
+        if layout == "cas":
+            self.get_block_pool(fs).incref(
+                validated["system"]["id"], get_stored_block_hashes(validated)
+            )
+        elif layout == "chunked":
+            if fs.exists(self.get_completed_data_path(key)):
+                fs.rm(self.get_completed_data_path(key), recursive=True)
+        if fs.exists(self.get_processing_data_path(key)):
+            fs.rm(self.get_processing_data_path(key), recursive=True)
+
+        completed_meta_path = self.get_completed_meta_path(key)
+        prev_meta = self._load_meta(fs, completed_meta_path)
+        superseded = (
+            prev_meta is not None
+            and prev_meta["system"].get("id") != validated["system"]["id"]
+        )
+        if self.get_versioning():
+            if superseded:
+                self._record_version(fs, key, prev_meta)
+            fs.mv(self.get_processing_meta_path(key), completed_meta_path)
+            self._record_version(fs, key, validated)
+        else:
+            fs.mv(self.get_processing_meta_path(key), completed_meta_path)
+            if superseded:
+                self._release_chunks(fs, prev_meta)
+
+        self._notify("on_commit", fs, key, validated)
+        return "rolled_forward"
+
+    def reap_expired_leases(self, fs: fsspec.AbstractFileSystem, now: float = None):
+        """リースが失効した全てのロックを回収し、回収したキーを返す"""
+        meta_dir = self.get_processing_meta_path("")
+        reaped = []
+        for p in fs.find(meta_dir):
+            key = p.split(meta_dir, 1)[-1].lstrip("/")
+            meta = self._load_meta(fs, p) or {}
+            if is_expired(meta.get("system", {}).get("lease"), now):
+                if self.reap_lease(fs, key, now):
+                    reaped.append(key)
+        return reaped
+
+    def _release_chunks(self, fs: fsspec.AbstractFileSystem, meta):
+        """メタデータが参照するチャンクを解放する"""
+        layout = get_layout(meta)
+        if layout == "chunked":
+            location = get_chunk_location(meta)
+            if location and fs.exists(location):
+                fs.rm(location, recursive=True)
+        elif layout == "cas" and meta["system"].get("id"):
+            self.get_block_pool(fs).decref(
+                meta["system"]["id"], get_stored_block_hashes(meta)
+            )
+
+    def get_block_pool(self, fs: fsspec.AbstractFileSystem):
+        return BlockPool(
+            fs, self.get_chunked_data_path("blocks"), self.get_chunked_meta_path("blocks")
+        )
+
+    def _finalize_meta(
+        self,
+        meta,
+        algorithm,
+        size,
+        block_size,
+        block_hashes,
+        cumulative_hashes,
+        version: int = 1,
+    ):
+        # 0 size の場合
+        if not cumulative_hashes:
+            hash = BlockHasher(algorithm, version).empty_hash()
+            cumulative_hashes.append(hash)
+            block_hashes.append(hash)
+
+        meta["system"]["id"] = meta["system"].get("id") or uuid7()
+        meta["system"]["size"] = size
+        meta["system"]["hash"] = cumulative_hashes[-1]
+        meta["system"]["chunks"] = {
+            **meta["system"]["chunks"],
+            "block_size": block_size,
+            "block_hashes": block_hashes,  # ブロックごとのハッシュ
+            "cumulative_hashes": cumulative_hashes,  # そのブロック時点の累計ハッシュ
+            "version": version,
+        }
+
+        size = meta["user"].get("size", None)
+        size = meta["system"]["size"] if size is None else size
+
+        hash = meta["user"].get("hash", None)
+        # "algo:" のようにダイジェストが空の場合はアルゴリズムの指定のみとみなす
+        hash = meta["system"]["hash"] if not split_multihash(hash or "")[1] else hash
+
+        if not (size == meta["system"]["size"]):
+            raise RFC7807Error.file_integrity_error("Size mismatch.")
+        if not (hash == meta["system"]["hash"]):
+            raise RFC7807Error.file_integrity_error("Hash mismatch.")
+
+    # @contextmanager
+    def _stage_file(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        file,
+        meta,
+        block_size: int,
+        chunks_version: int = None,
+        compression: str = None,
+    ):
+        """processing にデータを書き込み、メタデータを確定する（コミットはしない）。
+
+        compression を指定した場合、ブロックごとに圧縮して格納し、
+        コーデックと格納サイズを system.chunks に記録する。
+        """
+        hashargs = meta["user"].get("hash", "sha256:").split(":")
+        algorithm = hashargs[0]
+        algorithm = algorithm or "sha256"
+
+        version = self.get_chunks_version(chunks_version)
+        hasher = BlockHasher(algorithm, version)
+        block_hashes = []
+        cumulative_hashes = []
+        size = 0
+
+        compression = self.get_compression(compression)
+        codec = None if compression == AUTO else compression
+        codecs = []
+        compressed_sizes = []
+
+        meta["system"]["id"] = meta["system"].get("id") or uuid7()
+        path = self.get_staging_path(key, meta["system"]["id"])
+        fs.makedirs(os.path.dirname(path), exist_ok=True)
+        local_path = self.get_local_path(fs, path)
+        fileno = get_fileno(file)
+        if local_path is not None and fileno is not None and compression == NONE:
+            # ローカルのファイル同士はカーネル内でコピーする
+            size, block_hashes, cumulative_hashes = stage_local_file(
+                file, fileno, local_path, block_size, hasher
+            )
+            self._finalize_meta(
+                meta, algorithm, size, block_size, block_hashes, cumulative_hashes, version
+            )
+            return
+
+        pool = self.get_buffer_pool()
+        with fs.open(path, "wb") as f, pool.lease(block_size) as buffer:
+            while True:
+                buf = read_block(file, buffer)
+                if not buf:
+                    break
+
+                if codec is None:
+                    # 先頭ブロックを圧縮してみてコーデックを決める
+                    codec = choose_codec(buf)
+                block_codec, data = encode_block(codec, buf)
+                f.write(data)
+                codecs.append(block_codec)
+                compressed_sizes.append(len(data))
+                size += len(buf)
+
+                block_hash = hasher.hash_block(buf)
+                block_hashes.append(block_hash)
+                cumulative_hashes.append(hasher.update(buf, block_hash))
+
+        self._finalize_meta(
+            meta, algorithm, size, block_size, block_hashes, cumulative_hashes, version
+        )
+        # 全てのブロックが無圧縮の場合は記録しない（ローカルの高速経路を利用できる）
+        if any(block_codec != NONE for block_codec in codecs):
+            meta["system"]["chunks"]["codecs"] = codecs
+            meta["system"]["chunks"]["compressed_sizes"] = compressed_sizes
+
     # @contextmanager
     def write_file(
         self,
@@ -224,76 +945,873 @@ class StoreBluePrint:
         file,
         usermeta: dict = {},
         block_size: int = None,
+        chunks_version: int = None,
+        compression: str = None,
+    ):
+        block_size = block_size or self.get_block_size()
+        # 未対応のハッシュアルゴリズム・バージョン・コーデックはロックする前にエラーにする
+        BlockHasher(
+            usermeta.get("hash", "sha256:").split(":")[0] or "sha256",
+            self.get_chunks_version(chunks_version),
+        )
+        validate_compression(self.get_compression(compression))
+
+        with self.begin(fs, key, usermeta) as meta:
+            self._stage_file(
+                fs, key, file, meta, block_size, chunks_version, compression
+            )
+
+        return meta
+
+    def write_many(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        items,
+        block_size: int = None,
+        max_workers: int = None,
+        commit_batch_size: int = 100,
+        chunks_version: int = None,
+        compression: str = None,
     ):
+        """複数のファイルを書き込む。
+
+        items は (key, file, usermeta) のイテラブル。書き込みはスレッドプールで並列に行い、
+        書き込みが完了したものから commit_batch_size 件ずつまとめてコミットする。
+        戻り値はキーごとのメタデータ、または失敗した場合の例外の dict。
+        """
         block_size = block_size or self.get_block_size()
+        max_workers = max_workers or self.get_upload_workers()
+        validate_compression(self.get_compression(compression))
+        threshold = min(self.get_pack_threshold(), block_size)
+        results = {}
+        staged = []
+        packed = {}
+
+        def stage(key, file, usermeta):
+            meta = self._create_processing_meta(fs, key, usermeta)
+            try:
+                self._stage_file(
+                    fs, key, file, meta, block_size, chunks_version, compression
+                )
+            except Exception:
+                self.rollback(fs, key)
+                raise
+            return meta
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            # 同じキーが複数回含まれる場合は 2 回目以降を resource_locked とする
+            seen = set()
+            for key, file, usermeta in items:
+                if key in seen:
+                    results[key] = RFC7807Error.resource_locked(key)
+                    continue
+                seen.add(key)
+
+                if threshold:
+                    # pack_threshold 以下のファイルはパックにまとめて書き込む
+                    head = bytes(read_block(file, bytearray(threshold + 1)))
+                    if len(head) <= threshold:
+                        packed[key] = (key, head, usermeta)
+                        if commit_batch_size <= len(packed):
+                            results.update(
+                                self.write_packed(fs, packed.values(), chunks_version)
+                            )
+                            packed = {}
+                        continue
+                    file = PrefixedReader(head, file)
+
+                futures[executor.submit(stage, key, file, usermeta)] = key
+
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    staged.append((key, future.result()))
+                except Exception as e:
+                    results[key] = e
+
+                if commit_batch_size <= len(staged):
+                    results.update(self.commit_many(fs, staged))
+                    staged = []
+
+        if staged:
+            results.update(self.commit_many(fs, staged))
+        if packed:
+            results.update(self.write_packed(fs, packed.values(), chunks_version))
+        return results
+
+    def write_packed(self, fs: fsspec.AbstractFileSystem, items, chunks_version=None):
+        """小さなオブジェクトを 1 つのパックセグメントにまとめて書き込み、一括でコミットする。
+
+        items は (key, data, usermeta) のイテラブルで、data は block_size 以下の bytes。
+        セグメント（chunked/data/packs/<uuid7>）を 1 回の書き込みで作成した後、
+        完了済みのメタデータを一括で書き込む。データは processing を経由しないが、
+        キーごとに書き込みと同じロックを取得して公開まで保持するため、
+        書き込み中のキーは resource_locked になる。
+        versioning が有効な場合、上書きされるバージョンは commit と同様に退避する。
+        戻り値はキーごとのメタデータ、または失敗した場合の例外の dict。
+        セグメントは参照がなくなるとガベージコレクタが回収し、疎になったものは
+        pack.compact で詰め直す。
+        """
+        items = list(items)
+        version = self.get_chunks_version(chunks_version)
+        block_size = self.get_block_size()
+        segment = os.path.join(self.get_pack_dir(), uuid7())
+        results = {}
+        metas = {}
+        parts = []
+        offset = 0
+        for key, data, usermeta in items:
+            if key in metas or key in results:
+                results[key] = RFC7807Error.resource_locked(key)
+                continue
+            if block_size < len(data):
+                results[key] = RFC7807Error.unprocessableEntity(
+                    f"Too large to pack: {len(data)} bytes."
+                )
+                continue
+
+            algorithm = usermeta.get("hash", "sha256:").split(":")[0] or "sha256"
+            meta = MetaData(user=usermeta).model_dump()
+            try:
+                hasher = BlockHasher(algorithm, version)
+                block_hashes = []
+                cumulative_hashes = []
+                if data:
+                    block_hash = hasher.hash_block(data)
+                    block_hashes.append(block_hash)
+                    cumulative_hashes.append(hasher.update(data, block_hash))
+                self._finalize_meta(
+                    meta,
+                    algorithm,
+                    len(data),
+                    block_size,
+                    block_hashes,
+                    cumulative_hashes,
+                    version,
+                )
+            except Exception as e:
+                results[key] = e
+                continue
+
+            meta["system"]["chunks"]["layout"] = "pack"
+            meta["system"]["chunks"]["location"] = segment
+            meta["system"]["chunks"]["offset"] = offset
+            metas[key] = MetaData.model_validate(meta).model_dump()
+            parts.append(data)
+            offset += len(data)
+
+        # 書き込みと同じロックをキーごとに取得し、公開が終わるまで保持する
+        leases = {}
+        for key in list(metas):
+            try:
+                self._create_processing_meta(fs, key, {})
+            except RFC7807Error as e:
+                results[key] = e
+                del metas[key]
+                continue
+            leases[key] = self.get_lease(fs, key)
+
+        try:
+            self._publish_packed(fs, segment, parts, metas, leases, results)
+        finally:
+            for key in leases:
+                self._release_lock(fs, key)
+
+        for key, meta in metas.items():
+            self._notify("on_commit", fs, key, meta)
+        results.update(metas)
+        return results
+
+    def _publish_packed(
+        self, fs: fsspec.AbstractFileSystem, segment, parts, metas, leases, results
+    ):
+        """write_packed のセグメントを書き込み、ロックを保持しているキーのメタデータを公開する"""
+        # リースの延長を止めてから、ロックを保持していることを確認する（フェンシング）
+        for key, lease in leases.items():
+            lease.pause()
+            try:
+                lease.verify()
+            except RFC7807Error as e:
+                results[key] = e
+                del metas[key]
+        if not metas:
+            return
+
+        completed_meta_paths = {key: self.get_completed_meta_path(key) for key in metas}
+        contents = fs.cat(list(completed_meta_paths.values()), on_error="omit")
+        prev_metas = {
+            key: self._parse_meta(contents.get(meta_path))
+            for key, meta_path in completed_meta_paths.items()
+        }
+        versioning = self.get_versioning()
+        if versioning:
+            for key, prev_meta in prev_metas.items():
+                if prev_meta is not None:
+                    self._archive_version(fs, key, prev_meta)
+
+        # セグメントを書き込んでからメタデータを公開する
+        fs.makedirs(self.get_pack_dir(), exist_ok=True)
+        fs.pipe_file(segment, b"".join(parts))
+        fs.pipe(
+            {
+                completed_meta_paths[key]: json.dumps(meta).encode()
+                for key, meta in metas.items()
+            }
+        )
+
+        if versioning:
+            for key, meta in metas.items():
+                self._record_version(fs, key, meta)
+        else:
+            # 上書きされた旧バージョンのデータを破棄する
+            stale = []
+            for key, prev_meta in prev_metas.items():
+                if prev_meta is None:
+                    continue
+                if get_layout(prev_meta) == "file":
+                    stale.append(self.get_completed_data_path(key))
+                else:
+                    self._release_chunks(fs, prev_meta)
+            stale = [p for p in stale if fs.exists(p)]
+            if stale:
+                fs.rm(stale)
+
+    def commit_many(self, fs: fsspec.AbstractFileSystem, items):
+        """(key, meta) のリストをまとめてコミットする。
+
+        メタデータの書き込みと mv は fsspec の一括操作で行う。
+        一括操作に失敗した場合はキーごとにコミットし、結果をキーごとに返す。
+        """
+        items = [(key, MetaData.model_validate(meta).model_dump()) for key, meta in items]
+        if self.get_versioning() or any(get_layout(meta) != "file" for _, meta in items):
+            return self._commit_each(fs, items)
+
+        keys = [key for key, _ in items]
+        completed_meta_paths = [self.get_completed_meta_path(key) for key in keys]
+        try:
+            for key in keys:
+                lease = self.get_lease(fs, key)
+                if lease is not None:
+                    lease.pause()
+                    lease.verify()
+            prev_metas = fs.cat(completed_meta_paths, on_error="omit")
+            fs.pipe(
+                {
+                    self.get_processing_meta_path(key): json.dumps(meta).encode()
+                    for key, meta in items
+                }
+            )
+            mv_many(
+                fs,
+                [self.get_staging_path(key, meta["system"]["id"]) for key, meta in items],
+                [self.get_completed_data_path(key) for key in keys],
+            )
+            mv_many(
+                fs,
+                [self.get_processing_meta_path(key) for key in keys],
+                completed_meta_paths,
+            )
+        except Exception:
+            return self._commit_each(fs, items)
+
+        # ステージングのディレクトリ（リースを失った書き込みのデータを含む）を削除する
+        data_paths = [self.get_processing_data_path(key) for key in keys]
+        data_paths = [p for p in data_paths if fs.exists(p)]
+        if data_paths:
+            fs.rm(data_paths, recursive=True)
+
+        results = {}
+        for (key, meta), meta_path in zip(items, completed_meta_paths):
+            self._lease_keeper.pop((id(fs), key))
+            prev_meta = self._parse_meta(prev_metas.get(meta_path))
+            if prev_meta is not None and prev_meta["system"].get("id") != meta["system"]["id"]:
+                self._release_chunks(fs, prev_meta)
+            self._notify("on_commit", fs, key, meta)
+            results[key] = meta
+        return results
+
+    def _commit_each(self, fs: fsspec.AbstractFileSystem, items):
+        results = {}
+        for key, meta in items:
+            try:
+                self.commit(fs, key, meta)
+                results[key] = meta
+            except Exception as e:
+                try:
+                    self.rollback(fs, key)
+                except Exception:
+                    pass
+                results[key] = e
+        return results
+
+    def write_file_chunked(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        file,
+        usermeta: dict = {},
+        block_size: int = None,
+        max_workers: int = None,
+        dedup: bool = False,
+        chunks_version: int = None,
+    ):
+        """ブロックを個別のチャンクオブジェクトとして並列に書き込む。
+
+        ブロックごとのハッシュと書き込みはスレッドプールで並列に行い、
+        累計ハッシュは読み込み順に計算する。全チャンクの書き込み完了後にコミットする。
+        chunks_version=2 の場合、累計ハッシュはブロックハッシュから求めるため、
+        各バイトのハッシュ計算はワーカーでの 1 回のみになる。
+
+        dedup=True の場合、ブロックはハッシュをキーとするブロックプールに格納され、
+        既に存在するブロックは書き込まない。重複排除の結果は system.chunks.dedup に記録する。
+        """
+        block_size = block_size or self.get_block_size()
+        max_workers = max_workers or self.get_upload_workers()
         hashargs = usermeta.get("hash", "sha256:").split(":")
         algorithm = hashargs[0]
         algorithm = algorithm or "sha256"
 
-        hashcls = get_hash_cls(algorithm)
-        cumulative_hashe = hashcls()
+        version = self.get_chunks_version(chunks_version)
+        hasher = BlockHasher(algorithm, version)
         block_hashes = []
         cumulative_hashes = []
         size = 0
 
-        path = self.get_processing_data_path(key)
+        id = uuid7()
+        pool = self.get_block_pool(fs)
+        location = pool.data_dir if dedup else self.get_chunked_data_path(id)
+        uploaded = []
+        # 書き込み中に参照を追加したブロック（失敗時に解放する）
+        pinned = []
+
+        buffers = self.get_buffer_pool()
+
+        def put_block(index, buf):
+            block_hash = hasher.hash_block(buf)
+            if dedup:
+                pinned.append(block_hash)
+                if pool.put(block_hash, buf, ref_id=id):
+                    uploaded.append(index)
+            else:
+                with fs.open(os.path.join(location, chunk_name(index)), "wb") as f:
+                    f.write(buf)
+            return block_hash
 
         with self.begin(fs, key, usermeta) as meta:
-            with fs.open(path, "wb") as f:
-                while True:
-                    buf = file.read(block_size)
-                    if not buf:
-                        break
+            meta["system"]["id"] = id
+            meta["system"]["chunks"]["layout"] = "cas" if dedup else "chunked"
+            meta["system"]["chunks"]["location"] = location
+            # 中断時にチャンクを回収できるよう、書き込み前に格納先を記録する
+            self._write_processing_meta(fs, key, meta)
+            fs.makedirs(location, exist_ok=True)
+
+            # 読み込み済みで未完了のブロック数を制限し、メモリ使用量を抑える
+            inflight = threading.BoundedSemaphore(max_workers * 2)
+            errors = []
+            futures = []
+
+            def on_done(future, buffer):
+                if not future.cancelled() and future.exception() is not None:
+                    errors.append(future.exception())
+                buffers.release(buffer)
+                inflight.release()
 
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    try:
+                        while True:
+                            inflight.acquire()
+                            if errors:
+                                raise errors[0]
+
+                            # バッファはブロックの書き込み完了時にプールへ返却する
+                            buffer = buffers.acquire(block_size)
+                            try:
+                                buf = read_block(file, buffer)
+                            except BaseException:
+                                buffers.release(buffer)
+                                raise
+                            if not buf:
+                                buffers.release(buffer)
+                                break
+
+                            future = executor.submit(put_block, len(futures), buf)
+                            future.add_done_callback(
+                                lambda future, buffer=buffer: on_done(future, buffer)
+                            )
+                            futures.append(future)
+                            size += len(buf)
+
+                            if hasher.needs_bytes:
+                                cumulative_hashes.append(hasher.update(buf))
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+                block_hashes = [future.result() for future in futures]
+            except BaseException:
+                # 失敗した書き込みが追加した参照を解放する（ワーカーの終了後）
+                if pinned:
+                    pool.decref(id, pinned)
+                raise
+            if not hasher.needs_bytes:
+                cumulative_hashes = chain_hashes(block_hashes)
+            self._finalize_meta(
+                meta,
+                algorithm,
+                size,
+                block_size,
+                block_hashes,
+                cumulative_hashes,
+                version,
+            )
+            if dedup:
+                blocks = len(futures)
+                reused = blocks - len(uploaded)
+                meta["system"]["chunks"]["dedup"] = {
+                    "blocks": blocks,
+                    "reused": reused,
+                    "ratio": reused / blocks if blocks else 0.0,
+                }
+
+        return meta
+
+    def prefer_chunked_read(self):
+        return bool(self._blueprint["rules"]["system"].get("prefer_chunked_read", False))
+
+    def get_upload_progress(self, fs: fsspec.AbstractFileSystem, key: str):
+        """再開可能アップロードの、先頭から連続して永続化済みのブロックの記録を返す"""
+        records = self._load_part_records(fs, key)
+        progress = []
+        while len(progress) in records:
+            progress.append(records[len(progress)])
+        return progress
+
+    def _load_part_records(self, fs: fsspec.AbstractFileSystem, key: str):
+        """processing/data/<key>/ に記録されたブロックの記録を、ブロック番号の dict で返す"""
+        progress_dir = self.get_processing_data_path(key)
+        if not fs.exists(progress_dir):
+            return {}
+
+        names = fs.ls(progress_dir, detail=False)
+        records = fs.cat(names) if names else {}
+        return {int(os.path.basename(name)): json.loads(records[name]) for name in names}
+
+    def get_upload_status(self, fs: fsspec.AbstractFileSystem, key: str):
+        meta = self._load_meta(fs, self.get_processing_meta_path(key))
+        if meta is None or not meta["system"].get("upload", {}).get("resumable"):
+            raise RFC7807Error.not_found()
+
+        progress = self.get_upload_progress(fs, key)
+        return {
+            "key": key,
+            "id": meta["system"]["id"],
+            "block_size": meta["system"]["chunks"]["block_size"],
+            "durable_blocks": len(progress),
+            "durable_size": sum(record["size"] for record in progress),
+            "cumulative_hash": progress[-1]["cumulative_hash"] if progress else None,
+        }
+
+    def abort_upload(self, fs: fsspec.AbstractFileSystem, key: str):
+        self.get_upload_status(fs, key)
+        self.rollback(fs, key)
+
+    def write_file_resumable(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        file,
+        usermeta: dict = {},
+        block_size: int = None,
+        chunks_version: int = None,
+    ):
+        """中断しても途中から再開できる書き込み。
+
+        ブロックごとにチャンクを書き込んだ後、processing/data/<key>/ に進捗を記録する。
+        中断された書き込みを再開する場合、送信済みの範囲をクライアント側で再度ハッシュし、
+        記録と一致した最後のブロックから累計ハッシュの状態と書き込みを再開する。
+        chunks_version=2 の場合、累計ハッシュの状態は記録から復元できるため、
+        送信済みの範囲はブロックハッシュの照合のみになる。
+        失敗しても processing の状態は残すため、破棄する場合は abort_upload を呼ぶ。
+        """
+        processing_meta_path = self.get_processing_meta_path(key)
+        self.reap_lease(fs, key)
+        meta = self._load_meta(fs, processing_meta_path)
+        if meta is None:
+            block_size = block_size or self.get_block_size()
+            hashargs = usermeta.get("hash", "sha256:").split(":")
+            algorithm = hashargs[0] or "sha256"
+            version = self.get_chunks_version(chunks_version)
+            BlockHasher(algorithm, version)
+
+            id = uuid7()
+            meta = MetaData(user=usermeta).model_dump()
+            meta["system"]["id"] = id
+            meta["system"]["upload"] = {"resumable": True, "algorithm": algorithm}
+            meta["system"]["chunks"]["block_size"] = block_size
+            meta["system"]["chunks"]["version"] = version
+            meta["system"]["chunks"]["layout"] = "chunked"
+            meta["system"]["chunks"]["location"] = self.get_chunked_data_path(id)
+            with fs.open(processing_meta_path, "x") as f:
+                json.dump(meta, f)
+        elif not meta["system"].get("upload", {}).get("resumable"):
+            raise RFC7807Error.resource_locked()
+
+        algorithm = meta["system"]["upload"]["algorithm"]
+        version = int(meta["system"]["chunks"].get("version", 1))
+        block_size = int(meta["system"]["chunks"]["block_size"])
+        location = meta["system"]["chunks"]["location"]
+        progress_dir = self.get_processing_data_path(key)
+        fs.makedirs(location, exist_ok=True)
+        fs.makedirs(progress_dir, exist_ok=True)
+
+        hasher = BlockHasher(algorithm, version)
+        block_hashes = []
+        cumulative_hashes = []
+        size = 0
+
+        buffer_pool = self.get_buffer_pool()
+        with buffer_pool.lease(block_size) as buffer:
+            # 送信済みの範囲を再検証し、累計ハッシュの状態を復元する
+            pending = None
+            progress = self.get_upload_progress(fs, key)
+            for index, record in enumerate(progress):
+                buf = read_block(file, buffer)
+                block_hash = hasher.hash_block(buf)
+                if block_hash != record["block_hash"]:
+                    # 一致しなかったブロック以降は再送する
+                    stale = [
+                        os.path.join(progress_dir, chunk_name(i))
+                        for i in range(index, len(progress))
+                    ]
+                    fs.rm(stale)
+                    pending = buf
+                    break
+
+                if hasher.needs_bytes:
+                    hasher.update(buf)
+                block_hashes.append(block_hash)
+                cumulative_hashes.append(record["cumulative_hash"])
+                size += len(buf)
+
+            if cumulative_hashes:
+                if version == 2:
+                    if chain_hashes(block_hashes) != cumulative_hashes:
+                        raise RFC7807Error.file_integrity_error("Resume state mismatch.")
+                    hasher.restore(cumulative_hashes[-1])
+                elif hasher.update(b"") != cumulative_hashes[-1]:
+                    raise RFC7807Error.file_integrity_error("Resume state mismatch.")
+
+            while True:
+                buf = pending if pending is not None else read_block(file, buffer)
+                pending = None
+                if not buf:
+                    break
+
+                index = len(block_hashes)
+                with fs.open(os.path.join(location, chunk_name(index)), "wb") as f:
                     f.write(buf)
-                    size += len(buf)
-
-                    hashobj = hashcls()
-                    hashobj.update(buf)
-                    hash = hashobj.hexdigest()
-                    block_hashes.append(algorithm + ":" + hash)
-
-                    cumulative_hashe.update(buf)
-                    hash = cumulative_hashe.hexdigest()
-                    cumulative_hashes.append(algorithm + ":" + hash)
-
-                # 0 size の場合
-                if not cumulative_hashes:
-                    hash = cumulative_hashe.hexdigest()
-                    cumulative_hashes.append(algorithm + ":" + hash)
-                    block_hashes.append(algorithm + ":" + hash)
-
-            meta["system"]["id"] = uuid7()
-            meta["system"]["size"] = size
-            meta["system"]["hash"] = cumulative_hashes[-1]
-            meta["system"]["chunks"] = {
-                "block_size": block_size,
-                "block_hashes": block_hashes,  # ブロックごとのハッシュ
-                "cumulative_hashes": cumulative_hashes,  # そのブロック時点の累計ハッシュ
-            }
+                size += len(buf)
+
+                block_hash = hasher.hash_block(buf)
+                block_hashes.append(block_hash)
+                cumulative_hashes.append(hasher.update(buf, block_hash))
+
+                # チャンクの書き込み後に進捗を記録する（記録済みのブロックは永続化済み）
+                record = {
+                    "size": len(buf),
+                    "block_hash": block_hash,
+                    "cumulative_hash": cumulative_hashes[-1],
+                }
+                with fs.open(os.path.join(progress_dir, chunk_name(index)), "w") as f:
+                    json.dump(record, f)
+
+        # 以前の試行で書き込まれた余分なチャンクを削除する
+        names = {chunk_name(i) for i in range(len(block_hashes))}
+        stale = [p for p in fs.ls(location, detail=False) if os.path.basename(p) not in names]
+        if stale:
+            fs.rm(stale)
+
+        meta["system"].pop("upload")
+        self._finalize_meta(
+            meta, algorithm, size, block_size, block_hashes, cumulative_hashes, version
+        )
+        self.commit(fs, key, meta)
+        return meta
+
+    def create_multipart_upload(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        usermeta: dict = {},
+        block_size: int = None,
+        chunks_version: int = None,
+    ):
+        """パートごとに並列にアップロードするマルチパートアップロードを開始する。
 
-            size = meta["user"].get("size", None)
-            size = meta["system"]["size"] if size is None else size
+        パートはブロックと同じ単位（最後のパート以外は block_size）で、
+        upload_part で任意の順序・並列に書き込み、complete_multipart_upload で
+        チャンクテーブルを組み立ててコミットする。中止する場合は abort_multipart_upload を呼ぶ。
+        """
+        self.reap_lease(fs, key)
+        block_size = block_size or self.get_block_size()
+        algorithm = usermeta.get("hash", "sha256:").split(":")[0] or "sha256"
+        version = self.get_chunks_version(chunks_version)
+        BlockHasher(algorithm, version)
+
+        id = uuid7()
+        meta = MetaData(user=usermeta).model_dump()
+        meta["system"]["id"] = id
+        meta["system"]["upload"] = {"multipart": True, "algorithm": algorithm}
+        meta["system"]["chunks"]["block_size"] = block_size
+        meta["system"]["chunks"]["version"] = version
+        meta["system"]["chunks"]["layout"] = "chunked"
+        meta["system"]["chunks"]["location"] = self.get_chunked_data_path(id)
+        try:
+            create_exclusive(
+                fs, self.get_processing_meta_path(key), json.dumps(meta).encode()
+            )
+        except FileExistsError:
+            raise RFC7807Error.resource_locked()
+        fs.makedirs(meta["system"]["chunks"]["location"], exist_ok=True)
+        fs.makedirs(self.get_processing_data_path(key), exist_ok=True)
+
+        return {
+            "key": key,
+            "upload_id": id,
+            "algorithm": algorithm,
+            "block_size": block_size,
+            "version": version,
+        }
+
+    def _load_multipart_upload(
+        self, fs: fsspec.AbstractFileSystem, key: str, upload_id: str
+    ):
+        meta = self._load_meta(fs, self.get_processing_meta_path(key))
+        if (
+            meta is None
+            or not meta["system"].get("upload", {}).get("multipart")
+            or meta["system"]["id"] != upload_id
+        ):
+            raise RFC7807Error.not_found(f"Upload not found: {key}")
+        return meta
 
-            hash = meta["user"].get("hash", None)
-            hash = meta["system"]["hash"] if not hash else hash
+    def upload_part(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        upload_id: str,
+        index: int,
+        file,
+        block_hash: str = None,
+    ):
+        """パート index を書き込み、記録を返す。
+
+        block_hash を指定した場合、受信したパートのハッシュと一致しなければエラーにする。
+        同じ index を再送した場合は上書きする。
+        """
+        meta = self._load_multipart_upload(fs, key, upload_id)
+        algorithm = meta["system"]["upload"]["algorithm"]
+        block_size = int(meta["system"]["chunks"]["block_size"])
+        location = meta["system"]["chunks"]["location"]
+        if index < 0:
+            raise RFC7807Error.unprocessableEntity(f"Invalid part number: {index}")
+
+        with self.get_buffer_pool().lease(block_size) as buffer:
+            buf = read_block(file, buffer)
+            if file.read(1):
+                raise RFC7807Error.unprocessableEntity(
+                    f"Part is larger than the block size {block_size}."
+                )
+
+            hash = BlockHasher(algorithm).hash_block(buf)
+            if block_hash is not None and block_hash != hash:
+                raise RFC7807Error.file_integrity_error("Part hash mismatch.")
+
+            with fs.open(os.path.join(location, chunk_name(index)), "wb") as f:
+                f.write(buf)
+
+        # チャンクの書き込み後に記録する（記録済みのパートは永続化済み）
+        record = {"size": len(buf), "block_hash": hash}
+        progress_dir = self.get_processing_data_path(key)
+        with fs.open(os.path.join(progress_dir, chunk_name(index)), "w") as f:
+            json.dump(record, f)
+        return {"index": index, **record}
+
+    def list_parts(self, fs: fsspec.AbstractFileSystem, key: str, upload_id: str):
+        meta = self._load_multipart_upload(fs, key, upload_id)
+        records = self._load_part_records(fs, key)
+        return {
+            "key": key,
+            "upload_id": upload_id,
+            "block_size": meta["system"]["chunks"]["block_size"],
+            "parts": [{"index": i, **records[i]} for i in sorted(records)],
+        }
+
+    def complete_multipart_upload(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        upload_id: str,
+        parts: list[str] = None,
+    ):
+        """アップロード済みのパートからチャンクテーブルを組み立ててコミットする。
+
+        parts はクライアントが送信したパートのハッシュの一覧で、指定した場合は記録と照合する。
+        パートは 0 から連続し、最後以外は block_size でなければならない。
+        失敗した場合も状態は残すため、パートを再送して再度完了するか中止する。
+        """
+        meta = self._load_multipart_upload(fs, key, upload_id)
+        algorithm = meta["system"]["upload"]["algorithm"]
+        version = int(meta["system"]["chunks"].get("version", 1))
+        block_size = int(meta["system"]["chunks"]["block_size"])
+        location = meta["system"]["chunks"]["location"]
+
+        records = self._load_part_records(fs, key)
+        count = len(records)
+        if set(records) != set(range(count)):
+            missing = sorted(set(range(max(records) + 1)) - set(records))
+            raise RFC7807Error.unprocessableEntity(f"Missing parts: {missing}")
+        if any(records[i]["size"] != block_size for i in range(count - 1)):
+            raise RFC7807Error.unprocessableEntity(
+                f"Only the last part may be smaller than the block size {block_size}."
+            )
+
+        block_hashes = [records[i]["block_hash"] for i in range(count)]
+        if parts is not None and list(parts) != block_hashes:
+            raise RFC7807Error.file_integrity_error("Part list mismatch.")
+
+        hasher = BlockHasher(algorithm, version)
+        if hasher.needs_bytes:
+            # version 1 の累計ハッシュはバイト列から求めるため、チャンクを順に読み込む
+            cumulative_hashes = [
+                hasher.update(fs.cat_file(os.path.join(location, chunk_name(i))))
+                for i in range(count)
+            ]
+        else:
+            cumulative_hashes = chain_hashes(block_hashes)
+
+        # 完了に含まれない（範囲外に送信された）チャンクを削除する
+        names = {chunk_name(i) for i in range(count)}
+        stale = [p for p in fs.ls(location, detail=False) if os.path.basename(p) not in names]
+        if stale:
+            fs.rm(stale)
+
+        meta["system"].pop("upload")
+        size = sum(record["size"] for record in records.values())
+        self._finalize_meta(
+            meta, algorithm, size, block_size, block_hashes, cumulative_hashes, version
+        )
+        self.commit(fs, key, meta)
+        return meta
 
-            if not (size == meta["system"]["size"]):
-                raise RFC7807Error.file_integrity_error("Size mismatch.")
-            if not (hash == meta["system"]["hash"]):
-                raise RFC7807Error.file_integrity_error("Hash mismatch.")
+    def abort_multipart_upload(
+        self, fs: fsspec.AbstractFileSystem, key: str, upload_id: str
+    ):
+        """マルチパートアップロードを中止する（完了済みのオブジェクトは残す）"""
+        meta = self._load_multipart_upload(fs, key, upload_id)
+        self._discard_processing(fs, key, meta)
 
-    def open(self, fs: fsspec.AbstractFileSystem, key: str, mode: str = "rb"):
+    def open_block_reader(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        verify: bool = False,
+        prefetch: int = 2,
+        meta: dict = None,
+    ):
+        """チャンクテーブルを利用してブロック単位で読み込むリーダーを返す"""
+        if meta is None:
+            processing_meta_path = self.get_processing_meta_path(key)
+            if fs.exists(processing_meta_path):
+                raise RFC7807Error.resource_locked()
+
+            meta = self._load_meta(fs, self.get_completed_meta_path(key))
+            if meta is None:
+                raise RFC7807Error.not_found()
+
+        local_path = self.get_local_data_path(fs, key, meta)
+        if local_path is not None:
+            return MmapBlockReader(local_path, meta, verify=verify)
+
+        return BlockReader(
+            fs,
+            meta,
+            self.get_completed_data_path(key),
+            verify=verify,
+            prefetch=prefetch,
+        )
+
+    def open(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        mode: str = "rb",
+        verify: bool = False,
+        meta: dict = None,
+    ):
+        """meta を渡した場合、ロックの確認とメタデータの読み込みを省略する"""
         if mode not in {"rb", "r"}:
             raise RFC7807Error.internalservererror()
 
-        processing_meta_path = self.get_processing_meta_path(key)
-        if fs.exists(processing_meta_path):
-            raise RFC7807Error.resource_locked()
+        if meta is None:
+            processing_meta_path = self.get_processing_meta_path(key)
+            if fs.exists(processing_meta_path):
+                raise RFC7807Error.resource_locked()
+            meta = self._load_meta(fs, self.get_completed_meta_path(key))
 
         completed_data_path = self.get_completed_data_path(key)
+        if meta is not None and meta["system"].get("size") is not None:
+            local_path = self.get_local_data_path(fs, key, meta)
+            if local_path is not None:
+                raw = MmapBlockReader(local_path, meta, verify=verify)
+                return raw if mode == "rb" else io.TextIOWrapper(io.BufferedReader(raw))
+
+            if (
+                verify
+                or self.prefer_chunked_read()
+                or get_layout(meta) != "file"
+                or is_compressed(meta)
+            ):
+                raw = BlockReader(fs, meta, completed_data_path, verify=verify)
+                reader = io.BufferedReader(
+                    raw, buffer_size=meta["system"]["chunks"]["block_size"]
+                )
+                return reader if mode == "rb" else io.TextIOWrapper(reader)
+
         return fs.open(completed_data_path, mode=mode)
 
+    def get_local_data_path(
+        self, fs: fsspec.AbstractFileSystem, key: str, meta: dict = None
+    ):
+        """完了済みデータがローカルの単一ファイルの場合に OS のパスを返す。
+
+        HTTP 層などで sendfile によるゼロコピーの応答に利用する。
+        それ以外（圧縮されている場合を含む）は None。
+        """
+        if meta is None:
+            meta = self.read_meta(fs, key)
+        if get_layout(meta) != "file" or meta["system"].get("size") is None:
+            return None
+        if is_compressed(meta):
+            return None
+        return self.get_local_path(fs, self.get_completed_data_path(key))
+
+    def read_range(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        key: str,
+        offset: int,
+        length: int,
+        verify: bool = False,
+        meta: dict = None,
+    ) -> bytes:
+        reader = self.open_block_reader(fs, key, verify=verify, prefetch=0, meta=meta)
+        with reader:
+            return reader.read_range(offset, length)
+
     def read_meta(self, fs: fsspec.AbstractFileSystem, key: str):
         processing_meta_path = self.get_processing_meta_path(key)
         if fs.exists(processing_meta_path):
@@ -305,11 +1823,115 @@ class StoreBluePrint:
 
         return meta
 
+    def _get_locked_keys(self, fs: fsspec.AbstractFileSystem, keys):
+        """keys のうち書き込み中のものを返す（processing/meta を一度だけ一覧する）"""
+        meta_dir = self.get_processing_meta_path("")
+        locked = set()
+        for p in fs.find(meta_dir):
+            locked.add(p.split(meta_dir, 1)[-1].lstrip("/"))
+        return locked & set(keys)
+
+    def read_meta_many(self, fs: fsspec.AbstractFileSystem, keys):
+        """複数キーのメタデータを一括で読み込む。失敗したキーは例外を値とする"""
+        keys = list(dict.fromkeys(keys))
+        locked = self._get_locked_keys(fs, keys)
+        paths = {
+            self.get_completed_meta_path(key): key for key in keys if key not in locked
+        }
+        contents = fs.cat(list(paths), on_error="return") if paths else {}
+
+        results = {key: RFC7807Error.resource_locked(key) for key in locked}
+        for p, key in paths.items():
+            data = contents.get(p)
+            if data is None or isinstance(data, FileNotFoundError):
+                results[key] = RFC7807Error.not_found(key)
+            elif isinstance(data, Exception):
+                results[key] = data
+            else:
+                meta = self._parse_meta(data)
+                results[key] = (
+                    meta
+                    if meta is not None
+                    else RFC7807Error.jsondecodeerror(key)
+                )
+        return {key: results[key] for key in keys}
+
+    def open_many(self, fs: fsspec.AbstractFileSystem, keys, mode: str = "rb"):
+        """複数キーを開く。メタデータは一括で読み込み、キーごとの確認を省略する"""
+        results = {}
+        for key, meta in self.read_meta_many(fs, keys).items():
+            if isinstance(meta, Exception):
+                results[key] = meta
+                continue
+            try:
+                results[key] = self.open(fs, key, mode=mode, meta=meta)
+            except Exception as e:
+                results[key] = e
+        return results
+
+    def read_many(self, fs: fsspec.AbstractFileSystem, keys):
+        """複数キーの内容を一括で読み込む。
+
+        単一ファイル形式のデータは fs.cat で、パックのデータは fs.cat_ranges でまとめて取得する。
+        """
+        results = {}
+        paths = {}
+        packed = {}
+        for key, meta in self.read_meta_many(fs, keys).items():
+            if isinstance(meta, Exception):
+                results[key] = meta
+            elif get_layout(meta) == "file" and not is_compressed(meta):
+                paths[self.get_completed_data_path(key)] = key
+            elif get_layout(meta) == "pack":
+                packed[key] = meta
+            else:
+                try:
+                    with self.open_block_reader(fs, key, meta=meta) as reader:
+                        results[key] = reader.readall()
+                except Exception as e:
+                    results[key] = e
+
+        contents = fs.cat(list(paths), on_error="return") if paths else {}
+        for p, key in paths.items():
+            data = contents.get(p)
+            if data is None or isinstance(data, FileNotFoundError):
+                results[key] = RFC7807Error.not_found(key)
+            else:
+                results[key] = data
+
+        if packed:
+            # パックのオブジェクトは fs.cat_ranges でまとめて範囲読み込みする
+            sources = [get_block_source(meta, 0) for meta in packed.values()]
+            datas = fs.cat_ranges(
+                [source[0] for source in sources],
+                [source[1] for source in sources],
+                [source[2] for source in sources],
+                on_error="return",
+            )
+            for key, data in zip(packed, datas):
+                if isinstance(data, FileNotFoundError):
+                    data = RFC7807Error.not_found(key)
+                results[key] = data
+        return {key: results[key] for key in keys if key in results}
+
     def ls(self, fs: fsspec.AbstractFileSystem, key: str = ""):
         completed_meta_path = self.get_completed_meta_path(key)
         for k in fs.ls(completed_meta_path, detail=False):
             yield k.replace("completed/meta/", "")
 
+    def scan(self, fs: fsspec.AbstractFileSystem, batch_size: int = 1000):
+        """完了済みの全キーのメタデータを (key, meta) としてキー順に返す"""
+        meta_dir = self.get_completed_meta_path("")
+        paths = sorted(fs.find(meta_dir))
+        for i in range(0, len(paths), batch_size):
+            batch = paths[i : i + batch_size]
+            for p, data in sorted(fs.cat(batch, on_error="omit").items()):
+                key = p.split(meta_dir, 1)[-1].lstrip("/")
+                try:
+                    yield key, json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+
 
 class MyStore:
     @classmethod
@@ -320,12 +1942,35 @@ class MyStore:
         return cls.from_fsspec(fs, blueprint)
 
     @classmethod
-    def from_fsspec(cls, client: fsspec.AbstractFileSystem, blueprint: StoreBluePrint):
-        return cls(client, blueprint)
+    def from_fsspec(
+        cls,
+        client: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        index: CatalogIndex = None,
+        cache: MetaCache = None,
+        feed: ChangeFeed = None,
+    ):
+        return cls(client, blueprint, index=index, cache=cache, feed=feed)
 
-    def __init__(self, client: fsspec.AbstractFileSystem, blueprint: StoreBluePrint):
+    def __init__(
+        self,
+        client: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        index: CatalogIndex = None,
+        cache: MetaCache = None,
+        feed: ChangeFeed = None,
+    ):
         self._client = client
         self._blueprint = blueprint
+        self._index = index
+        self._cache = cache
+        self._feed = feed
+        if index is not None:
+            blueprint.add_listener(index)
+        if cache is not None:
+            blueprint.add_listener(cache)
+        if feed is not None:
+            blueprint.add_listener(feed)
 
     def clear(self, token: str = None):
         self._blueprint.clear(self._client, token)
@@ -336,14 +1981,148 @@ class MyStore:
     def init(self, token: str):
         self._blueprint.init(self._client, token)
 
-    def write_file(self, key, file, usermeta: dict = {}):
-        return self._blueprint.write_file(self._client, key, file, usermeta)
+    def write_file(self, key, file, usermeta: dict = {}, compression: str = None):
+        return self._blueprint.write_file(
+            self._client, key, file, usermeta, compression=compression
+        )
+
+    def write_many(self, items, max_workers=None):
+        return self._blueprint.write_many(self._client, items, max_workers=max_workers)
+
+    def write_file_chunked(
+        self, key, file, usermeta: dict = {}, max_workers=None, dedup=False
+    ):
+        return self._blueprint.write_file_chunked(
+            self._client, key, file, usermeta, max_workers=max_workers, dedup=dedup
+        )
+
+    def write_file_resumable(self, key, file, usermeta: dict = {}):
+        return self._blueprint.write_file_resumable(self._client, key, file, usermeta)
+
+    def get_upload_status(self, key: str):
+        return self._blueprint.get_upload_status(self._client, key)
+
+    def abort_upload(self, key: str):
+        return self._blueprint.abort_upload(self._client, key)
 
-    def open(self, key, mode: str = "rb"):
-        return self._blueprint.open(self._client, key, mode=mode)
+    def create_multipart_upload(self, key, usermeta: dict = {}):
+        return self._blueprint.create_multipart_upload(self._client, key, usermeta)
+
+    def upload_part(self, key, upload_id: str, index: int, file, block_hash=None):
+        return self._blueprint.upload_part(
+            self._client, key, upload_id, index, file, block_hash=block_hash
+        )
+
+    def list_parts(self, key, upload_id: str):
+        return self._blueprint.list_parts(self._client, key, upload_id)
+
+    def complete_multipart_upload(self, key, upload_id: str, parts=None):
+        return self._blueprint.complete_multipart_upload(
+            self._client, key, upload_id, parts=parts
+        )
+
+    def abort_multipart_upload(self, key, upload_id: str):
+        return self._blueprint.abort_multipart_upload(self._client, key, upload_id)
+
+    def open(self, key, mode: str = "rb", verify: bool = False):
+        meta = self.read_meta(key) if self._cache is not None else None
+        return self._blueprint.open(
+            self._client, key, mode=mode, verify=verify, meta=meta
+        )
+
+    def read_range(self, key, offset: int, length: int, verify: bool = False):
+        meta = self.read_meta(key) if self._cache is not None else None
+        return self._blueprint.read_range(
+            self._client, key, offset, length, verify=verify, meta=meta
+        )
+
+    def open_block_reader(self, key, verify: bool = False, meta: dict = None):
+        if meta is None and self._cache is not None:
+            meta = self.read_meta(key)
+        return self._blueprint.open_block_reader(
+            self._client, key, verify=verify, meta=meta
+        )
+
+    def get_local_path(self, key: str, meta: dict = None):
+        meta = self.read_meta(key) if meta is None else meta
+        return self._blueprint.get_local_data_path(self._client, key, meta)
+
+    def delete(self, key: str, id: str = None):
+        return self._blueprint.delete(self._client, key, id)
+
+    def list_versions(self, key: str):
+        return self._blueprint.list_versions(self._client, key)
+
+    def read_version_meta(self, key: str, id: str = None, as_of: float = None):
+        if id is None:
+            id = self._blueprint.resolve_version(self._client, key, as_of)
+        return self._blueprint.read_version_meta(self._client, key, id)
+
+    def open_version(
+        self, key: str, id: str = None, as_of: float = None, verify: bool = False
+    ):
+        return self._blueprint.open_version(
+            self._client, key, id=id, as_of=as_of, verify=verify
+        )
+
+    def expire_versions(self, key: str, keep: int = None, max_age: float = None):
+        return self._blueprint.expire_versions(
+            self._client, key, keep=keep, max_age=max_age
+        )
 
     def read_meta(self, key: str):
-        return self._blueprint.read_meta(self._client, key)
+        if self._cache is None:
+            return self._blueprint.read_meta(self._client, key)
+
+        meta = self._cache.get(self._client, key)
+        if meta is None:
+            epoch = self._cache.epoch()
+            meta = self._blueprint.read_meta(self._client, key)
+            self._cache.put(key, meta, epoch)
+        return copy.deepcopy(meta)
+
+    def read_meta_many(self, keys):
+        return self._blueprint.read_meta_many(self._client, keys)
+
+    def open_many(self, keys, mode: str = "rb"):
+        return self._blueprint.open_many(self._client, keys, mode=mode)
+
+    def read_many(self, keys):
+        return self._blueprint.read_many(self._client, keys)
 
     def ls(self, key: str):
+        if self._index is not None:
+            return self._index.ls(prefix=key)
         return list(self._blueprint.ls(self._client, key))
+
+    def query(self, **filters):
+        """インデックスからメタデータを検索する。引数は CatalogIndex.query を参照"""
+        if self._index is None:
+            raise RFC7807Error.internalservererror("Catalog index is not configured.")
+        return self._index.query(**filters)
+
+    def _get_feed(self) -> ChangeFeed:
+        if self._feed is None:
+            raise RFC7807Error.internalservererror("Change feed is not configured.")
+        return self._feed
+
+    def read_changes(self, since=None, limit: int = None):
+        """変更ログを読み込む。引数は ChangeFeed.read_changes を参照"""
+        return self._get_feed().read_changes(self._client, since=since, limit=limit)
+
+    def follow_changes(
+        self, since=None, poll_interval: float = 1.0, settle: float = 1.0, stop=None
+    ):
+        """新しい変更を待ち続ける。引数は ChangeFeed.follow を参照"""
+        return self._get_feed().follow(
+            self._client,
+            since=since,
+            poll_interval=poll_interval,
+            settle=settle,
+            stop=stop,
+        )
+
+    def rebuild_index(self):
+        if self._index is None:
+            raise RFC7807Error.internalservererror("Catalog index is not configured.")
+        return self._index.rebuild(self._blueprint.scan(self._client))
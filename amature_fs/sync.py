@@ -0,0 +1,254 @@
+"""
+2 つのカタログ間の差分同期。
+
+    python -m amature_fs.sync run dir::local://.cache/catalog s3://bucket/catalog
+    python -m amature_fs.sync run dir::local://.cache/catalog s3://bucket/catalog --bandwidth 10000000
+
+source の完了済みオブジェクトを target に複製する。まずメタデータを比較し、
+system.hash が一致するキーは転送しない。異なるキーは target のブロックプールに
+cas 形式で書き込む。source の block_hashes のうち、target のプールに既に存在するブロックは
+参照を追加するだけで再利用し（ダウンロードも書き込みもしない）、存在しないブロックだけを
+source から取得して source のハッシュで検証してから書き込む。
+
+複製は source のブロックサイズ・チャンクテーブルのバージョンで書き込むため、
+一度同期したキーは次回以降、変更されたブロックだけが転送される。
+ブロックプールはキー間で共有されるため、他のキーと同じブロックも転送しない。
+
+キー順に batch_size 件ずつ workers 件を並列に同期し、バッチごとに進捗を target の
+state_path に保存する。中断した場合は続きから再開する。bandwidth（1 秒あたりのバイト数）で
+source からの転送量を制限する。進捗には source から読み込んだバイト数（transferred）、
+target に書き込んだバイト数（written）、再利用したブロックのバイト数（reused）を記録する。
+"""
+
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+
+from .blockpool import get_stored_block_hashes
+from .compression import decode_block
+from .exceptions import RFC7807Error
+from .hashing import split_multihash
+from .reader import get_block_source, verify_block
+from .store import StoreBluePrint
+from .utils import RateLimiter, uuid7
+
+STATE_PATH = "sync.json"
+
+
+class Syncer:
+    def __init__(
+        self,
+        source: fsspec.AbstractFileSystem,
+        target: fsspec.AbstractFileSystem,
+        blueprint: StoreBluePrint,
+        target_blueprint: StoreBluePrint = None,
+        workers: int = 4,
+        block_workers: int = 4,
+        bandwidth: float = None,
+        batch_size: int = 100,
+        state_path: str = STATE_PATH,
+    ):
+        """
+        :param target_blueprint: target の設計図。None の場合は blueprint と同じ
+        :param workers: 並列に同期するキーの数
+        :param block_workers: 1 つのキーで並列に取得するブロックの数
+        :param bandwidth: source から転送する 1 秒あたりのバイト数の上限。None の場合は制限しない
+        :param state_path: 進捗を保存する target のパス
+        """
+        self._source = source
+        self._target = target
+        self._blueprint = blueprint
+        self._target_blueprint = target_blueprint or blueprint
+        self._workers = workers
+        self._block_workers = block_workers
+        self._limiter = RateLimiter(bandwidth)
+        self._batch_size = batch_size
+        self._state_path = state_path
+
+    def load_state(self) -> dict | None:
+        try:
+            return json.loads(self._target.cat_file(self._state_path))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_state(self, state: dict):
+        self._target.pipe_file(self._state_path, json.dumps(state).encode())
+
+    def _new_state(self):
+        return {
+            "sync": uuid7(),
+            "after": None,
+            "done": False,
+            "objects": 0,
+            "copied": 0,
+            "skipped": 0,
+            "transferred": 0,
+            "written": 0,
+            "reused": 0,
+            "failed": [],
+        }
+
+    def _fetch_block(self, key: str, meta: dict, index: int) -> tuple[bytes, bytes]:
+        """source からブロックを取得し、(取得したデータ, 展開・検証したブロック) を返す"""
+        data_path = self._blueprint.get_completed_data_path(key)
+        source, start, end = get_block_source(meta, index, data_path)
+        data = self._source.cat_file(source, start=start, end=end)
+        self._limiter.acquire(len(data))
+        block = decode_block(meta, index, data)
+        verify_block(meta, index, block)
+        return data, block
+
+    def sync_key(self, key: str, meta: dict) -> dict:
+        """source のオブジェクト（meta）を target のブロックプールに複製し、転送量を返す。
+
+        target のプールに存在するブロックは参照を追加して再利用し、
+        存在しないブロックだけを source から取得して書き込む。
+        """
+        dst_bp = self._target_blueprint
+        pool = dst_bp.get_block_pool(self._target)
+        chunks = meta["system"]["chunks"]
+        block_size = int(chunks["block_size"])
+        size = int(meta["system"]["size"])
+        block_hashes = get_stored_block_hashes(meta)
+        lock = threading.Lock()
+        result = {"transferred": 0, "written": 0, "reused": 0}
+
+        def put_block(index, block_hash):
+            length = min(block_size, size - index * block_size)
+            # 参照を追加してから存在を確認するため、再利用するブロックは削除されない
+            pool.incref(id, [block_hash])
+            if pool.exists(block_hash):
+                with lock:
+                    result["reused"] += length
+                return
+            data, block = self._fetch_block(key, meta, index)
+            written = pool.put(block_hash, block)
+            with lock:
+                result["transferred"] += len(data)
+                result["written"] += len(block) if written else 0
+
+        with dst_bp.begin(self._target, key, meta["user"]) as new:
+            id = new["system"]["id"]
+            new["system"]["chunks"]["layout"] = "cas"
+            new["system"]["chunks"]["location"] = pool.data_dir
+            # 中断時に参照を回収できるよう、書き込み前に格納先を記録する
+            dst_bp._write_processing_meta(self._target, key, new)
+
+            # 同じハッシュのブロックは最初の 1 つだけを書き込む
+            first = {}
+            for index, block_hash in enumerate(block_hashes):
+                if block_hash in first:
+                    result["reused"] += min(block_size, size - index * block_size)
+                else:
+                    first[block_hash] = index
+            try:
+                with ThreadPoolExecutor(max_workers=self._block_workers) as executor:
+                    for future in [
+                        executor.submit(put_block, index, block_hash)
+                        for block_hash, index in first.items()
+                    ]:
+                        future.result()
+            except BaseException:
+                pool.decref(id, block_hashes)
+                raise
+
+            dst_bp._finalize_meta(
+                new,
+                split_multihash(meta["system"]["hash"])[0],
+                size,
+                block_size,
+                list(chunks["block_hashes"]),
+                list(chunks["cumulative_hashes"]),
+                chunks.get("version", 1),
+            )
+            if new["system"]["hash"] != meta["system"]["hash"]:
+                raise RFC7807Error.file_integrity_error("Synced hash mismatch.")
+        return result
+
+    def run(self, max_objects: int = None, restart: bool = False) -> dict:
+        """同期を実行し（中断していれば再開し）、結果を返す。
+
+        max_objects を指定した場合、その件数を処理したところで中断する（done は False）。
+        """
+        state = None if restart else self.load_state()
+        if state is None or state["done"]:
+            state = self._new_state()
+
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            batch = []
+            for key, meta in self._blueprint.scan(self._source, self._batch_size):
+                if state["after"] is not None and key <= state["after"]:
+                    continue
+                batch.append((key, meta))
+                if len(batch) == self._batch_size:
+                    processed += self._run_batch(executor, batch, state)
+                    batch = []
+                    if max_objects is not None and max_objects <= processed:
+                        return state
+
+            if batch:
+                self._run_batch(executor, batch, state)
+
+        state["done"] = True
+        self.save_state(state)
+        return state
+
+    def _run_batch(self, executor, batch, state) -> int:
+        base_metas = self._target_blueprint.read_meta_many(
+            self._target, [key for key, _ in batch]
+        )
+        futures = {}
+        for key, meta in batch:
+            base_meta = base_metas.get(key)
+            if isinstance(base_meta, Exception):
+                base_meta = None
+            elif base_meta["system"]["hash"] == meta["system"]["hash"]:
+                state["skipped"] += 1
+                continue
+            futures[key] = executor.submit(self.sync_key, key, meta)
+
+        for key, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                state["failed"].append({"key": key, "error": str(e)})
+                continue
+            state["copied"] += 1
+            state["transferred"] += result["transferred"]
+            state["written"] += result["written"]
+            state["reused"] += result["reused"]
+
+        state["objects"] += len(batch)
+        state["after"] = batch[-1][0]
+        self.save_state(state)
+        return len(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.sync")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="source のカタログを target に同期する")
+    run.add_argument("source", help="同期元のカタログの fsspec URL")
+    run.add_argument("target", help="同期先のカタログの fsspec URL")
+    run.add_argument("--workers", type=int, default=4, help="並列に同期するキーの数")
+    run.add_argument("--bandwidth", type=float, default=None, help="1 秒あたりの転送バイト数の上限")
+    run.add_argument("--restart", action="store_true", help="中断した同期を破棄して最初から実行する")
+    args = parser.parse_args(argv)
+
+    source, _ = fsspec.url_to_fs(args.source)
+    target, _ = fsspec.url_to_fs(args.target)
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    syncer = Syncer(
+        source, target, blueprint, workers=args.workers, bandwidth=args.bandwidth
+    )
+    state = syncer.run(restart=args.restart)
+    print(json.dumps(state, indent=2))
+    return 1 if state["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,8 @@
-from ._ticker import RealtimeTicker, VirtualTicker, Uuid7Ticker
+from ._ticker import (
+    RealtimeTicker,
+    SleepingRealtimeTicker,
+    VirtualTicker,
+    Uuid7Ticker,
+)
 from ._datetime import from_now_millisecond
 from ._uuid7 import from_now as uuid7_from_now
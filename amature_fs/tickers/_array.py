@@ -0,0 +1,72 @@
+"""
+timestamp と uuid7 の NumPy 配列による一括変換（numpy が必要。array 依存グループ）。
+
+uuid7 は 128 ビットのため、上位・下位 64 ビットを並べた (n, 2) の uint64 配列で表す。
+同じミリ秒が続く要素は RFC 9562 のカウンタを 1 ずつ進めるため、timestamps が
+昇順であれば、結果も上位・下位の順に比較して単調増加になる。
+"""
+
+import os
+
+import numpy as np
+import uuid_utils
+
+from ._uuid7 import COUNTER_BITS
+
+_U64 = np.uint64
+
+
+def floor_to_milliseconds(timestamps) -> np.ndarray:
+    """timestamp（秒）をミリ秒の整数に切り捨てる（_timestamp._extract_timestamp_parts と同じ丸め）"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    seconds = np.floor(timestamps)
+    millis = np.floor(np.round(timestamps - seconds, 5) * 1000)
+    return (seconds * 1000 + millis).astype(np.uint64)
+
+
+def from_timestamps(timestamps) -> np.ndarray:
+    """timestamp（秒）の配列から uuid7 の (n, 2) uint64 配列を生成する"""
+    unix_ms = floor_to_milliseconds(timestamps)
+    n = len(unix_ms)
+    index = np.arange(n)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = unix_ms[1:] != unix_ms[:-1]
+    # 同じミリ秒の連続の先頭の位置と、その中での順位
+    first = np.maximum.accumulate(np.where(starts, index, 0))
+    rank = (index - first).astype(np.uint64)
+
+    # カウンタの初期値は連続ごとの乱数（最上位ビットは 0）
+    initial = np.frombuffer(os.urandom(8 * n), dtype=np.uint64) >> _U64(
+        64 - COUNTER_BITS + 1
+    )
+    counter = initial[first] + rank
+    rand = np.frombuffer(os.urandom(4 * n), dtype=np.uint32).astype(np.uint64)
+
+    uuids = np.empty((n, 2), dtype=np.uint64)
+    uuids[:, 0] = (unix_ms << _U64(16)) | _U64(0x7 << 12) | (counter >> _U64(30))
+    uuids[:, 1] = (
+        _U64(0b10 << 62) | ((counter & _U64(0x3FFF_FFFF)) << _U64(32)) | rand
+    )
+    return uuids
+
+
+def to_timestamps(uuids) -> np.ndarray:
+    """uuid7 の (n, 2) uint64 配列から timestamp（秒、ミリ秒精度）の配列を返す"""
+    uuids = np.asarray(uuids, dtype=np.uint64)
+    return (uuids[:, 0] >> _U64(16)).astype(np.float64) / 1000
+
+
+def from_uuids(uuids) -> np.ndarray:
+    """UUID（int 属性を持つもの）または文字列のリストを (n, 2) uint64 配列にする"""
+    values = [
+        (u if not isinstance(u, str) else uuid_utils.UUID(u)).int for u in uuids
+    ]
+    array = np.empty((len(values), 2), dtype=np.uint64)
+    array[:, 0] = [value >> 64 for value in values]
+    array[:, 1] = [value & 0xFFFF_FFFF_FFFF_FFFF for value in values]
+    return array
+
+
+def to_uuids(uuids) -> list:
+    """(n, 2) uint64 配列を uuid_utils.UUID のリストにする"""
+    return [uuid_utils.UUID(int=(int(hi) << 64) | int(lo)) for hi, lo in uuids]
@@ -1,7 +1,10 @@
+import os
 import time
 import threading
 from datetime import datetime
+import uuid_utils
 from . import _uuid7
+from ._timestamp import _extract_timestamp_parts
 
 
 class Ticker:
@@ -16,6 +19,10 @@ class Ticker:
         for i in range(n):
             yield self.tick()
 
+    def take_batch(self, n) -> list:
+        """n 個の tick をまとめてリストで返す"""
+        return list(self.take(n))
+
 
 class TimestampTicker(Ticker):
     def tick(self) -> float:
@@ -41,7 +48,34 @@ class RealtimeTicker(TimestampTicker):
                     ms = current_ns // 1_000_000  # ミリ秒未満切り捨て
                     return ms / 1_000  # 秒単位に
                 else:
-                    time.sleep(0)
+                    time.sleep(self._sleep_sec)
+
+
+class SleepingRealtimeTicker(TimestampTicker):
+    """スピンせずに待つミリ精度のティッカー。
+
+    ロックの中では次の時刻の予約だけを行い、予約した時刻まではロックの外で sleep する。
+    RealtimeTicker より CPU を使わず、待っている間も他のスレッドが予約できる。
+    sleep は指定より遅れることがあるため、間隔は interval より長くなることがある。
+    """
+
+    def __init__(self, interval_sec: float = 0.001):
+        self._last_ns = time.time_ns()
+        self._interval_ns = int(interval_sec * 1_000_000_000)
+        self._lock = threading.Lock()
+
+    def tick(self) -> float:
+        with self._lock:
+            target_ns = max(self._last_ns + self._interval_ns, time.time_ns())
+            self._last_ns = target_ns
+
+        while True:
+            wait_ns = target_ns - time.time_ns()
+            if wait_ns <= 0:
+                break
+            time.sleep(wait_ns / 1_000_000_000)
+        ms = target_ns // 1_000_000  # ミリ秒未満切り捨て
+        return ms / 1_000
 
 
 class VirtualTicker(TimestampTicker):
@@ -81,10 +115,50 @@ class VirtualTicker(TimestampTicker):
 
 
 class Uuid7Ticker(Ticker):
+    """(timestamp, uuid7) を単調増加の順に返すティッカー。
+
+    同じミリ秒が続く場合（ticker の時刻が進まない・戻る場合を含む）は、時計を待たずに
+    RFC 9562 のカウンタ（rand_a と rand_b の上位 30 ビット）を進める。
+    カウンタが桁あふれした場合はミリ秒を 1 進める。timestamp は uuid7 に埋め込まれたミリ秒。
+    """
+
     def __init__(self, ticker: TimestampTicker):
         self._ticker = ticker
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._counter = 0
+
+    def _reserve(self, unix_ms: int, n: int) -> list[tuple[int, int, int]]:
+        """n 個の (ミリ秒, 先頭のカウンタ, 個数) を予約する"""
+        runs = []
+        with self._lock:
+            if self._last_ms < unix_ms:
+                self._last_ms = unix_ms
+                self._counter = _uuid7.initial_counter()
+            while n:
+                count = min(n, _uuid7.COUNTER_MAX + 1 - self._counter)
+                if count == 0:
+                    self._last_ms += 1
+                    self._counter = _uuid7.initial_counter()
+                    continue
+                runs.append((self._last_ms, self._counter, count))
+                self._counter += count
+                n -= count
+        return runs
+
+    def take_batch(self, n) -> list:
+        """n 個の (timestamp, uuid7) を 1 回の時刻の取得とロックで生成する"""
+        ts, millis = _extract_timestamp_parts(self._ticker.tick())
+        results = []
+        for unix_ms, counter, count in self._reserve(ts * 1000 + millis, n):
+            timestamp = unix_ms / 1000
+            rands = memoryview(os.urandom(4 * count)).cast("I")
+            base = _uuid7.pack(unix_ms, 0, 0)
+            for i in range(count):
+                c = counter + i
+                value = base | (c >> 30) << 64 | (c & 0x3FFF_FFFF) << 32 | rands[i]
+                results.append((timestamp, uuid_utils.UUID(int=value)))
+        return results
 
     def tick(self):
-        timestamp = self._ticker.tick()
-        u = _uuid7.from_timestamp(timestamp)
-        return timestamp, u
+        return self.take_batch(1)[0]
@@ -1,9 +1,15 @@
+import os
 from uuid import UUID
 from datetime import datetime, timezone
+import uuid_utils
 from uuid_utils import uuid7
 from ._datetime import from_now_millisecond
 from ._timestamp import to_uuid7_seed, floor_to_millisecond
 
+# RFC 9562 6.2 Method 1: rand_a（12 ビット）と rand_b の上位 30 ビットを 42 ビットのカウンタにする
+COUNTER_BITS = 42
+COUNTER_MAX = (1 << COUNTER_BITS) - 1
+
 
 def from_now(tz=timezone.utc):
     dt = from_now_millisecond(tz)
@@ -33,3 +39,24 @@ def to_timestamp(u: UUID):
     # UUID は 128ビット。上位48ビットが timestamp（ミリ秒）
     timestamp_ms = (u.int >> 80) & ((1 << 48) - 1)
     return floor_to_millisecond(timestamp_ms / 1000)
+
+
+def pack(unix_ms: int, counter: int, rand: int) -> int:
+    """ミリ秒・カウンタ（42 ビット）・乱数（32 ビット）から uuid7 の 128 ビット整数を組み立てる"""
+    return (
+        (unix_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76  # version
+        | (counter >> 30) << 64  # rand_a: カウンタの上位 12 ビット
+        | 0b10 << 62  # variant
+        | (counter & 0x3FFF_FFFF) << 32  # rand_b の上位 30 ビット: カウンタの下位
+        | (rand & 0xFFFF_FFFF)
+    )
+
+
+def from_parts(unix_ms: int, counter: int, rand: int):
+    return uuid_utils.UUID(int=pack(unix_ms, counter, rand))
+
+
+def initial_counter() -> int:
+    """ミリ秒ごとのカウンタの初期値。最上位ビットを 0 にして桁あふれまでの余地を残す"""
+    return int.from_bytes(os.urandom(6)) >> (48 - COUNTER_BITS + 1)
@@ -0,0 +1,382 @@
+"""
+複数の fsspec バックエンドにまたがるレプリケーションと階層化。
+
+    store = TieredStore(
+        {"nvme": fsspec.url_to_fs("dir::local://.cache/catalog")[0],
+         "s3": fsspec.url_to_fs("dir::s3://bucket/catalog")[0]},
+        StoreBluePrint(StoreBluePrint.get_default()),
+    )
+
+tiers は近い順に並べる。書き込みは先頭の階層（ホット）に同期的に行い、
+残りの階層（レプリカ）には上限付きのキューを通じて非同期に複製する。
+各レプリカへの複製状態はホットのメタデータの system.replication に
+{tier: {"status": "pending" | "ok" | "failed", ...}} として記録し、
+レプリカのメタデータには複製元を system.replica_of として記録する。
+キューが満杯の場合や複製に失敗した場合は pending / failed のまま残り、repair で追いつかせる。
+
+    python -m amature_fs.tiers repair nvme=dir::local://.cache/catalog s3=dir::s3://bucket/catalog
+
+読み込みは近い順に、障害中でない階層のうちキーを持つものから行う。
+障害（ファイルの不在以外のエラー）が起きた階層は retry_after 秒間スキップする。
+レプリカからの読み込みが promote_after 回に達したキーはホットに複製し（昇格）、
+demote でアクセスのないキーを、全てのレプリカに複製済みであればホットから削除する（降格）。
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+
+import fsspec
+
+from .exceptions import RFC7807Error
+from .store import StoreBluePrint
+from .utils import uuid7_time
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+
+
+def is_not_found(e: Exception) -> bool:
+    return isinstance(e, FileNotFoundError) or (
+        isinstance(e, RFC7807Error) and e.status == 404
+    )
+
+
+class TieredStore:
+    def __init__(
+        self,
+        tiers: dict[str, fsspec.AbstractFileSystem],
+        blueprint: StoreBluePrint,
+        queue_size: int = 1024,
+        workers: int = 2,
+        enqueue_timeout: float = 0.0,
+        retry_after: float = 30.0,
+        promote_after: int = 3,
+    ):
+        """
+        :param tiers: 階層名 -> ファイルシステム（近い順。先頭に書き込む）
+        :param queue_size: 複製キューの上限。満杯の場合は enqueue_timeout 秒待ってから諦める
+        :param retry_after: 障害が起きた階層をスキップする秒数
+        :param promote_after: レプリカからの読み込みがこの回数に達したらホットに昇格する
+        """
+        if not tiers:
+            raise RFC7807Error.internalservererror("No tiers.")
+        self._tiers = dict(tiers)
+        self._names = list(self._tiers)
+        self._blueprint = blueprint
+        self._enqueue_timeout = enqueue_timeout
+        self._retry_after = retry_after
+        self._promote_after = promote_after
+        self._unhealthy = {}
+        self._access = {}
+        self._lock = threading.Lock()
+        self._status_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.stats = {
+            "replicated": 0,
+            "promoted": 0,
+            "demoted": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def hot(self) -> str:
+        return self._names[0]
+
+    @property
+    def replicas(self) -> list[str]:
+        return self._names[1:]
+
+    # 書き込み
+
+    def write_file(
+        self,
+        key,
+        file,
+        usermeta: dict = {},
+        block_size: int = None,
+        chunks_version: int = None,
+        compression: str = None,
+    ):
+        """ホットに書き込み、レプリカへの複製をキューに入れる"""
+        bp = self._blueprint
+        fs = self._tiers[self.hot]
+        block_size = block_size or bp.get_block_size()
+        replication = {name: {"status": PENDING} for name in self.replicas}
+        with bp.begin(fs, key, usermeta) as meta:
+            bp._stage_file(
+                fs, key, file, meta, block_size, chunks_version, compression
+            )
+            meta["system"]["replication"] = replication
+
+        for name in self.replicas:
+            self._enqueue((key, meta["system"]["id"], self.hot, name))
+        return meta
+
+    def _enqueue(self, job) -> bool:
+        try:
+            self._queue.put(
+                job, block=0 < self._enqueue_timeout, timeout=self._enqueue_timeout
+            )
+        except queue.Full:
+            # 状態は pending のまま残り、repair で複製する
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        return True
+
+    def flush(self):
+        """キューに入っている複製が全て終わるまで待つ"""
+        self._queue.join()
+
+    # 複製
+
+    def _worker(self):
+        while True:
+            key, id, source, target = self._queue.get()
+            try:
+                if target == self.hot:
+                    self._promote(key, id, source)
+                else:
+                    self.replicate(key, id, target)
+            except Exception:
+                # 状態はメタデータに記録済み（記録できなかった場合は repair で追いつく）
+                pass
+            finally:
+                self._queue.task_done()
+
+    def _copy(
+        self,
+        key,
+        meta,
+        source: str,
+        target: str,
+        replication: dict = {},
+        replica_of: dict = None,
+    ) -> dict:
+        """source のオブジェクト（meta）を target に複製し、複製のメタデータを返す"""
+        bp = self._blueprint
+        src = self._tiers[source]
+        dst = self._tiers[target]
+        chunks = meta["system"]["chunks"]
+        with bp.open(src, key, meta=meta) as f:
+            with bp.begin(dst, key, meta["user"]) as new:
+                bp._stage_file(
+                    dst, key, f, new, int(chunks["block_size"]), chunks.get("version", 1)
+                )
+                if new["system"]["hash"] != meta["system"]["hash"]:
+                    raise RFC7807Error.file_integrity_error("Replica hash mismatch.")
+                new["system"]["replication"] = replication
+                new["system"]["replica_of"] = replica_of
+        return new
+
+    def replicate(self, key, id, target: str) -> bool:
+        """ホットのオブジェクト（system.id が id）を target に複製し、状態を記録する。
+
+        ホットのオブジェクトが上書き・削除されていた場合は何もせず False。
+        """
+        bp = self._blueprint
+        hot = self._tiers[self.hot]
+        meta = bp._load_meta(hot, bp.get_completed_meta_path(key))
+        if meta is None or meta["system"].get("id") != id:
+            return False
+
+        try:
+            replica = bp._load_meta(
+                self._tiers[target], bp.get_completed_meta_path(key)
+            )
+            # 同じ内容の複製が既にある場合は状態の記録のみ行う
+            if replica is None or replica["system"].get("hash") != meta["system"]["hash"]:
+                replica_of = {"tier": self.hot, "id": id}
+                replica = self._copy(key, meta, self.hot, target, replica_of=replica_of)
+            status = {"status": OK, "id": replica["system"]["id"], "time": time.time()}
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            status = {"status": FAILED, "error": str(e), "time": time.time()}
+            try:
+                self._set_status(key, id, target, status)
+            except Exception:
+                pass
+            raise
+
+        with self._lock:
+            self.stats["replicated"] += 1
+        return self._set_status(key, id, target, status)
+
+    def _set_status(self, key, id, target, status, retries: int = 5) -> bool:
+        def update(meta):
+            meta["system"].setdefault("replication", {})[target] = status
+
+        # 同じキーの他のレプリカの記録や書き込みとロックが競合した場合は再試行する
+        for attempt in range(retries + 1):
+            try:
+                with self._status_lock:
+                    return self._blueprint.update_completed_meta(
+                        self._tiers[self.hot], key, id, update
+                    )
+            except RFC7807Error as e:
+                if e.status != 409 or attempt == retries:
+                    raise
+            time.sleep(0.05 * 2**attempt)
+
+    def repair(self) -> dict:
+        """ホットのキーのうち、複製が完了していないレプリカに複製する"""
+        stats = {"repaired": 0, "failed": 0}
+        bp = self._blueprint
+        for key, meta in bp.scan(self._tiers[self.hot]):
+            replication = meta["system"].get("replication", {})
+            for name in self.replicas:
+                if replication.get(name, {}).get("status") == OK:
+                    continue
+                try:
+                    if self.replicate(key, meta["system"]["id"], name):
+                        stats["repaired"] += 1
+                except Exception:
+                    stats["failed"] += 1
+        return stats
+
+    def get_replication_status(self, key) -> dict:
+        meta = self._blueprint.read_meta(self._tiers[self.hot], key)
+        return meta["system"].get("replication", {})
+
+    # 読み込み
+
+    def _is_healthy(self, name: str) -> bool:
+        return self._unhealthy.get(name, 0) <= time.time()
+
+    def _locate(self, key):
+        """キーを持つ最も近い正常な階層を探し、(階層名, メタデータ) を返す"""
+        error = None
+        for name in self._names:
+            if not self._is_healthy(name):
+                continue
+            try:
+                return name, self._blueprint.read_meta(self._tiers[name], key)
+            except Exception as e:
+                if isinstance(e, RFC7807Error) and not is_not_found(e):
+                    # 書き込み中などはフェイルオーバーしない
+                    raise
+                if not is_not_found(e):
+                    self._unhealthy[name] = time.time() + self._retry_after
+                error = e
+        raise RFC7807Error.not_found(key) from error
+
+    def read_meta(self, key):
+        return self._locate(key)[1]
+
+    def open(self, key, mode: str = "rb", verify: bool = False):
+        name, meta = self._locate(key)
+        self._record_access(key, name, meta)
+        return self._blueprint.open(
+            self._tiers[name], key, mode=mode, verify=verify, meta=meta
+        )
+
+    def read_range(self, key, offset: int, length: int, verify: bool = False):
+        name, meta = self._locate(key)
+        self._record_access(key, name, meta)
+        return self._blueprint.read_range(
+            self._tiers[name], key, offset, length, verify=verify, meta=meta
+        )
+
+    # 昇格・降格
+
+    def get_access_stats(self, key) -> dict | None:
+        return self._access.get(key)
+
+    def _record_access(self, key, name, meta):
+        with self._lock:
+            stats = self._access.setdefault(key, {"count": 0, "last": None})
+            stats["count"] += 1
+            stats["last"] = time.time()
+            promote = name != self.hot and self._promote_after <= stats["count"]
+            if promote:
+                stats["count"] = 0
+        if promote:
+            self._enqueue((key, meta["system"]["id"], name, self.hot))
+
+    def _promote(self, key, id, source: str):
+        """source のオブジェクトをホットに複製する。レプリカの複製状態は既存の複製から求める"""
+        bp = self._blueprint
+        meta = bp._load_meta(self._tiers[source], bp.get_completed_meta_path(key))
+        if meta is None or meta["system"].get("id") != id:
+            return
+        if bp._load_meta(self._tiers[self.hot], bp.get_completed_meta_path(key)):
+            return
+
+        replication = {}
+        for name in self.replicas:
+            replica = bp._load_meta(self._tiers[name], bp.get_completed_meta_path(key))
+            if replica is not None and replica["system"]["hash"] == meta["system"]["hash"]:
+                replication[name] = {"status": OK, "id": replica["system"]["id"]}
+            else:
+                replication[name] = {"status": PENDING}
+
+        new = self._copy(key, meta, source, self.hot, replication)
+        with self._lock:
+            self.stats["promoted"] += 1
+        for name, status in replication.items():
+            if status["status"] != OK:
+                self._enqueue((key, new["system"]["id"], self.hot, name))
+
+    def demote(self, idle: float) -> int:
+        """idle 秒以上アクセスのないキーを、全てのレプリカに複製済みであればホットから削除する。
+
+        アクセスの記録がないキーは作成時刻を最終アクセスとみなす。削除した件数を返す。
+        """
+        if not self.replicas:
+            return 0
+        bp = self._blueprint
+        hot = self._tiers[self.hot]
+        now = time.time()
+        demoted = 0
+        for key, meta in list(bp.scan(hot)):
+            stats = self._access.get(key) or {}
+            last = stats.get("last") or uuid7_time(meta["system"].get("id") or "")
+            if last is None or now < last + idle:
+                continue
+            replication = meta["system"].get("replication", {})
+            if any(replication.get(n, {}).get("status") != OK for n in self.replicas):
+                continue
+            try:
+                # 確認後に上書きされていた場合は削除しない。オブジェクトはレプリカに残るため、
+                # 削除マーカーやリスナーへの通知のない evict で取り除く
+                if bp.evict(hot, key, meta["system"]["id"]):
+                    demoted += 1
+            except RFC7807Error:
+                continue
+            self._access.pop(key, None)
+
+        with self._lock:
+            self.stats["demoted"] += demoted
+        return demoted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amature_fs.tiers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    repair = subparsers.add_parser("repair", help="遅れているレプリカに複製する")
+    repair.add_argument("tiers", nargs="+", help="name=fsspec URL（近い順。先頭がホット）")
+    args = parser.parse_args(argv)
+
+    tiers = {}
+    for spec in args.tiers:
+        name, _, url = spec.partition("=")
+        tiers[name] = fsspec.url_to_fs(url)[0]
+    store = TieredStore(tiers, StoreBluePrint(StoreBluePrint.get_default()), workers=0)
+    stats = store.repair()
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
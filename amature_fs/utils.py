@@ -1,6 +1,67 @@
+import threading
+import time
+import uuid as _uuid
+from datetime import datetime
+
 import uuid_utils as uuid
 
 
 def uuid7(*args, **kwargs):
     return str(uuid.uuid7(*args, **kwargs))
 
+
+def uuid7_time(id: str) -> float | None:
+    """uuid7 に埋め込まれた作成時刻（エポック秒）を返す。uuid7 でない場合は None"""
+    try:
+        value = _uuid.UUID(id)
+    except (TypeError, ValueError):
+        return None
+    if value.version != 7:
+        return None
+    return (value.int >> 80) / 1000
+
+
+def get_mtime(info: dict) -> float | None:
+    """fsspec の info から更新時刻（エポック秒）を返す。バックエンドが提供しない場合は None"""
+    for name in ("mtime", "LastModified", "last_modified", "created"):
+        value = info.get(name)
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+def chunk_name(index: int) -> str:
+    """ブロック番号からチャンクオブジェクト名を返す（ls でソート可能な固定桁）"""
+    return f"{index:08d}"
+
+
+class RateLimiter:
+    """トークンバケットによる流量制限。rate は 1 秒あたりの量、None の場合は制限しない"""
+
+    def __init__(self, rate: float | None, burst: float = None):
+        self._rate = rate
+        self._burst = burst if burst is not None else (rate or 0)
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def acquire(self, amount: float = 1):
+        """amount だけ消費する。足りない場合は補充されるまで待つ"""
+        if not self._rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,368 @@
+"""
+ストアの書き込み・読み込み・コミット経路のベンチマーク。
+
+    python benchmarks/bench_store.py --backend memory --output bench.json
+    python benchmarks/bench_store.py --backend local --quick
+    python benchmarks/bench_store.py --backend s3      # moto, s3fs が必要
+    python benchmarks/bench_store.py compare old.json new.json --threshold 0.1
+
+結果は JSON で出力し、compare で 2 つの結果（コミット間など）を比較する。
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import BytesIO
+
+import fsspec
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from amature_fs.cache import MetaCache  # noqa: E402
+from amature_fs.exceptions import RFC7807Error  # noqa: E402
+from amature_fs.index import CatalogIndex  # noqa: E402
+from amature_fs.store import MyStore, StoreBluePrint  # noqa: E402
+from amature_fs.utils import uuid7  # noqa: E402
+
+MiB = 1024 * 1024
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+
+    def at(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": at(0.50) * 1000,
+        "p90_ms": at(0.90) * 1000,
+        "p99_ms": at(0.99) * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+@contextmanager
+def memory_backend():
+    root = f"bench-{uuid7()}"
+    fs, _ = fsspec.url_to_fs(f"dir::memory://{root}")
+    fs.fs.mkdir(root)
+    try:
+        yield fs
+    finally:
+        fs.fs.rm(root, recursive=True)
+
+
+@contextmanager
+def local_backend():
+    root = tempfile.mkdtemp(prefix="amature_fs_bench_")
+    fs, _ = fsspec.url_to_fs(f"dir::local://{root}")
+    try:
+        yield fs
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextmanager
+def s3_backend():
+    """moto のプロセス内サーバーを S3 互換ストレージとして利用する"""
+    try:
+        import s3fs
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise SystemExit(f"s3 backend requires moto[server] and s3fs: {e}")
+
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    options = {
+        "key": "testing",
+        "secret": "testing",
+        "client_kwargs": {"endpoint_url": endpoint, "region_name": "us-east-1"},
+    }
+    try:
+        s3fs.S3FileSystem(**options).mkdir("bench")
+        fs, _ = fsspec.url_to_fs("dir::s3://bench", s3=options)
+        yield fs
+    finally:
+        server.stop()
+
+
+BACKENDS = {"memory": memory_backend, "local": local_backend, "s3": s3_backend}
+
+
+@contextmanager
+def fresh_store(backend: str, **kwargs):
+    with BACKENDS[backend]() as fs:
+        blueprint = StoreBluePrint(StoreBluePrint.get_default())
+        store = MyStore.from_fsspec(fs, blueprint, **kwargs)
+        store.init(token="bench")
+        yield store
+
+
+def bench_write_throughput(backend, sizes, block_sizes, algorithms):
+    results = []
+    for size in sizes:
+        data = os.urandom(size)
+        for block_size in block_sizes:
+            for algorithm in algorithms:
+                for mode in ("write_file", "write_file_chunked"):
+                    for version in (1, 2):
+                        with fresh_store(backend) as store:
+                            write = getattr(store._blueprint, mode)
+                            elapsed, _ = timed(
+                                write,
+                                store._client,
+                                "bench.bin",
+                                BytesIO(data),
+                                {"hash": algorithm + ":"},
+                                block_size,
+                                chunks_version=version,
+                            )
+                        results.append(
+                            {
+                                "mode": mode,
+                                "size": size,
+                                "block_size": block_size,
+                                "algorithm": algorithm,
+                                "chunks_version": version,
+                                "seconds": elapsed,
+                                "mib_per_sec": size / MiB / elapsed,
+                            }
+                        )
+    return results
+
+
+def bench_small_files(backend, count, size):
+    data = os.urandom(size)
+    results = {}
+    with fresh_store(backend) as store:
+        elapsed, _ = timed(
+            lambda: [
+                store.write_file(f"serial-{i:08d}", BytesIO(data)) for i in range(count)
+            ]
+        )
+        results["write_file"] = {"count": count, "files_per_sec": count / elapsed}
+
+    with fresh_store(backend) as store:
+        items = [(f"many-{i:08d}", BytesIO(data), {}) for i in range(count)]
+        elapsed, _ = timed(store.write_many, items)
+        results["write_many"] = {"count": count, "files_per_sec": count / elapsed}
+    return results
+
+
+def bench_read_latency(backend, keys, iterations):
+    results = {}
+    for name, kwargs in (("no_cache", {}), ("cache", {"cache": MetaCache()})):
+        with fresh_store(backend, **kwargs) as store:
+            for i in range(keys):
+                store.write_file(f"{i:08d}", BytesIO(b"x" * 1024))
+
+            read_meta, open_ = [], []
+            for n in range(iterations):
+                key = f"{n % keys:08d}"
+                elapsed, _ = timed(store.read_meta, key)
+                read_meta.append(elapsed)
+
+                start = time.perf_counter()
+                with store.open(key) as f:
+                    f.read()
+                open_.append(time.perf_counter() - start)
+
+            results[name] = {
+                "read_meta": percentiles(read_meta),
+                "open": percentiles(open_),
+            }
+    return results
+
+
+def bench_ls_scaling(backend, key_counts):
+    results = []
+    for count in key_counts:
+        index = CatalogIndex()
+        with fresh_store(backend) as store:
+            store.write_many([(f"{i:08d}", BytesIO(b"x"), {}) for i in range(count)])
+            elapsed_scan, keys = timed(store.ls, "")
+            assert len(keys) == count
+
+            indexed = MyStore.from_fsspec(store._client, store._blueprint, index=index)
+            indexed.rebuild_index()
+            elapsed_index, keys = timed(indexed.ls, "")
+            assert len(keys) == count
+        index.close()
+        results.append(
+            {"keys": count, "ls_ms": elapsed_scan * 1000, "index_ls_ms": elapsed_index * 1000}
+        )
+    return results
+
+
+def bench_lock_contention(backend, threads, writes):
+    """同一キーへの同時書き込み（競合）と別キーへの同時書き込みを比較する"""
+    results = {}
+    for name, same_key in (("same_key", True), ("distinct_keys", False)):
+        with fresh_store(backend) as store:
+            counts = {"ok": 0, "locked": 0}
+            lock = threading.Lock()
+
+            def worker(n):
+                for i in range(writes):
+                    key = "contended.bin" if same_key else f"{n}-{i}.bin"
+                    try:
+                        store.write_file(key, BytesIO(b"x" * 4096))
+                        status = "ok"
+                    except RFC7807Error as e:
+                        status = "locked" if e.status == 409 else "error"
+                    except FileNotFoundError:
+                        # 競合相手のロールバックでファイルが消えた場合
+                        status = "locked"
+                    with lock:
+                        counts[status] = counts.get(status, 0) + 1
+
+            workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+            start = time.perf_counter()
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            elapsed = time.perf_counter() - start
+
+            results[name] = {
+                **counts,
+                "threads": threads,
+                "attempts_per_sec": threads * writes / elapsed,
+            }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(backend: str, quick: bool = False) -> dict:
+    if quick:
+        sizes, block_sizes, algorithms = [4 * MiB], [256 * 1024, MiB], ["sha256"]
+        small_count, latency_keys, iterations = 100, 20, 200
+        key_counts, threads, writes = [100, 1000], 4, 10
+    else:
+        sizes = [64 * MiB]
+        block_sizes = [MiB, 8 * MiB, 32 * MiB]
+        algorithms = ["sha256", "blake2b", "md5"]
+        small_count, latency_keys, iterations = 2000, 200, 5000
+        key_counts, threads, writes = [100, 1000, 10000], 8, 50
+
+    return {
+        "meta": {
+            "backend": backend,
+            "quick": quick,
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fsspec": fsspec.__version__,
+        },
+        "write_throughput": bench_write_throughput(backend, sizes, block_sizes, algorithms),
+        "small_files": bench_small_files(backend, small_count, 4096),
+        "read_latency": bench_read_latency(backend, latency_keys, iterations),
+        "ls_scaling": bench_ls_scaling(backend, key_counts),
+        "lock_contention": bench_lock_contention(backend, threads, writes),
+    }
+
+
+def flatten(result, prefix=""):
+    """比較用に数値の項目を "a.b.c" 形式のキーで返す"""
+    items = {}
+    if isinstance(result, dict):
+        for k, v in result.items():
+            if k != "meta":
+                items.update(flatten(v, f"{prefix}{k}."))
+    elif isinstance(result, list):
+        for v in result:
+            label = ",".join(
+                f"{k}={v[k]}" for k in sorted(v) if isinstance(v[k], str) or k in ("size", "block_size", "keys", "chunks_version")
+            )
+            items.update(flatten(v, f"{prefix}[{label}]."))
+    elif isinstance(result, (int, float)) and not isinstance(result, bool):
+        items[prefix.rstrip(".")] = result
+    return items
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """threshold を超えて悪化した項目を返す（_ms, seconds は小さいほど良い）"""
+    old_items, new_items = flatten(old), flatten(new)
+    regressions = []
+    for name in sorted(old_items.keys() & new_items.keys()):
+        before, after = old_items[name], new_items[name]
+        if not before:
+            continue
+        if name.endswith(("_ms", "seconds")):
+            change = (after - before) / before
+        elif name.endswith("_per_sec"):
+            change = (before - after) / before
+        else:
+            continue
+        if threshold < change:
+            regressions.append(f"{name}: {before:.4g} -> {after:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="bench_store.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.1)
+        args = parser.parse_args(argv[1:])
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        for line in regressions:
+            print(line)
+        return 1 if regressions else 0
+
+    parser = argparse.ArgumentParser(prog="bench_store.py")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="memory")
+    parser.add_argument("--quick", action="store_true", help="小さいパラメータで実行する")
+    parser.add_argument("--output", help="結果を書き込む JSON ファイル（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    result = run(args.backend, quick=args.quick)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
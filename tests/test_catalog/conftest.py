@@ -0,0 +1,12 @@
+from amature_fs.store import MyStore
+import pytest
+
+
+TOKEN = "xxx"
+
+
+@pytest.fixture
+def tmp_store(tmp_path):
+    store = MyStore.from_local(str(tmp_path))
+    store.init(token=TOKEN)
+    yield store
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+from io import BytesIO
+
+import fsspec
+from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+from fsspec.implementations.dirfs import DirFileSystem
+
+from amature_fs.aio import AsyncMyStore, iter_blocks
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def create_async_store(tmp_store: MyStore, root):
+    fs = AsyncFileSystemWrapper(fsspec.filesystem("file"), asynchronous=True)
+    client = DirFileSystem(path=str(root), fs=fs, asynchronous=True)
+    return AsyncMyStore.from_fsspec(client, tmp_store._blueprint, max_concurrency=4)
+
+
+async def agen(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+def test_async_store(tmp_store: MyStore, tmp_path):
+    data = bytes(range(256)) * 40
+
+    async def main():
+        store = create_async_store(tmp_store, tmp_path)
+        meta = await store.write_file("a.bin", agen(data, 300), {"v": 1}, 1000)
+        assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+        assert len(meta["system"]["chunks"]["block_hashes"]) == 11
+
+        assert (await store.read_meta("a.bin"))["user"] == {"v": 1}
+        assert await store.ls("") == ["a.bin"]
+
+        async with await store.open("a.bin", verify=True) as f:
+            assert await f.read_range(2500, 1000) == data[2500:3500]
+            f.seek(9000)
+            assert b"".join([block async for block in f]) == data[9000:]
+
+        # 同期ファイルも受け付ける
+        await store.write_file("b.bin", BytesIO(b"xxx"), {})
+
+        with pytest.raises(RFC7807Error):
+            await store.write_file("c.bin", BytesIO(b"xxx"), {"size": 4})
+        with pytest.raises(RFC7807Error):
+            await store.read_meta("c.bin")
+
+        results = await asyncio.gather(
+            *(store.write_file(f"p{i}.bin", agen(data, 500), {}, 1000) for i in range(10))
+        )
+        assert len({meta["system"]["id"] for meta in results}) == 10
+
+    asyncio.run(main())
+
+    # 同期のストアからも読み込める
+    with tmp_store.open("a.bin", "rb") as f:
+        assert f.read() == data
+    assert sorted(tmp_store.ls("")) == ["a.bin", "b.bin"] + [f"p{i}.bin" for i in range(10)]
+
+
+def test_async_versions(tmp_store: MyStore, tmp_path):
+    tmp_store._blueprint._blueprint["rules"]["system"]["versioning"] = True
+    tmp_store.write_file("a.bin", BytesIO(b"v0"))
+
+    async def main():
+        store = create_async_store(tmp_store, tmp_path)
+        await store.write_file("a.bin", agen(b"v1" * 600, 300), {}, 1000)
+        await store.write_file("a.bin", agen(b"v2", 300), {}, 1000)
+        with pytest.raises(RFC7807Error):
+            await store.write_file("a.bin", BytesIO(b"xxx"), {"size": 4})
+
+    asyncio.run(main())
+
+    # 非同期の上書きも旧バージョンを退避し、失敗した書き込みは最新を変更しない
+    ids = tmp_store.list_versions("a.bin")
+    assert len(ids) == 3
+    for id, data in zip(ids, [b"v0", b"v1" * 600, b"v2"]):
+        with tmp_store.open_version("a.bin", id=id) as f:
+            assert f.read() == data
+    assert tmp_store.open("a.bin").read() == b"v2"
+
+
+class ShortReader:
+    """read のたびに最大 step バイトしか返さないファイル。"""
+
+    def __init__(self, data: bytes, step: int, asynchronous: bool = False):
+        self._f = BytesIO(data)
+        self._step = step
+        self._asynchronous = asynchronous
+
+    def read(self, size: int = -1):
+        data = self._f.read(min(size, self._step))
+        if not self._asynchronous:
+            return data
+
+        async def _read():
+            return data
+
+        return _read()
+
+
+def test_iter_blocks_short_read():
+    data = bytes(range(256)) * 10
+
+    async def collect(file):
+        return [block async for block in iter_blocks(file, 1000)]
+
+    for asynchronous in [False, True]:
+        blocks = asyncio.run(collect(ShortReader(data, 300, asynchronous)))
+        assert [len(block) for block in blocks] == [1000, 1000, 560]
+        assert b"".join(blocks) == data
+
+    assert asyncio.run(collect(ShortReader(b"", 300))) == []
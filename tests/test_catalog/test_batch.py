@@ -0,0 +1,51 @@
+from io import BytesIO
+
+from amature_fs.store import RFC7807Error, MyStore
+
+
+def test_write_many(tmp_store: MyStore):
+    items = [(f"{i}.bin", BytesIO(b"x" * i), {"n": i}) for i in range(20)]
+    items.append(("bad.bin", BytesIO(b"xxx"), {"size": 4}))
+    results = tmp_store._blueprint.write_many(
+        tmp_store._client, items, max_workers=4, commit_batch_size=8
+    )
+
+    assert isinstance(results.pop("bad.bin"), RFC7807Error)
+    assert sorted(results) == sorted(f"{i}.bin" for i in range(20))
+    assert all(meta["system"]["size"] == meta["user"]["n"] for meta in results.values())
+    assert sorted(tmp_store.ls("")) == sorted(f"{i}.bin" for i in range(20))
+    assert tmp_store._client.ls("processing/meta", detail=False) == []
+    assert tmp_store._client.ls("processing/data", detail=False) == []
+
+    # 上書き
+    results = tmp_store.write_many([("1.bin", BytesIO(b"yy"), {"n": 2})])
+    assert results["1.bin"]["user"] == {"n": 2}
+    with tmp_store.open("1.bin") as f:
+        assert f.read() == b"yy"
+
+
+def test_read_many(tmp_store: MyStore):
+    tmp_store.write_many([(f"{i}.bin", BytesIO(b"x" * i), {"n": i}) for i in range(5)])
+    tmp_store.write_file_chunked("c.bin", BytesIO(b"chunked"), {"n": 7})
+    tmp_store._client.pipe_file("processing/meta/4.bin", b"{}")
+
+    keys = ["0.bin", "3.bin", "c.bin", "4.bin", "missing.bin"]
+    metas = tmp_store.read_meta_many(keys)
+    assert list(metas) == keys
+    assert metas["3.bin"]["user"] == {"n": 3}
+    assert metas["c.bin"]["user"] == {"n": 7}
+    assert metas["4.bin"].status == 409
+    assert metas["missing.bin"].status == 404
+
+    contents = tmp_store.read_many(keys)
+    assert contents["0.bin"] == b""
+    assert contents["3.bin"] == b"xxx"
+    assert contents["c.bin"] == b"chunked"
+    assert contents["missing.bin"].status == 404
+
+    files = tmp_store.open_many(["3.bin", "c.bin", "missing.bin"])
+    with files["3.bin"] as f:
+        assert f.read() == b"xxx"
+    with files["c.bin"] as f:
+        assert f.read() == b"chunked"
+    assert isinstance(files["missing.bin"], RFC7807Error)
@@ -0,0 +1,115 @@
+from io import BytesIO
+
+from amature_fs.collector import GarbageCollector
+from amature_fs.store import MyStore
+import pytest
+
+
+def test_dedup_write(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    pool = blueprint.get_block_pool(fs)
+
+    data = b"".join(bytes([i]) * 1000 for i in range(10))
+    meta = blueprint.write_file_chunked(fs, "ckpt.bin", BytesIO(data), {}, 1000, dedup=True)
+    assert meta["system"]["chunks"]["dedup"] == {"blocks": 10, "reused": 0, "ratio": 0.0}
+
+    # 1 ブロックだけ変更して書き直すと、残りのブロックは再利用される
+    changed = data[:5000] + b"x" * 1000 + data[6000:]
+    meta = blueprint.write_file_chunked(
+        fs, "ckpt.bin", BytesIO(changed), {}, 1000, dedup=True
+    )
+    assert meta["system"]["chunks"]["dedup"] == {"blocks": 10, "reused": 9, "ratio": 0.9}
+
+    with tmp_store.open("ckpt.bin", "rb", verify=True) as f:
+        assert f.read() == changed
+
+    # 旧バージョンのみが参照していたブロックは、参照を失い GC で削除される
+    block_hashes = meta["system"]["chunks"]["block_hashes"]
+    assert all(pool.refs(h) == [meta["system"]["id"]] for h in block_hashes)
+    assert len(fs.find(pool.data_dir)) == 11
+    assert GarbageCollector(fs, blueprint, grace=0).run_cycle() == {"blocks": 1}
+    assert len(fs.find(pool.data_dir)) == 10
+
+    # 別キーから同じブロックを参照する
+    other = blueprint.write_file_chunked(
+        fs, "copy.bin", BytesIO(changed), {}, 1000, dedup=True
+    )
+    assert other["system"]["chunks"]["dedup"]["ratio"] == 1.0
+    assert len(pool.refs(block_hashes[0])) == 2
+
+    tmp_store.write_file("ckpt.bin", BytesIO(b"plain"))
+    assert len(fs.find(pool.data_dir)) == 10
+    assert pool.refs(block_hashes[0]) == [other["system"]["id"]]
+
+    tmp_store.write_file("copy.bin", BytesIO(b"plain"))
+    assert len(fs.find(pool.data_dir)) == 10
+    assert GarbageCollector(fs, blueprint, grace=0).run_cycle() == {"blocks": 10}
+    assert fs.find(pool.data_dir) == []
+
+
+def test_put_pins_block(tmp_store: MyStore, monkeypatch):
+    fs = tmp_store._client
+    pool = tmp_store._blueprint.get_block_pool(fs)
+    block_hash = "sha256:" + "ab" * 32
+
+    assert pool.put(block_hash, b"x", ref_id="old")
+    # 再利用を決めた時点で参照を追加するため、他の参照の解放で削除されない
+    assert not pool.put(block_hash, b"x", ref_id="new")
+    pool.decref("old", [block_hash])
+    assert pool.get(block_hash) == b"x"
+    assert pool.refs(block_hash) == ["new"]
+
+    # 一時ファイルから移動するため、書き込みに失敗しても不完全なブロックは残らない
+    def broken_mv(*args, **kwargs):
+        raise OSError("broken")
+
+    monkeypatch.setattr(fs, "mv", broken_mv)
+    other = "sha256:" + "cd" * 32
+    with pytest.raises(OSError):
+        pool.put(other, b"y")
+    assert not pool.exists(other)
+    assert fs.find(pool.data_dir) == [pool.get_block_path(block_hash)]
+
+
+def test_remove_keeps_repinned_block(tmp_store: MyStore, monkeypatch):
+    fs = tmp_store._client
+    pool = tmp_store._blueprint.get_block_pool(fs)
+    block_hash = "sha256:" + "ab" * 32
+    pool.put(block_hash, b"x", ref_id="old")
+
+    # decref は参照のみを削除し、ブロックは残す
+    pool.decref("old", [block_hash])
+    assert pool.refs(block_hash) == [] and pool.exists(block_hash)
+
+    # 参照の確認と墓標への移動の間に、put が再利用を決めて参照を追加した
+    mv = fs.mv
+    reused = []
+
+    def racing_mv(path1, path2, *args, **kwargs):
+        if path2.endswith(".deleted"):
+            reused.append(pool.put(block_hash, b"x", ref_id="new"))
+        mv(path1, path2, *args, **kwargs)
+
+    monkeypatch.setattr(fs, "mv", racing_mv)
+    assert not pool.remove(block_hash)
+    assert reused == [False]
+    assert pool.get(block_hash) == b"x"
+    assert fs.find(pool.data_dir) == [pool.get_block_path(block_hash)]
+
+    # 移動の後に put した場合はブロックを書き込み直す
+    def late_mv(path1, path2, *args, **kwargs):
+        mv(path1, path2, *args, **kwargs)
+        if path2.endswith(".deleted"):
+            reused.append(pool.put(block_hash, b"x", ref_id="late"))
+
+    pool.decref("new", [block_hash])
+    monkeypatch.setattr(fs, "mv", late_mv)
+    assert not pool.remove(block_hash)
+    assert reused == [False, True]
+    assert fs.find(pool.data_dir) == [pool.get_block_path(block_hash)]
+
+    monkeypatch.setattr(fs, "mv", mv)
+    pool.decref("late", [block_hash])
+    assert pool.remove(block_hash)
+    assert not pool.exists(block_hash)
@@ -0,0 +1,84 @@
+from io import BytesIO, RawIOBase
+import hashlib
+import threading
+
+from amature_fs.buffers import BufferPool, read_block
+from amature_fs.store import MyStore, StoreBluePrint
+import pytest
+
+
+class ShortReader(RawIOBase):
+    """readinto が最大 7 バイトずつしか返さないファイル"""
+
+    def __init__(self, data: bytes):
+        self._file = BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._file.read(min(len(b), 7))
+        b[: len(data)] = data
+        return len(data)
+
+
+def test_read_block():
+    buf = bytearray(10)
+    file = ShortReader(b"0123456789abc")
+    assert bytes(read_block(file, buf)) == b"0123456789"
+    assert bytes(read_block(file, buf)) == b"abc"
+    assert not read_block(file, buf)
+
+    # readinto を持たず、read も最大 3 バイトずつしか返さないファイル
+    class Reader:
+        def __init__(self, data: bytes):
+            self._file = BytesIO(data)
+
+        def read(self, size):
+            return self._file.read(min(size, 3))
+
+    file = Reader(b"0123456789xyz")
+    assert bytes(read_block(file, buf)) == b"0123456789"
+    assert bytes(read_block(file, buf)) == b"xyz"
+    assert not read_block(file, buf)
+
+
+def test_buffer_pool_limit():
+    pool = BufferPool(20)
+    a = pool.acquire(10)
+    b = pool.acquire(10)
+    with pytest.raises(TimeoutError):
+        pool.acquire(10, timeout=0.01)
+
+    threading.Timer(0.05, pool.release, args=(a,)).start()
+    c = pool.acquire(10, timeout=5)
+    assert c is a  # 返却されたバッファを再利用する
+    pool.release(b)
+    pool.release(c)
+    assert pool.allocated_bytes == 20 and pool.in_use_bytes == 0
+
+    # サイズの異なるバッファは未使用のものを解放して確保する
+    with pool.lease(15) as buf:
+        assert len(buf) == 15
+        assert pool.allocated_bytes <= 20
+
+
+@pytest.mark.parametrize("mode", ["write_file", "write_file_chunked"])
+def test_write_with_small_buffer_pool(tmp_path, mode):
+    config = StoreBluePrint.get_default()
+    config["rules"]["system"]["default_block_size"] = 1000
+    config["rules"]["system"]["buffer_pool_blocks"] = 2
+    store = MyStore.from_fsspec(
+        MyStore.from_local(str(tmp_path))._client, StoreBluePrint(config)
+    )
+    store.init(token="xxx")
+    data = bytes(range(256)) * 40
+
+    meta = getattr(store._blueprint, mode)(store._client, "a.bin", BytesIO(data), {})
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+    assert store.read_range("a.bin", 0, len(data), verify=True) == data
+
+    pool = store._blueprint.get_buffer_pool()
+    assert pool.max_bytes == 2000
+    assert pool.in_use_bytes == 0
+    assert pool.allocated_bytes <= 2000
@@ -0,0 +1,82 @@
+from io import BytesIO
+
+from amature_fs.cache import MetaCache
+from amature_fs.store import MyStore, StoreBluePrint
+import pytest
+
+
+def with_cache(store: MyStore, cache: MetaCache):
+    # プロセスごとに別の blueprint を持つ状況を再現する
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    return MyStore.from_fsspec(store._client, blueprint, cache=cache)
+
+
+def test_meta_cache_lru():
+    cache = MetaCache(max_entries=2, generation_path=None)
+    cache.put("a", {"n": 1})
+    cache.put("b", {"n": 2})
+    assert cache.get(None, "a") == {"n": 1}
+    cache.put("c", {"n": 3})
+    assert cache.get(None, "b") is None
+    assert cache.get(None, "a") == {"n": 1}
+
+    cache = MetaCache(max_bytes=30, generation_path=None)
+    cache.put("a", {"data": "x" * 10})
+    cache.put("b", {"data": "y" * 10})
+    assert len(cache) == 1 and cache.get(None, "b") is not None
+    cache.put("c", {"data": "z" * 100})
+    assert cache.get(None, "c") is None
+
+    cache = MetaCache(ttl=0, generation_path=None)
+    cache.put("a", {"n": 1})
+    assert cache.get(None, "a") is None
+
+
+def test_store_meta_cache(tmp_store: MyStore):
+    store = with_cache(tmp_store, MetaCache())
+    store.write_file("a.bin", BytesIO(b"xxx"), {"v": 1})
+
+    assert store.read_meta("a.bin")["user"] == {"v": 1}
+    with store.open("a.bin") as f:
+        assert f.read() == b"xxx"
+    assert store._cache.hits == 1 and store._cache.misses == 1
+
+    # 自プロセスの commit で無効化される
+    store.write_file("a.bin", BytesIO(b"yyyy"), {"v": 2})
+    assert store.read_meta("a.bin")["user"] == {"v": 2}
+    assert store.read_range("a.bin", 0, 10) == b"yyyy"
+
+
+def test_store_meta_cache_generation(tmp_store: MyStore):
+    reader = with_cache(tmp_store, MetaCache(check_interval=0))
+    writer = with_cache(tmp_store, MetaCache(check_interval=0))
+
+    writer.write_file("a.bin", BytesIO(b"xxx"), {"v": 1})
+    assert reader.read_meta("a.bin")["user"] == {"v": 1}
+
+    # 他プロセスの commit は世代マーカーで検知する
+    writer.write_file("a.bin", BytesIO(b"yyy"), {"v": 2})
+    assert reader.read_meta("a.bin")["user"] == {"v": 2}
+
+
+def test_stale_read_not_cached(tmp_store: MyStore, monkeypatch):
+    cache = MetaCache(generation_path=None)
+    epoch = cache.epoch()
+    cache.invalidate("a")
+    cache.put("a", {"n": 1}, epoch)
+    assert cache.get(None, "a") is None
+
+    store = with_cache(tmp_store, MetaCache())
+    store.write_file("a.bin", BytesIO(b"xxx"), {"v": 1})
+    read_meta = store._blueprint.read_meta
+
+    # 読み込みの途中で commit された場合、読み込んだ古いメタデータをキャッシュしない
+    def racing_read_meta(fs, key):
+        meta = read_meta(fs, key)
+        store.write_file(key, BytesIO(b"yyy"), {"v": 2})
+        return meta
+
+    monkeypatch.setattr(store._blueprint, "read_meta", racing_read_meta)
+    assert store.read_meta("a.bin")["user"] == {"v": 1}
+    monkeypatch.undo()
+    assert store.read_meta("a.bin")["user"] == {"v": 2}
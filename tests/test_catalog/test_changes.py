@@ -0,0 +1,74 @@
+from io import BytesIO
+import threading
+import time
+
+from amature_fs.changes import ChangeFeed
+from amature_fs.store import MyStore, StoreBluePrint
+import fsspec
+import pytest
+
+
+@pytest.fixture
+def feed_store(tmp_path):
+    fs, _ = fsspec.url_to_fs(f"dir::local://{tmp_path}")
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    store = MyStore.from_fsspec(fs, blueprint, feed=ChangeFeed(segment_seconds=1))
+    store.init(token="xxx")
+    return store
+
+
+def test_read_changes(feed_store: MyStore):
+    store = feed_store
+    meta = store.write_file("a.bin", BytesIO(b"abc"))
+    store.write_many([("b.bin", BytesIO(b"b"), {}), ("c.bin", BytesIO(b"c"), {})])
+    time.sleep(1.1)
+    store.delete("a.bin")
+
+    events = store.read_changes()
+    assert [(e["key"], e["op"]) for e in events[::3]] == [
+        ("a.bin", "commit"),
+        ("a.bin", "rollback"),
+    ]
+    # write_many は並列にコミットするため、b と c の順序は決まらない
+    assert sorted((e["key"], e["op"]) for e in events[1:3]) == [
+        ("b.bin", "commit"),
+        ("c.bin", "commit"),
+    ]
+    assert events[0]["object_id"] == meta["system"]["id"]
+    assert (events[0]["size"], events[0]["hash"]) == (3, meta["system"]["hash"])
+    assert events[3]["hash"] is None
+    assert [e["id"] for e in events] == sorted(e["id"] for e in events)
+
+    # 時刻で区切られたセグメントから since 以降だけを読み込む
+    feed = store._feed
+    assert len(feed.list_segments(store._client)) >= 2
+    assert store.read_changes(since=events[1]["id"]) == events[2:]
+    assert store.read_changes(since=events[0]["id"], limit=2) == events[1:3]
+    assert store.read_changes(since=time.time() + 1) == []
+    assert store.read_changes(since=0) == events
+
+    assert feed.trim(store._client, before=time.time() + 2) >= 2
+    assert store.read_changes() == []
+
+
+def test_follow_changes(feed_store: MyStore):
+    store = feed_store
+    store.write_file("old.bin", BytesIO(b"old"))
+    stop = threading.Event()
+    received = []
+
+    def consume():
+        for event in store.follow_changes(poll_interval=0.01, settle=0, stop=stop):
+            received.append(event["key"])
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.05)
+    for i in range(3):
+        store.write_file(f"{i}.bin", BytesIO(b"x"))
+    deadline = time.time() + 5
+    while len(received) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+    assert received == ["0.bin", "1.bin", "2.bin"]
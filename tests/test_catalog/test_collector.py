@@ -0,0 +1,142 @@
+from io import BytesIO
+import hashlib
+import json
+import logging
+import threading
+
+from amature_fs.collector import PHASES, GarbageCollector
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def crash_during_commit(store: MyStore, key: str, data: bytes, move_data: bool):
+    """コミット中（データの移動後、メタデータの移動前）に停止した状態を作る"""
+    blueprint = store._blueprint
+    fs = store._client
+    meta = blueprint._create_processing_meta(fs, key, {})
+    blueprint._lease_keeper.pop((id(fs), key))
+    staging_path = blueprint.get_staging_path(key, meta["system"]["id"])
+    fs.makedirs(blueprint.get_processing_data_path(key), exist_ok=True)
+    with fs.open(staging_path, "wb") as f:
+        f.write(data)
+    hash = "sha256:" + hashlib.sha256(data).hexdigest()
+    blueprint._finalize_meta(meta, "sha256", len(data), 1024, [hash], [hash])
+    meta["system"].pop("lease")
+    fs.pipe_file(blueprint.get_processing_meta_path(key), json.dumps(meta).encode())
+    if move_data:
+        fs.mv(staging_path, blueprint.get_completed_data_path(key))
+
+
+def test_recover_half_committed(tmp_store: MyStore):
+    tmp_store.write_file("a.bin", BytesIO(b"old"))
+    crash_during_commit(tmp_store, "a.bin", b"new", move_data=True)
+    crash_during_commit(tmp_store, "b.bin", b"xxx", move_data=False)
+    with pytest.raises(RFC7807Error):
+        tmp_store.read_meta("a.bin")
+
+    collector = GarbageCollector(tmp_store._client, tmp_store._blueprint, grace=0)
+    stats = collector.run_cycle()
+    assert stats == {"rolled_forward": 1, "rolled_back": 1}
+
+    assert tmp_store.open("a.bin", verify=True).read() == b"new"
+    assert not tmp_store._client.exists("completed/meta/b.bin")
+    assert tmp_store._client.find("processing") == []
+
+
+def test_collect_garbage(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    data = bytes(range(256)) * 10
+
+    tmp_store.write_file_chunked("chunked.bin", BytesIO(data))
+    tmp_store.write_file_chunked("cas.bin", BytesIO(data), dedup=True)
+    tmp_store.write_file("keep.bin", BytesIO(data))
+    # メタデータだけが失われ、チャンクが残った状態
+    fs.rm("completed/meta/chunked.bin")
+    fs.rm("completed/meta/cas.bin")
+    # メタデータのない processing のデータ
+    fs.pipe_file("processing/data/orphan.bin", b"x")
+    # 失効したリース
+    blueprint._create_processing_meta(fs, "locked.bin", {})
+    blueprint._lease_keeper.pop((id(fs), "locked.bin"))
+    blueprint.reap_lease(fs, "locked.bin", now=0)  # まだ失効していない
+    meta = json.loads(fs.cat_file("processing/meta/locked.bin"))
+    meta["system"]["lease"]["expires"] = 0
+    fs.pipe_file("processing/meta/locked.bin", json.dumps(meta).encode())
+
+    collector = GarbageCollector(fs, blueprint, grace=0)
+    stats = collector.run_cycle()
+    assert stats == {"reaped": 1, "orphans": 1, "chunks": 1, "refs": 1, "blocks": 1}
+    assert fs.find(blueprint.get_chunked_data_path()) == []
+    assert fs.find("processing") == []
+    assert tmp_store.open("keep.bin").read() == data
+
+    # 新しいものは猶予期間中は回収しない
+    fs.pipe_file("processing/data/orphan.bin", b"x")
+    assert GarbageCollector(fs, blueprint).run_cycle() == {}
+    assert fs.exists("processing/data/orphan.bin")
+
+
+def test_resume_cursor(tmp_store: MyStore):
+    fs = tmp_store._client
+    for i in range(3):
+        fs.pipe_file(f"processing/data/{i}.bin", b"x")
+
+    state = GarbageCollector(fs, tmp_store._blueprint, grace=0).step(max_items=2)
+    assert state["phase"] == "orphans" and state["after"] == "1.bin"
+    assert fs.exists("processing/data/2.bin")
+
+    # 別のプロセスで続きから再開する
+    collector = GarbageCollector(fs, tmp_store._blueprint, grace=0)
+    assert collector.run_cycle() == {"orphans": 3}
+    assert collector.load_state()["completed"]["stats"] == {"orphans": 3}
+
+
+def test_list_once_per_phase(tmp_store: MyStore, monkeypatch):
+    fs = tmp_store._client
+    for i in range(5):
+        fs.pipe_file(f"processing/data/{i}.bin", b"x")
+
+    collector = GarbageCollector(fs, tmp_store._blueprint, grace=0)
+    listed = []
+    list_phase = collector._list
+
+    def recording_list(phase):
+        listed.append(phase)
+        return list_phase(phase)
+
+    monkeypatch.setattr(collector, "_list", recording_list)
+    # 1 件ずつ処理しても、各フェーズの一覧はサイクルごとに 1 回だけ取得する
+    assert collector.run_cycle(batch_size=1) == {"orphans": 5}
+    assert sorted(listed) == sorted(PHASES)
+
+
+def test_reference_scan_is_rate_limited(tmp_store: MyStore):
+    fs = tmp_store._client
+    for i in range(5):
+        tmp_store.write_file(f"{i}.bin", BytesIO(b"x"))
+
+    collector = GarbageCollector(fs, tmp_store._blueprint, grace=0, rate=1000)
+    acquired = []
+    collector._limiter.acquire = lambda amount=1: acquired.append(amount)
+    # 参照の一覧は 1 回の走査で求め、読み込んだメタデータの数だけ制限する
+    assert len(collector.referenced_ids()) == 5
+    assert collector.referenced_segments() == set()
+    assert sum(acquired) == 5
+
+
+def test_start_logs_failures(tmp_store: MyStore, monkeypatch, caplog):
+    collector = GarbageCollector(tmp_store._client, tmp_store._blueprint, grace=0)
+    failed = threading.Event()
+
+    def broken_cycle(batch_size):
+        failed.set()
+        raise OSError("broken")
+
+    monkeypatch.setattr(collector, "run_cycle", broken_cycle)
+    with caplog.at_level(logging.ERROR, logger="amature_fs.collector"):
+        collector.start(interval=60)
+        assert failed.wait(5)
+        collector.stop(timeout=5)
+    assert "Garbage collection cycle failed." in caplog.text
+    assert "OSError: broken" in caplog.text
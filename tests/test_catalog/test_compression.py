@@ -0,0 +1,78 @@
+from io import BytesIO
+import hashlib
+import os
+
+from amature_fs import compression
+from amature_fs.scrubber import Scrubber
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def sha256(data: bytes):
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd", "lz4"])
+def test_write_compressed(tmp_store: MyStore, codec):
+    if codec not in compression.available_codecs():
+        pytest.skip(f"{codec} is not installed")
+    bp = tmp_store._blueprint
+    fs = tmp_store._client
+    # ブロック 2 は圧縮できないため無圧縮で格納される
+    data = b"a,b,c\n" * 500 + os.urandom(1000) + b"x" * 2500
+    meta = bp.write_file(
+        fs, "a.csv", BytesIO(data), {"hash": sha256(data)}, 1000, compression=codec
+    )
+
+    chunks = meta["system"]["chunks"]
+    assert chunks["codecs"] == [codec, codec, codec, "none", codec, codec, codec]
+    assert chunks["compressed_sizes"][3] == 1000
+    assert fs.size("completed/data/a.csv") == sum(chunks["compressed_sizes"]) < len(data)
+    assert meta["system"]["hash"] == sha256(data)
+    assert tmp_store.get_local_path("a.csv") is None
+
+    assert tmp_store.open("a.csv").read() == data
+    assert tmp_store.open("a.csv", verify=True).read() == data
+    assert tmp_store.read_range("a.csv", 2500, 2000) == data[2500:4500]
+    assert bp.read_many(fs, ["a.csv"])["a.csv"] == data
+
+
+def test_auto_compression(tmp_store: MyStore):
+    bp = tmp_store._blueprint
+    fs = tmp_store._client
+    data = b"0123456789" * 300
+    meta = bp.write_file(fs, "a.txt", BytesIO(data), {}, 1000, compression="auto")
+    assert meta["system"]["chunks"]["codecs"][0] in compression.available_codecs()
+
+    # 先頭ブロックが縮まない場合は圧縮しない（ローカルの高速経路を使える）
+    data = os.urandom(3000)
+    meta = bp.write_file(fs, "b.bin", BytesIO(data), {}, 1000, compression="auto")
+    assert not meta["system"]["chunks"]["codecs"]
+    assert tmp_store.get_local_path("b.bin") is not None
+
+    with pytest.raises(RFC7807Error):
+        tmp_store.write_file("c.bin", BytesIO(data), compression="unknown")
+
+
+def test_scrub_compressed(tmp_store: MyStore):
+    bp = tmp_store._blueprint
+    fs = tmp_store._client
+    data = b"a,b,c\n" * 1000
+    meta = bp.write_file(fs, "a.csv", BytesIO(data), {}, 1000, compression="zlib")
+
+    scrubber = Scrubber(fs, bp, use_threads=True)
+    state = scrubber.run()
+    assert state["corrupt"] == []
+    assert state["bytes"] == sum(meta["system"]["chunks"]["compressed_sizes"])
+
+    # 2 番目の圧縮ブロックを壊す
+    offset = meta["system"]["chunks"]["compressed_sizes"][0]
+    with fs.open("completed/data/a.csv", "r+b") as f:
+        f.seek(offset + 2)
+        f.write(b"\xff\xff")
+
+    corrupt = scrubber.run()["corrupt"]
+    assert [(c["index"], c["offset"]) for c in corrupt] == [(1, 1000)]
+    assert corrupt[0]["error"] in ("decode_error", "hash_mismatch")
+    with pytest.raises(RFC7807Error):
+        tmp_store.open("a.csv", verify=True).read()
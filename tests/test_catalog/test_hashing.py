@@ -0,0 +1,99 @@
+from io import BytesIO
+import hashlib
+import zlib
+
+from amature_fs import hashing
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def test_builtin_algorithms():
+    assert hashing.calculate_hash("sha256", b"abc") == hashlib.sha256(b"abc").hexdigest()
+    assert hashing.calculate_hash("sha512_224", b"abc") == (
+        hashlib.new("sha512_224", b"abc").hexdigest()
+    )
+    assert hashing.calculate_hash("crc32", b"abc") == f"{zlib.crc32(b'abc'):08x}"
+
+    h = hashing.get_hash_cls("crc32")()
+    h.update(b"a")
+    assert h.hexdigest() == f"{zlib.crc32(b'a'):08x}"
+    h.update(b"bc")
+    assert h.hexdigest() == f"{zlib.crc32(b'abc'):08x}"
+
+    with pytest.raises(RFC7807Error):
+        hashing.get_hash_cls("unknown")
+
+
+def test_register_hash_backend():
+    hashing.register_hash_backend("test-md5", hashlib.md5)
+    try:
+        assert hashing.verify_hash("test-md5:" + hashlib.md5(b"x").hexdigest(), b"x")
+        with pytest.raises(RFC7807Error):
+            hashing.register_hash_backend("test-md5", hashlib.sha1)
+    finally:
+        hashing.unregister_hash_backend("test-md5")
+
+
+@pytest.mark.parametrize(
+    "algorithm,module",
+    [("blake3", "blake3"), ("xxh3", "xxhash"), ("crc32c", "crc32c"), ("crc32", "zlib")],
+)
+def test_write_with_backend(tmp_store: MyStore, algorithm, module):
+    pytest.importorskip(module)
+    data = bytes(range(256)) * 100
+
+    meta = tmp_store._blueprint.write_file_chunked(
+        tmp_store._client, "a.bin", BytesIO(data), {"hash": algorithm + ":"}, 4096
+    )
+    assert meta["system"]["hash"] == algorithm + ":" + hashing.calculate_hash(algorithm, data)
+    assert meta["system"]["chunks"]["block_hashes"][1] == (
+        algorithm + ":" + hashing.calculate_hash(algorithm, data[4096:8192])
+    )
+    assert tmp_store.read_range("a.bin", 4000, 5000, verify=True) == data[4000:9000]
+
+
+@pytest.mark.parametrize("mode", ["write_file", "write_file_chunked"])
+def test_chunks_version_2(tmp_store: MyStore, mode):
+    data = bytes(range(256)) * 100
+    write = getattr(tmp_store._blueprint, mode)
+
+    meta = write(tmp_store._client, "a.bin", BytesIO(data), {}, 4096, chunks_version=2)
+    chunks = meta["system"]["chunks"]
+    assert chunks["version"] == 2
+    assert chunks["cumulative_hashes"] == hashing.chain_hashes(chunks["block_hashes"])
+    assert meta["system"]["hash"] == hashing.calculate_file_hash(
+        "sha256", BytesIO(data), 4096, version=2
+    )
+    assert hashing.verify_chunk_table(tmp_store.read_meta("a.bin"))
+    assert tmp_store.read_range("a.bin", 4000, 5000, verify=True) == data[4000:9000]
+
+    # クライアント側で計算した system.hash を期待値として指定できる
+    meta = write(
+        tmp_store._client,
+        "b.bin",
+        BytesIO(data),
+        {"hash": meta["system"]["hash"]},
+        4096,
+        chunks_version=2,
+    )
+    assert meta["system"]["chunks"]["version"] == 2
+
+
+def test_verify_chunk_table(tmp_store: MyStore):
+    meta = tmp_store.write_file("a.bin", BytesIO(b"abc"))
+    assert meta["system"]["chunks"]["version"] == 1
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(b"abc").hexdigest()
+    assert hashing.verify_chunk_table(meta)
+
+    meta = tmp_store._blueprint.write_file(
+        tmp_store._client, "b.bin", BytesIO(b"x" * 10), {}, 4, chunks_version=2
+    )
+    assert hashing.verify_chunk_table(meta)
+    meta["system"]["chunks"]["block_hashes"][0] = "sha256:" + "0" * 64
+    assert not hashing.verify_chunk_table(meta)
+
+    meta = tmp_store._blueprint.write_file(
+        tmp_store._client, "c.bin", BytesIO(b""), {}, chunks_version=2
+    )
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(b"").hexdigest()
+    assert hashing.verify_chunk_table(meta)
@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from amature_fs.index import CatalogIndex
+from amature_fs.store import RFC7807Error, MyStore, StoreBluePrint
+import pytest
+
+
+@pytest.fixture
+def indexed_store(tmp_path):
+    store = MyStore.from_local(str(tmp_path / "catalog"))
+    store.init(token="xxx")
+    index = CatalogIndex(str(tmp_path / "index.sqlite"))
+    yield MyStore.from_fsspec(store._client, store._blueprint, index=index)
+    index.close()
+
+
+def test_index_query(indexed_store: MyStore):
+    for i in range(5):
+        indexed_store.write_file(f"a-{i}.bin", BytesIO(b"x" * i), {"kind": "a", "n": i})
+    indexed_store.write_file("b.bin", BytesIO(b"yyy"), {"kind": "b"})
+
+    assert indexed_store.ls("") == ["a-0.bin", "a-1.bin", "a-2.bin", "a-3.bin", "a-4.bin", "b.bin"]
+    assert indexed_store.ls("a-") == ["a-0.bin", "a-1.bin", "a-2.bin", "a-3.bin", "a-4.bin"]
+
+    index = indexed_store._index
+    assert index.ls("a-", limit=2) == ["a-0.bin", "a-1.bin"]
+    assert index.ls("a-", after="a-1.bin", limit=2) == ["a-2.bin", "a-3.bin"]
+    assert index.ls(size_min=3) == ["a-3.bin", "a-4.bin", "b.bin"]
+    assert index.ls(user={"kind": "b"}) == ["b.bin"]
+    assert index.ls(user={"kind": "a", "n": 2}) == ["a-2.bin"]
+
+    meta = indexed_store.read_meta("b.bin")
+    assert indexed_store.query(hash=meta["system"]["hash"]) == [("b.bin", meta)]
+    assert index.ls(id=meta["system"]["id"]) == ["b.bin"]
+
+
+def test_index_rollback_and_rebuild(indexed_store: MyStore):
+    indexed_store.write_file("a.bin", BytesIO(b"xxx"))
+    indexed_store.write_file("b.bin", BytesIO(b"yyy"))
+
+    with pytest.raises(RFC7807Error):
+        indexed_store.write_file("a.bin", BytesIO(b"xxx"), {"size": 4})
+    assert indexed_store.ls("") == ["b.bin"]
+
+    index = indexed_store._index
+    index.remove("b.bin")
+    index.upsert("stale.bin", {"system": {}})
+    assert indexed_store.rebuild_index() == 1
+    assert indexed_store.ls("") == ["b.bin"]
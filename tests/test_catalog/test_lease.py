@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+import threading
+import time
+
+from amature_fs.store import LockDir, RFC7807Error, MyStore, StoreBluePrint
+import pytest
+
+
+@pytest.fixture
+def lease_store(tmp_path):
+    config = StoreBluePrint.get_default()
+    config["rules"]["system"]["lease_ttl"] = 0.3
+    store = MyStore.from_fsspec(
+        MyStore.from_local(str(tmp_path))._client, StoreBluePrint(config)
+    )
+    store.init(token="xxx")
+    yield store
+
+
+def test_lease_lock(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+
+    with blueprint.begin(fs, "a.bin", {}) as meta:
+        lease = json.loads(fs.cat_file("processing/meta/a.bin"))["system"]["lease"]
+        assert lease["token"] == blueprint.get_lease(fs, "a.bin").token
+        assert time.time() < lease["expires"]
+
+        with pytest.raises(RFC7807Error) as e:
+            tmp_store.write_file("a.bin", BytesIO(b"x"))
+        assert e.value.status == 409
+        # 他の書き込みが保持しているロックはロールバックできない
+        with pytest.raises(RFC7807Error):
+            StoreBluePrint(StoreBluePrint.get_default()).rollback(fs, "a.bin")
+
+        fs.makedirs("processing/data/a.bin", exist_ok=True)
+        with fs.open(blueprint.get_staging_path("a.bin", meta["system"]["id"]), "wb") as f:
+            f.write(b"abc")
+        blueprint._finalize_meta(meta, "sha256", 3, 1024, [], [])
+
+    assert "lease" not in meta["system"]
+    assert "lease" not in tmp_store.read_meta("a.bin")["system"]
+    assert blueprint.get_lease(fs, "a.bin") is None
+
+
+def test_heartbeat(lease_store: MyStore):
+    fs = lease_store._client
+    with lease_store._blueprint.begin(fs, "a.bin", {}) as meta:
+        expires = meta["system"]["lease"]["expires"]
+        time.sleep(0.5)
+        stored = json.loads(fs.cat_file("processing/meta/a.bin"))["system"]["lease"]
+        assert expires < stored["expires"]
+        lease_store._blueprint._stage_file(fs, "a.bin", BytesIO(b""), meta, 1024)
+
+    assert lease_store.read_meta("a.bin")["system"]["size"] == 0
+
+
+def test_stale_lock_recovery(lease_store: MyStore):
+    blueprint = lease_store._blueprint
+    fs = lease_store._client
+
+    # 書き込み中にプロセスが停止した状態（ハートビートが止まる）
+    blueprint._create_processing_meta(fs, "a.bin", {})
+    blueprint._lease_keeper.pop((id(fs), "a.bin"))
+    fs.pipe_file("processing/meta/resumable.bin", json.dumps({"system": {}}).encode())
+
+    with pytest.raises(RFC7807Error):
+        lease_store.write_file("a.bin", BytesIO(b"x"))
+    time.sleep(0.4)
+
+    assert blueprint.reap_expired_leases(fs) == ["a.bin"]
+    assert fs.exists("processing/meta/resumable.bin")
+
+    # 失効したロックは次の書き込みが回収して取得する
+    blueprint._create_processing_meta(fs, "b.bin", {})
+    blueprint._lease_keeper.pop((id(fs), "b.bin"))
+    time.sleep(0.4)
+    assert lease_store.write_file("b.bin", BytesIO(b"x"))["system"]["size"] == 1
+
+
+def test_fencing(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    other = StoreBluePrint(StoreBluePrint.get_default())
+
+    with pytest.raises(RFC7807Error) as e:
+        with blueprint.begin(fs, "a.bin", {}) as meta:
+            # リースが失効して回収され、別の書き込みがロックを取得した
+            assert blueprint.reap_lease(fs, "a.bin", now=time.time() + 3600)
+            new = other._create_processing_meta(fs, "a.bin", {})
+            other._stage_file(fs, "a.bin", BytesIO(b"new"), new, 1024)
+
+            # 古い書き込みのステージングは新しい書き込みのデータを上書きしない
+            blueprint._stage_file(fs, "a.bin", BytesIO(b"old"), meta, 1024)
+    assert e.value.title == "Lease Expired."
+
+    # 新しい書き込みのロックは残っていて、自身のデータをコミットできる
+    assert other.get_lease(fs, "a.bin").is_owned()
+    assert not fs.exists("completed/meta/a.bin")
+    other.commit(fs, "a.bin", new)
+    assert tmp_store.open("a.bin").read() == b"new"
+    assert not fs.exists("processing/data/a.bin")
+
+
+def test_exclusive_acquire(tmp_store: MyStore, monkeypatch):
+    fs = tmp_store._client
+    barrier = threading.Barrier(16)
+    exists = fs.fs.exists
+
+    def slow_exists(path, **kwargs):
+        # 存在の確認と作成の間の競合を起こしやすくする
+        result = exists(path, **kwargs)
+        time.sleep(0.01)
+        return result
+
+    monkeypatch.setattr(fs.fs, "exists", slow_exists)
+
+    def acquire(i):
+        blueprint = StoreBluePrint(StoreBluePrint.get_default())
+        barrier.wait()
+        try:
+            blueprint._create_processing_meta(fs, "a.bin", {})
+        except RFC7807Error:
+            return None
+        blueprint._lease_keeper.pop((id(fs), "a.bin"))
+        return i
+
+    # 同時に取得しても、ロックを取得できるのは 1 つだけ
+    for _ in range(3):
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            winners = [i for i in executor.map(acquire, range(16)) if i is not None]
+        assert len(winners) == 1
+        fs.rm("processing/meta/a.bin")
+    assert fs.ls("processing/meta", detail=False) == []
+
+
+def test_renew_expired(lease_store: MyStore):
+    blueprint = lease_store._blueprint
+    fs = lease_store._client
+    blueprint._create_processing_meta(fs, "a.bin", {})
+    lease = blueprint._lease_keeper.pop((id(fs), "a.bin"))
+    assert lease.renew()
+
+    # 失効したリースは、回収される前でも延長しない（回収と競合して上書きしない）
+    lease.expires = time.time() - 1
+    assert not lease.renew()
+    with pytest.raises(RFC7807Error) as e:
+        lease.write()
+    assert e.value.title == "Lease Expired."
+
+
+def test_lock_dir(tmp_store: MyStore):
+    fs = tmp_store._client
+    with LockDir.create(fs, "lock") as lock:
+        assert lock.is_locked()
+        with pytest.raises(RFC7807Error):
+            LockDir(fs, "lock", "other").lock()
+        with pytest.raises(RFC7807Error):
+            LockDir(fs, "lock", "other").unlock()
+    assert not fs.exists("lock")
@@ -0,0 +1,72 @@
+from io import BytesIO
+import hashlib
+import os
+
+from amature_fs import local
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def test_write_from_local_file(tmp_store: MyStore, tmp_path):
+    data = bytes(range(256)) * 40
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"head" + data)
+
+    with open(src, "rb") as f:
+        f.read(4)
+        meta = tmp_store._blueprint.write_file(
+            tmp_store._client, "a.bin", f, {}, 1000
+        )
+        assert f.tell() == len(data) + 4
+
+    assert meta["system"]["size"] == len(data)
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+    assert meta["system"]["chunks"]["block_hashes"][1] == (
+        "sha256:" + hashlib.sha256(data[1000:2000]).hexdigest()
+    )
+    assert tmp_store.get_local_path("a.bin") == str(tmp_path / "completed/data/a.bin")
+
+    with open(tmp_path / "empty.bin", "wb"):
+        pass
+    with open(tmp_path / "empty.bin", "rb") as f:
+        meta = tmp_store.write_file("b.bin", f)
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(b"").hexdigest()
+    assert tmp_store.open("b.bin").read() == b""
+
+
+def test_copy_range(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"0123456789")
+    with open(src, "rb") as fsrc, open(tmp_path / "dst.bin", "wb") as fdst:
+        local.copy_range(fsrc.fileno(), fdst.fileno(), 2, 5)
+        local.copy_range(fsrc.fileno(), fdst.fileno(), 0, 1)
+    assert (tmp_path / "dst.bin").read_bytes() == b"234560"
+
+
+def test_mmap_reader(tmp_store: MyStore, tmp_path):
+    data = bytes(range(256)) * 40
+    tmp_store._blueprint.write_file(tmp_store._client, "a.bin", BytesIO(data), {}, 1000)
+
+    with tmp_store.open("a.bin", verify=True) as f:
+        assert isinstance(f, local.MmapBlockReader)
+        assert f.read(10) == data[:10]
+        f.seek(-5, os.SEEK_END)
+        assert f.read() == data[-5:]
+        assert f.read_range(2500, 1000) == data[2500:3500]
+        with f.view(100, 10) as view:
+            assert view == data[100:110]
+
+    assert tmp_store.read_range("a.bin", 999, 2) == data[999:1001]
+    tmp_store.write_file("t.txt", BytesIO("テキスト".encode()))
+    with tmp_store.open("t.txt", "r") as f:
+        assert f.read() == "テキスト"
+
+    # 壊れたブロックは読み込んだ範囲だけを検証して検出する
+    path = tmp_store.get_local_path("a.bin")
+    with open(path, "r+b") as f:
+        f.seek(3500)
+        f.write(b"\xff")
+    assert tmp_store.read_range("a.bin", 0, 1000, verify=True) == data[:1000]
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.read_range("a.bin", 3000, 10, verify=True)
+    assert "offset 3000" in e.value.detail
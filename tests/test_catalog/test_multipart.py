@@ -0,0 +1,104 @@
+from io import BytesIO
+import hashlib
+
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def sha256(data: bytes):
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_multipart_upload(tmp_store: MyStore, version):
+    bp = tmp_store._blueprint
+    fs = tmp_store._client
+    data = bytes(range(256)) * 20
+    # version 2 の system.hash はファイル全体のハッシュではないため、v1 のみ照合する
+    usermeta = {"hash": sha256(data)} if version == 1 else {}
+    upload = bp.create_multipart_upload(
+        fs, "a.bin", usermeta, block_size=1000, chunks_version=version
+    )
+    upload_id = upload["upload_id"]
+    assert upload["block_size"] == 1000
+
+    # 逆順に送信しても完了時にブロック順に組み立てる
+    hashes = [sha256(data[i : i + 1000]) for i in range(0, len(data), 1000)]
+    for index in reversed(range(len(hashes))):
+        part = data[index * 1000 : (index + 1) * 1000]
+        record = tmp_store.upload_part("a.bin", upload_id, index, BytesIO(part))
+        assert record == {"index": index, "size": len(part), "block_hash": hashes[index]}
+
+    with pytest.raises(RFC7807Error):
+        tmp_store.read_meta("a.bin")
+    parts = tmp_store.list_parts("a.bin", upload_id)["parts"]
+    assert [part["index"] for part in parts] == list(range(len(hashes)))
+
+    meta = tmp_store.complete_multipart_upload("a.bin", upload_id, hashes)
+    assert meta["system"]["size"] == len(data)
+    assert meta["system"]["chunks"]["block_hashes"] == hashes
+    assert "upload" not in meta["system"]
+    assert tmp_store.open("a.bin", verify=True).read() == data
+
+
+def test_multipart_errors(tmp_store: MyStore):
+    bp = tmp_store._blueprint
+    fs = tmp_store._client
+    tmp_store.write_file("a.bin", BytesIO(b"old"))
+    upload_id = bp.create_multipart_upload(fs, "a.bin", block_size=4)["upload_id"]
+
+    with pytest.raises(RFC7807Error):
+        bp.create_multipart_upload(fs, "a.bin")
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.upload_part("a.bin", "unknown", 0, BytesIO(b"abcd"))
+    assert e.value.status == 404
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.upload_part("a.bin", upload_id, 0, BytesIO(b"abcde"))
+    assert e.value.status == 422
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.upload_part("a.bin", upload_id, 0, BytesIO(b"abcd"), sha256(b"x"))
+    assert e.value.title == "File Integrity Error."
+
+    tmp_store.upload_part("a.bin", upload_id, 0, BytesIO(b"abcd"))
+    tmp_store.upload_part("a.bin", upload_id, 2, BytesIO(b"ij"))
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.complete_multipart_upload("a.bin", upload_id)
+    assert e.value.detail == "Missing parts: [1]"
+
+    tmp_store.upload_part("a.bin", upload_id, 1, BytesIO(b"ef"))
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.complete_multipart_upload("a.bin", upload_id)
+    assert e.value.status == 422
+
+    # 中止しても完了済みのオブジェクトは残る
+    location = bp._load_multipart_upload(fs, "a.bin", upload_id)["system"]["chunks"][
+        "location"
+    ]
+    tmp_store.abort_multipart_upload("a.bin", upload_id)
+    assert not fs.exists(location)
+    assert tmp_store.open("a.bin").read() == b"old"
+
+
+def test_upload_multipart_client(tmp_store: MyStore):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    from amature_fs.client import upload_multipart
+    from amature_fs.server import create_app
+
+    tmp_store._blueprint._blueprint["rules"]["system"]["default_block_size"] = 1000
+    data = bytes(range(256)) * 40
+    with TestClient(create_app(tmp_store)) as client:
+        meta = upload_multipart(
+            client,
+            "a.bin",
+            BytesIO(data),
+            {"owner": "alice", "hash": sha256(data), "size": len(data)},
+        )
+        assert meta["user"]["owner"] == "alice"
+        assert client.get("/objects/a.bin").content == data
+
+        with pytest.raises(RFC7807Error) as e:
+            upload_multipart(client, "b.bin", BytesIO(data), {"size": 1})
+        assert e.value.title == "File Integrity Error."
+        assert not tmp_store._client.exists("processing/meta/b.bin")
@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import hashlib
+
+from amature_fs.collector import GarbageCollector
+from amature_fs.pack import PackWriter, compact, get_segment_usage
+from amature_fs.scrubber import Scrubber
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+def sha256(data: bytes):
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def pack_store(tmp_store: MyStore):
+    tmp_store._blueprint._blueprint["rules"]["system"]["pack_threshold"] = 100
+    return tmp_store
+
+
+def test_write_many_packed(pack_store: MyStore):
+    bp = pack_store._blueprint
+    fs = pack_store._client
+    datas = {f"{i}.txt": f"data-{i}".encode() for i in range(10)}
+    datas["empty.txt"] = b""
+    datas["large.bin"] = b"x" * 1000
+    items = [(key, BytesIO(data), {"hash": sha256(data)}) for key, data in datas.items()]
+    results = bp.write_many(fs, items)
+
+    chunks = {key: meta["system"]["chunks"] for key, meta in results.items()}
+    assert chunks["large.bin"]["layout"] == "file"
+    packed = [c for key, c in chunks.items() if key != "large.bin"]
+    assert {c["layout"] for c in packed} == {"pack"}
+    assert len({c["location"] for c in packed}) == 1
+    assert results["3.txt"]["system"]["hash"] == sha256(datas["3.txt"])
+
+    assert pack_store.open("3.txt").read() == datas["3.txt"]
+    assert pack_store.open("3.txt", verify=True).read() == datas["3.txt"]
+    assert pack_store.read_range("5.txt", 2, 3) == datas["5.txt"][2:5]
+    assert bp.read_many(fs, list(datas)) == datas
+
+    # ハッシュが一致しないものだけが失敗する
+    results = bp.write_many(
+        fs, [("a.txt", BytesIO(b"a"), {"hash": sha256(b"b")}), ("b.txt", BytesIO(b"b"), {})]
+    )
+    assert isinstance(results["a.txt"], RFC7807Error)
+    assert pack_store.open("b.txt").read() == b"b"
+
+    state = Scrubber(fs, bp).run()
+    assert state["corrupt"] == []
+
+
+def test_pack_writer(pack_store: MyStore):
+    bp = pack_store._blueprint
+    fs = pack_store._client
+    writer = PackWriter(fs, bp, max_delay=0.05)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        metas = list(
+            executor.map(lambda i: writer.write(f"{i}.txt", f"{i}".encode()), range(32))
+        )
+    segments = {meta["system"]["chunks"]["location"] for meta in metas}
+    assert len(segments) < 32
+    assert pack_store.open("7.txt").read() == b"7"
+
+    # 同じキーへの書き込みは別のセグメントに分けて、投入順に反映する
+    futures = [writer.submit("a.txt", b"1"), writer.submit("a.txt", b"2")]
+    writer.flush()
+    first, second = (future.result() for future in futures)
+    assert first["system"]["chunks"]["location"] != second["system"]["chunks"]["location"]
+    assert pack_store.open("a.txt").read() == b"2"
+
+
+def test_compact_and_collect(pack_store: MyStore):
+    bp = pack_store._blueprint
+    fs = pack_store._client
+    datas = {f"{i}.txt": bytes([i]) * 50 for i in range(4)}
+    results = bp.write_packed(fs, [(key, data, {}) for key, data in datas.items()])
+    old = results["0.txt"]["system"]["chunks"]["location"]
+
+    # 上書きでセグメントの大部分が参照されなくなる
+    bp.write_packed(fs, [("0.txt", b"new", {}), ("1.txt", b"new", {})])
+    bp.write_file(fs, "2.txt", BytesIO(b"file"))
+    usage = get_segment_usage(fs, bp)
+    assert usage[old.rsplit("/", 1)[-1]]["live"] == 50
+
+    assert compact(fs, bp) == {"segments": 1, "moved": 1, "bytes": 50}
+    meta = bp.read_meta(fs, "3.txt")
+    assert meta["system"]["chunks"]["location"] != old
+    assert pack_store.open("3.txt").read() == datas["3.txt"]
+    assert compact(fs, bp)["segments"] == 0
+
+    # 参照がなくなった古いセグメントを回収する
+    assert fs.exists(old)
+    GarbageCollector(fs, bp, grace=3600).run_cycle()
+    assert fs.exists(old)
+    GarbageCollector(fs, bp, grace=0).run_cycle()
+    assert not fs.exists(old)
+    assert bp.read_many(fs, ["0.txt", "2.txt", "3.txt"]) == {
+        "0.txt": b"new",
+        "2.txt": b"file",
+        "3.txt": datas["3.txt"],
+    }
+
+
+def test_write_packed_locks_keys(pack_store: MyStore, monkeypatch):
+    bp = pack_store._blueprint
+    fs = pack_store._client
+
+    # 書き込み中のキーは resource_locked で、他のキーは公開する
+    with bp.lock_key(fs, "busy.txt"):
+        results = bp.write_packed(fs, [("busy.txt", b"x", {}), ("a.txt", b"a", {})])
+        assert isinstance(results["busy.txt"], RFC7807Error)
+        assert results["busy.txt"].status == 409
+        assert pack_store.open("a.txt").read() == b"a"
+
+    # 公開が終わるまでロックを保持するため、その間の同じキーへの書き込みは失敗する
+    pipe_file = fs.pipe_file
+    errors = []
+
+    def racing_pipe_file(path, *args, **kwargs):
+        pipe_file(path, *args, **kwargs)
+        if path.startswith(bp.get_pack_dir()):
+            try:
+                bp.write_file(fs, "a.txt", BytesIO(b"file"))
+            except RFC7807Error as e:
+                errors.append(e.status)
+
+    monkeypatch.setattr(fs, "pipe_file", racing_pipe_file)
+    results = bp.write_packed(fs, [("a.txt", b"packed", {})])
+    monkeypatch.undo()
+    assert errors == [409]
+    assert pack_store.open("a.txt").read() == b"packed"
+    assert fs.find(bp.get_processing_meta_path("")) == []
@@ -0,0 +1,95 @@
+from io import BytesIO
+import hashlib
+
+from amature_fs import hashing
+from amature_fs.store import RFC7807Error, MyStore
+import pytest
+
+
+class BrokenFile:
+    """limit バイト読み込んだ後に失敗するファイル"""
+
+    def __init__(self, data: bytes, limit: int):
+        self._file = BytesIO(data)
+        self._limit = limit
+
+    def read(self, size):
+        if self._limit <= self._file.tell():
+            raise ConnectionError()
+        return self._file.read(size)
+
+
+def test_resume_upload(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    data = bytes(range(256)) * 40
+
+    with pytest.raises(ConnectionError):
+        blueprint.write_file_resumable(fs, "big.bin", BrokenFile(data, 3000), {}, 1000)
+
+    status = tmp_store.get_upload_status("big.bin")
+    assert status["durable_blocks"] == 3
+    assert status["durable_size"] == 3000
+    assert status["cumulative_hash"] == "sha256:" + hashlib.sha256(data[:3000]).hexdigest()
+
+    # 書き込み中のキーはロックされている
+    with pytest.raises(RFC7807Error):
+        tmp_store.write_file("big.bin", BytesIO(data))
+
+    meta = tmp_store.write_file_resumable("big.bin", BytesIO(data))
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+    assert len(meta["system"]["chunks"]["block_hashes"]) == 11
+    assert not fs.exists("processing/meta/big.bin")
+    assert not fs.exists("processing/data/big.bin")
+
+    with tmp_store.open("big.bin", "rb", verify=True) as f:
+        assert f.read() == data
+
+
+def test_resume_upload_changed_prefix(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    data = b"a" * 5000
+
+    with pytest.raises(ConnectionError):
+        blueprint.write_file_resumable(fs, "big.bin", BrokenFile(data, 4000), {}, 1000)
+    assert tmp_store.get_upload_status("big.bin")["durable_blocks"] == 4
+
+    # 送信済みの範囲と異なるブロック以降から再送する
+    changed = b"a" * 1000 + b"b" * 2500
+    meta = tmp_store.write_file_resumable("big.bin", BytesIO(changed))
+    assert meta["system"]["size"] == 3500
+    assert tmp_store.read_range("big.bin", 0, 5000, verify=True) == changed
+    assert len(fs.ls(meta["system"]["chunks"]["location"])) == 4
+
+
+def test_abort_upload(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+
+    with pytest.raises(ConnectionError):
+        blueprint.write_file_resumable(fs, "big.bin", BrokenFile(b"a" * 5000, 2000), {}, 1000)
+
+    tmp_store.abort_upload("big.bin")
+    assert fs.ls("chunked/data", detail=False) == []
+    with pytest.raises(RFC7807Error):
+        tmp_store.get_upload_status("big.bin")
+
+
+def test_resume_upload_chunks_version_2(tmp_store: MyStore):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    data = bytes(range(256)) * 40
+
+    with pytest.raises(ConnectionError):
+        blueprint.write_file_resumable(
+            fs, "big.bin", BrokenFile(data, 3000), {}, 1000, chunks_version=2
+        )
+
+    meta = tmp_store.write_file_resumable("big.bin", BytesIO(data))
+    assert meta["system"]["chunks"]["version"] == 2
+    assert meta["system"]["hash"] == hashing.calculate_file_hash(
+        "sha256", BytesIO(data), 1000, version=2
+    )
+    with tmp_store.open("big.bin", "rb", verify=True) as f:
+        assert f.read() == data
@@ -0,0 +1,54 @@
+from io import BytesIO
+
+from amature_fs.scrubber import Scrubber, is_sampled
+from amature_fs.store import MyStore
+import pytest
+
+
+@pytest.mark.parametrize("use_threads", [True, False])
+def test_scrub(tmp_store: MyStore, use_threads):
+    blueprint = tmp_store._blueprint
+    fs = tmp_store._client
+    data = bytes(range(256)) * 40
+    blueprint.write_file(fs, "a.bin", BytesIO(data), {}, 1000)
+    blueprint.write_file_chunked(fs, "b.bin", BytesIO(data), {}, 1000)
+    blueprint.write_file_chunked(fs, "c.bin", BytesIO(data), {}, 1000, dedup=True)
+
+    scrubber = Scrubber(fs, blueprint, max_workers=2, use_threads=use_threads)
+    state = scrubber.run()
+    assert state["done"] and state["corrupt"] == []
+    assert state["objects"] == 3 and state["blocks"] == 33
+    assert state["bytes"] == 3 * len(data)
+
+    # a.bin のブロック 2 を壊し、b.bin のチャンク 5 を削除する
+    with fs.open("completed/data/a.bin", "r+b") as f:
+        f.seek(2500)
+        f.write(b"\xff")
+    location = tmp_store.read_meta("b.bin")["system"]["chunks"]["location"]
+    fs.rm(f"{location}/00000005")
+
+    corrupt = scrubber.run()["corrupt"]
+    assert [(c["key"], c["index"], c["offset"], c["error"]) for c in corrupt] == [
+        ("a.bin", 2, 2000, "hash_mismatch"),
+        ("b.bin", 5, 5000, "missing"),
+    ]
+
+
+def test_scrub_resume(tmp_store: MyStore):
+    fs = tmp_store._client
+    for i in range(5):
+        tmp_store.write_file(f"{i}.bin", BytesIO(b"x" * 10))
+
+    scrubber = Scrubber(fs, tmp_store._blueprint, batch_size=2, use_threads=True)
+    state = scrubber.run(max_objects=2)
+    assert not state["done"] and state["after"] == "1.bin"
+
+    state = Scrubber(fs, tmp_store._blueprint, batch_size=2, use_threads=True).run()
+    assert state["done"] and state["objects"] == 5
+
+
+def test_sample():
+    keys = [f"{i}.bin" for i in range(1000)]
+    sampled = [key for key in keys if is_sampled(key, 0.1)]
+    assert 50 < len(sampled) < 150
+    assert sampled == [key for key in keys if is_sampled(key, 0.1)]
@@ -0,0 +1,132 @@
+from io import BytesIO
+import hashlib
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi.testclient import TestClient
+
+from amature_fs.server import KeyLimiter, create_app, parse_range
+from amature_fs.store import MyStore, RFC7807Error
+
+
+@pytest.fixture
+def client(tmp_store: MyStore):
+    with TestClient(create_app(tmp_store)) as client:
+        yield client
+
+
+def iter_body(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+def test_put_get_head(client: TestClient, tmp_store: MyStore):
+    data = bytes(range(256)) * 100
+    digest = "sha256:" + hashlib.sha256(data).hexdigest()
+
+    res = client.put(
+        "/objects/a.bin",
+        content=iter_body(data, 777),
+        headers={"x-meta-owner": "alice", "x-hash": digest},
+    )
+    assert res.status_code == 201
+    assert res.headers["etag"] == f'"{digest}"'
+    assert res.json()["user"]["owner"] == "alice"
+    assert tmp_store.open("a.bin").read() == data
+
+    res = client.head("/objects/a.bin")
+    assert res.status_code == 200
+    assert res.headers["content-length"] == str(len(data))
+    assert res.headers["x-meta-owner"] == "alice"
+
+    for verify in ("false", "true"):
+        url = f"/objects/a.bin?verify={verify}"
+        res = client.get(url)
+        assert res.status_code == 200
+        assert res.content == data
+
+        res = client.get(url, headers={"range": "bytes=1000-2999"})
+        assert res.status_code == 206
+        assert res.headers["content-range"] == f"bytes 1000-2999/{len(data)}"
+        assert res.content == data[1000:3000]
+
+        res = client.get(url, headers={"if-none-match": f'"{digest}"'})
+        assert res.status_code == 304
+
+    res = client.get("/objects/a.bin?verify=true", headers={"range": "bytes=-10"})
+    assert res.content == data[-10:]
+
+
+def test_problem_details(client: TestClient):
+    res = client.get("/objects/missing.bin")
+    assert res.status_code == 404
+    assert res.headers["content-type"] == "application/problem+json"
+    assert res.json()["type"] == "https://example.com/probs/resource-notfound"
+
+    res = client.put("/objects/a.bin", content=b"abc", headers={"x-hash": "sha256:00"})
+    assert res.status_code == 500
+    assert res.json()["title"] == "File Integrity Error."
+    assert client.head("/objects/a.bin").status_code == 404
+
+    client.put("/objects/a.bin", content=b"abc")
+    res = client.get("/objects/a.bin?verify=true", headers={"range": "bytes=10-"})
+    assert res.status_code == 416
+
+
+def test_invalid_key(client: TestClient):
+    for key in ("..%2Fx", "a%2F..%2F..%2Fx"):
+        res = client.put(f"/objects/{key}", content=b"abc")
+        assert res.status_code == 400
+        assert res.headers["content-type"] == "application/problem+json"
+        assert client.get(f"/objects/{key}").status_code == 400
+
+
+def test_download_holds_limit(tmp_store: MyStore, monkeypatch):
+    app = create_app(tmp_store, max_requests_per_key=1)
+    tmp_store.write_file("a.bin", BytesIO(b"x" * 3000))
+    counts = []
+    open_block_reader = tmp_store.open_block_reader
+
+    def recording_reader(*args, **kwargs):
+        reader = open_block_reader(*args, **kwargs)
+        read_range = reader.read_range
+
+        def record(*args):
+            counts.append(dict(app.state.limiter._counts))
+            return read_range(*args)
+
+        reader.read_range = record
+        return reader
+
+    monkeypatch.setattr(tmp_store, "open_block_reader", recording_reader)
+    with TestClient(app) as client:
+        # 本文の送信中は枠を保持し、送信後に解放する
+        res = client.get("/objects/a.bin?verify=true")
+        assert res.content == b"x" * 3000
+        assert counts and all(count == {"a.bin": 1} for count in counts)
+        assert app.state.limiter._counts == {}
+        assert client.get("/objects/a.bin").status_code == 200
+        assert app.state.limiter._counts == {}
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 10)
+    assert parse_range("bytes=90-", 100) == (90, 100)
+    assert parse_range("bytes=-10", 100) == (90, 100)
+    assert parse_range("bytes=50-500", 100) == (50, 100)
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(RFC7807Error):
+        parse_range("bytes=100-", 100)
+
+
+def test_key_limiter():
+    limiter = KeyLimiter(2)
+    with limiter.acquire("a"), limiter.acquire("a"), limiter.acquire("b"):
+        with pytest.raises(RFC7807Error) as e:
+            with limiter.acquire("a"):
+                pass
+        assert e.value.status == 429
+    with limiter.acquire("a"):
+        pass
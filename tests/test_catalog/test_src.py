@@ -3,8 +3,8 @@ import pytest
 
 
 @pytest.fixture
-def store():
-    yield MyStore.from_local(".cache/catalog")
+def store(tmp_path):
+    yield MyStore.from_local(str(tmp_path))
 
 
 TOKEN = "xxx"
@@ -31,3 +31,103 @@ def test_aa(store: MyStore):
     #     lock.write(BytesIO(b"xxx"))
 
     assert store.ls("") == ["test.bin"]
+
+
+def test_write_file_chunked(tmp_store: MyStore):
+    from io import BytesIO
+    import hashlib
+
+    data = bytes(range(256)) * 40
+    blueprint = tmp_store._blueprint
+    blueprint.write_file_chunked(
+        tmp_store._client, "chunked.bin", BytesIO(data), {"attr1": "val1"}, 1000, 4
+    )
+
+    meta = tmp_store.read_meta("chunked.bin")
+    chunks = meta["system"]["chunks"]
+    assert meta["system"]["size"] == len(data)
+    assert meta["system"]["hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+    assert chunks["layout"] == "chunked"
+    assert len(chunks["block_hashes"]) == 11
+    assert chunks["block_hashes"][3] == (
+        "sha256:" + hashlib.sha256(data[3000:4000]).hexdigest()
+    )
+    assert not tmp_store._client.exists("completed/data/chunked.bin")
+
+    with tmp_store.open("chunked.bin", "rb") as f:
+        assert f.read() == data
+        f.seek(2500)
+        assert f.read(1000) == data[2500:3500]
+
+    # 上書きすると旧バージョンのチャンクは破棄される
+    tmp_store.write_file_chunked("chunked.bin", BytesIO(b"yyy"))
+    assert not tmp_store._client.exists(chunks["location"])
+    with tmp_store.open("chunked.bin", "rb") as f:
+        assert f.read() == b"yyy"
+
+
+def test_write_file_chunked_rollback(tmp_store: MyStore):
+    from io import BytesIO
+
+    with pytest.raises(RFC7807Error):
+        tmp_store.write_file_chunked("bad.bin", BytesIO(b"xxx"), {"size": 4})
+
+    assert tmp_store._client.ls("chunked/data", detail=False) == []
+    assert not tmp_store._client.exists("processing/meta/bad.bin")
+
+
+
+class FailingListener:
+    def on_commit(self, fs, key, meta):
+        raise RuntimeError("listener failed")
+
+    def on_rollback(self, fs, key):
+        raise RuntimeError("listener failed")
+
+
+def test_failing_listener(tmp_store: MyStore):
+    from io import BytesIO
+
+    # リスナーの失敗は公開したコミットを取り消さない
+    tmp_store._blueprint.add_listener(FailingListener())
+    tmp_store.write_file("a.bin", BytesIO(b"old"))
+    tmp_store.write_file("a.bin", BytesIO(b"new"))
+    tmp_store.write_file_chunked("a.bin", BytesIO(b"chunked"))
+    with tmp_store.open("a.bin", "rb") as f:
+        assert f.read() == b"chunked"
+    assert tmp_store.delete("a.bin")
+    assert tmp_store.ls("") == []
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_read_range(tmp_store: MyStore, chunked):
+    from io import BytesIO
+
+    data = bytes(range(256)) * 40
+    blueprint = tmp_store._blueprint
+    write = blueprint.write_file_chunked if chunked else blueprint.write_file
+    write(tmp_store._client, "range.bin", BytesIO(data), {}, 1000)
+
+    assert tmp_store.read_range("range.bin", 2500, 1000) == data[2500:3500]
+    assert tmp_store.read_range("range.bin", 10200, 100) == data[10200:]
+    assert tmp_store.read_range("range.bin", 20000, 100) == b""
+
+    reader = blueprint.open_block_reader(tmp_store._client, "range.bin", verify=True)
+    with reader:
+        assert reader.read_range(0, 10) == data[:10]
+        assert reader.read_range(3999, 2) == data[3999:4001]
+
+    with tmp_store.open("range.bin", "rb", verify=True) as f:
+        assert f.read() == data
+
+
+def test_read_range_verify(tmp_store: MyStore):
+    from io import BytesIO
+
+    data = b"a" * 3000
+    tmp_store._blueprint.write_file(tmp_store._client, "v.bin", BytesIO(data), {}, 1000)
+    tmp_store._client.pipe_file("completed/data/v.bin", b"a" * 1000 + b"b" * 2000)
+
+    assert tmp_store.read_range("v.bin", 0, 1000, verify=True) == b"a" * 1000
+    with pytest.raises(RFC7807Error) as e:
+        tmp_store.read_range("v.bin", 1500, 10, verify=True)
+    assert "offset 1000" in str(e.value)
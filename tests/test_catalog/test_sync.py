@@ -0,0 +1,119 @@
+from io import BytesIO
+import os
+
+from amature_fs.store import MyStore
+from amature_fs.sync import Syncer
+from amature_fs.utils import RateLimiter
+import pytest
+
+
+@pytest.fixture
+def stores(tmp_path):
+    source = MyStore.from_local(str(tmp_path / "source"))
+    target = MyStore.from_local(str(tmp_path / "target"))
+    for store in (source, target):
+        store.init(token="xxx")
+    return source, target
+
+
+def make_syncer(source: MyStore, target: MyStore, **kwargs):
+    return Syncer(source._client, target._client, source._blueprint, **kwargs)
+
+
+def test_sync_delta(stores):
+    source, target = stores
+    bp = source._blueprint
+    fs = source._client
+    data = os.urandom(8000)
+    bp.write_file(fs, "a.bin", BytesIO(data), {"owner": "alice"}, 1000)
+    bp.write_file(fs, "b.csv", BytesIO(b"a,b\n" * 1000), {}, 1000, compression="zlib")
+    bp.write_file(fs, "c.bin", BytesIO(b""))
+
+    state = make_syncer(source, target).run()
+    assert (state["copied"], state["skipped"], state["failed"]) == (3, 0, [])
+    # b.csv の 4 ブロックは同じ内容のため 1 つだけを書き込む
+    assert (state["written"], state["reused"]) == (8000 + 1000, 3000)
+    assert target.open("a.bin").read() == data
+    assert target.read_meta("a.bin")["user"] == {"owner": "alice"}
+    assert target.read_meta("a.bin")["system"]["chunks"]["block_size"] == 1000
+    assert target.open("b.csv").read() == b"a,b\n" * 1000
+    assert target.open("c.bin").read() == b""
+
+    # 変更のないキーは転送せず、変更されたブロックだけを転送する
+    changed = data[:3000] + os.urandom(1000) + data[4000:]
+    bp.write_file(fs, "a.bin", BytesIO(changed), {"owner": "bob"}, 1000)
+    state = make_syncer(source, target).run()
+    assert (state["copied"], state["skipped"]) == (1, 2)
+    assert (state["transferred"], state["written"], state["reused"]) == (1000, 1000, 7000)
+    assert target.open("a.bin").read() == changed
+    assert target.read_meta("a.bin")["user"] == {"owner": "bob"}
+
+    # 他のキーと同じブロックも転送しない
+    bp.write_file(fs, "d.bin", BytesIO(changed), {}, 1000)
+    state = make_syncer(source, target).run()
+    assert (state["copied"], state["skipped"]) == (1, 3)
+    assert (state["transferred"], state["written"], state["reused"]) == (0, 0, 8000)
+    assert target.read_range("d.bin", 0, 8000, verify=True) == changed
+
+
+def test_sync_reuse_in_place(stores, monkeypatch):
+    source, target = stores
+    data = os.urandom(4000)
+    source._blueprint.write_file(source._client, "a.bin", BytesIO(data), {}, 1000)
+    make_syncer(source, target).run()
+    assert target.read_meta("a.bin")["system"]["chunks"]["layout"] == "cas"
+
+    # 再利用するブロックは target から読み込まず、変更されたブロックだけを書き込む
+    changed = os.urandom(1000) + data[1000:]
+    source._blueprint.write_file(source._client, "a.bin", BytesIO(changed), {}, 1000)
+    pool = target._blueprint.get_block_pool(target._client)
+    fs = target._client
+    reads, writes = [], []
+    cat_file, open_file = type(fs).cat_file, type(fs).open
+
+    def tracked_cat_file(self, p, *args, **kwargs):
+        reads.append(p)
+        return cat_file(self, p, *args, **kwargs)
+
+    def tracked_open(self, p, mode="rb", *args, **kwargs):
+        if "w" in mode and p.startswith(pool.data_dir):
+            writes.append(p)
+        return open_file(self, p, mode, *args, **kwargs)
+
+    monkeypatch.setattr(type(fs), "cat_file", tracked_cat_file)
+    monkeypatch.setattr(type(fs), "open", tracked_open)
+    state = make_syncer(source, target).run()
+    assert (state["transferred"], state["written"], state["reused"]) == (1000, 1000, 3000)
+    assert not [p for p in reads if p.startswith(pool.data_dir)]
+    assert len(writes) == 1
+    monkeypatch.undo()
+    assert target.read_range("a.bin", 0, 4000, verify=True) == changed
+
+
+def test_sync_resume(stores):
+    source, target = stores
+    for i in range(5):
+        source.write_file(f"{i}.txt", BytesIO(f"data-{i}".encode()))
+
+    syncer = make_syncer(source, target, batch_size=2)
+    state = syncer.run(max_objects=2)
+    assert not state["done"]
+    assert state["after"] == "1.txt"
+    assert target.read_meta_many(["0.txt", "2.txt"])["2.txt"].status == 404
+
+    # 保存した進捗から再開する
+    state = make_syncer(source, target, batch_size=2).run()
+    assert state["done"]
+    assert (state["objects"], state["copied"]) == (5, 5)
+    assert target.open("4.txt").read() == b"data-4"
+
+
+def test_sync_bandwidth(stores, monkeypatch):
+    source, target = stores
+    source._blueprint.write_file(
+        source._client, "a.bin", BytesIO(os.urandom(3000)), {}, 1000
+    )
+    acquired = []
+    monkeypatch.setattr(RateLimiter, "acquire", lambda self, n=1: acquired.append(n))
+    make_syncer(source, target, bandwidth=1000).run()
+    assert sorted(acquired) == [1000, 1000, 1000]
@@ -0,0 +1,128 @@
+from io import BytesIO
+import time
+
+import fsspec
+
+from amature_fs.store import StoreBluePrint, RFC7807Error
+from amature_fs.tiers import TieredStore
+import pytest
+
+
+def make_tier(path):
+    fs, _ = fsspec.url_to_fs(f"dir::local://{path}")
+    fs.makedirs(str(path), exist_ok=True)
+    return fs
+
+
+@pytest.fixture
+def tiers(tmp_path):
+    blueprint = StoreBluePrint(StoreBluePrint.get_default())
+    tiers = {}
+    for name in ("hot", "warm", "cold"):
+        tiers[name] = make_tier(tmp_path / name)
+        blueprint.init(tiers[name], "xxx")
+    return tiers, blueprint
+
+
+def test_write_through_and_replicate(tiers):
+    fss, blueprint = tiers
+    store = TieredStore(fss, blueprint, promote_after=2)
+    data = b"0123456789" * 100
+    meta = store.write_file("a.bin", BytesIO(data), {"owner": "alice"})
+    assert meta["system"]["replication"] == {
+        "warm": {"status": "pending"},
+        "cold": {"status": "pending"},
+    }
+
+    store.flush()
+    status = store.get_replication_status("a.bin")
+    assert [status[name]["status"] for name in ("warm", "cold")] == ["ok", "ok"]
+    replica = blueprint.read_meta(fss["cold"], "a.bin")
+    assert replica["system"]["hash"] == meta["system"]["hash"]
+    assert replica["user"] == {"owner": "alice"}
+    assert replica["system"]["replica_of"] == {"tier": "hot", "id": meta["system"]["id"]}
+    assert replica["system"]["replication"] == {}
+
+    # ホットから降格した後はレプリカから読み込み、アクセスが続けば昇格する
+    assert store.demote(idle=3600) == 0
+    assert store.demote(idle=0) == 1
+    assert not fss["hot"].exists("completed/meta/a.bin")
+    assert store.open("a.bin").read() == data
+    assert store.read_range("a.bin", 10, 5) == data[10:15]
+    store.flush()
+    promoted = blueprint.read_meta(fss["hot"], "a.bin")
+    assert promoted["system"]["hash"] == meta["system"]["hash"]
+    assert promoted["system"]["replication"]["warm"]["status"] == "ok"
+    assert promoted["system"]["replica_of"] is None
+    assert store.stats["promoted"] == 1
+
+
+def test_repair_and_failover(tiers, tmp_path):
+    fss, blueprint = tiers
+    # 複製できないレプリカ（格納先がファイル）と、キューを使わないストア
+    broken = tmp_path / "broken"
+    broken.write_bytes(b"")
+    fss["cold"], _ = fsspec.url_to_fs(f"dir::local://{broken}")
+    store = TieredStore(fss, blueprint, queue_size=1, workers=0)
+
+    store.write_file("a.bin", BytesIO(b"a"))
+    store.write_file("b.bin", BytesIO(b"b"))
+    assert store.stats["dropped"] == 3
+    assert store.repair() == {"repaired": 2, "failed": 2}
+    status = store.get_replication_status("b.bin")
+    assert status["warm"]["status"] == "ok"
+    assert status["cold"]["status"] == "failed"
+
+    # ホットが障害中の場合は次の階層から読み込む
+    fss["hot"].rm("completed/meta", recursive=True)
+    fss["hot"].pipe_file("completed/meta", b"")
+    store = TieredStore({"hot": fss["hot"], "warm": fss["warm"]}, blueprint)
+    assert store.open("b.bin").read() == b"b"
+    assert not store._is_healthy("hot")
+    with pytest.raises(RFC7807Error) as e:
+        store.read_meta("c.bin")
+    assert e.value.status == 404
+
+
+def test_delete_and_update(tiers):
+    fss, blueprint = tiers
+    fs = fss["hot"]
+    meta = blueprint.write_file(fs, "a.bin", BytesIO(b"abc"))
+    id = meta["system"]["id"]
+
+    assert not blueprint.update_completed_meta(fs, "a.bin", "other", lambda m: None)
+    assert blueprint.update_completed_meta(
+        fs, "a.bin", id, lambda m: m["user"].update(tag="x")
+    )
+    assert blueprint.read_meta(fs, "a.bin")["user"] == {"tag": "x"}
+    assert not fs.exists("processing/meta/a.bin")
+
+    assert not blueprint.delete(fs, "a.bin", "other")
+    assert blueprint.delete(fs, "a.bin", id)
+    assert not fs.exists("completed/data/a.bin")
+    assert not blueprint.delete(fs, "a.bin")
+
+
+def test_demote_is_not_delete(tiers):
+    fss, blueprint = tiers
+    blueprint._blueprint["rules"]["system"]["versioning"] = True
+    events = []
+
+    class Recorder:
+        def on_commit(self, fs, key, meta):
+            events.append(("commit", key))
+
+        def on_rollback(self, fs, key):
+            events.append(("rollback", key))
+
+    store = TieredStore(fss, blueprint)
+    meta = store.write_file("a.bin", BytesIO(b"abc"))
+    store.flush()
+    blueprint.add_listener(Recorder())
+
+    # 降格は削除ではないため、削除マーカーを残さずリスナーにも通知しない
+    assert store.demote(idle=0) == 1
+    assert events == []
+    assert blueprint.list_versions(fss["hot"], "a.bin") == [meta["system"]["id"]]
+    assert not blueprint.evict(fss["warm"], "a.bin", "other")
+    assert store.open("a.bin").read() == b"abc"
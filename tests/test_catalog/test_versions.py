@@ -0,0 +1,117 @@
+from io import BytesIO
+import time
+
+from amature_fs.collector import GarbageCollector
+from amature_fs.pack import PackWriter
+from amature_fs.store import RFC7807Error, MyStore
+from amature_fs.tickers._uuid7 import to_timestamp
+import pytest
+
+
+@pytest.fixture
+def versioned_store(tmp_store: MyStore):
+    tmp_store._blueprint._blueprint["rules"]["system"]["versioning"] = True
+    return tmp_store
+
+
+def write_versions(store: MyStore, key: str, datas: list[bytes]):
+    ids = []
+    for i, data in enumerate(datas):
+        time.sleep(0.002)
+        if i % 2:
+            meta = store.write_file_chunked(key, BytesIO(data))
+        else:
+            meta = store.write_file(key, BytesIO(data), {"version": i})
+        ids.append(meta["system"]["id"])
+    return ids
+
+
+def test_versions(versioned_store: MyStore):
+    store = versioned_store
+    datas = [b"first", b"second" * 100, b"third"]
+    ids = write_versions(store, "a.bin", datas)
+    assert store.list_versions("a.bin") == ids
+    assert store.open("a.bin").read() == datas[-1]
+
+    for id, data in zip(ids, datas):
+        with store.open_version("a.bin", id=id) as f:
+            assert f.read() == data
+    assert store.read_version_meta("a.bin", ids[0])["user"] == {"version": 0}
+
+    # 時刻を指定してその時点のバージョンを読み込む
+    with store.open_version("a.bin", as_of=to_timestamp(ids[1])) as f:
+        assert f.read() == datas[1]
+    assert store.read_version_meta("a.bin", as_of=time.time())["system"]["id"] == ids[2]
+    with pytest.raises(RFC7807Error) as e:
+        store.open_version("a.bin", as_of=to_timestamp(ids[0]) - 1)
+    assert e.value.status == 404
+
+    # 失敗した書き込みは最新のバージョンを変更しない
+    with pytest.raises(RFC7807Error):
+        store.write_file("a.bin", BytesIO(b"x"), {"hash": "sha256:00"})
+    assert store.open("a.bin").read() == datas[-1]
+    assert store.list_versions("a.bin") == ids
+
+    # 削除はマーカーを残し、過去のバージョンは読み込める
+    assert store.delete("a.bin")
+    versions = store.list_versions("a.bin")
+    assert versions[:3] == ids and len(versions) == 4
+    with pytest.raises(FileNotFoundError):
+        store.read_meta("a.bin")
+    with pytest.raises(RFC7807Error):
+        store.open_version("a.bin", as_of=time.time())
+    with store.open_version("a.bin", id=ids[2]) as f:
+        assert f.read() == datas[2]
+
+
+def test_expire_versions(versioned_store: MyStore):
+    store = versioned_store
+    bp = store._blueprint
+    fs = store._client
+    datas = [b"v0", b"v1" * 100, b"v2", b"v3" * 100]
+    ids = write_versions(store, "a.bin", datas)
+
+    # 退避したバージョンのチャンクは回収しない
+    GarbageCollector(fs, bp, grace=0).run_cycle()
+    with store.open_version("a.bin", id=ids[1]) as f:
+        assert f.read() == datas[1]
+
+    assert store.expire_versions("a.bin") == 0
+    assert store.expire_versions("a.bin", keep=1) == 2
+    assert store.list_versions("a.bin") == ids[2:]
+    assert not fs.exists(bp.get_version_data_path("a.bin", ids[0]))
+    assert not fs.exists(bp.get_chunked_data_path(ids[1]))
+    with store.open_version("a.bin", id=ids[2]) as f:
+        assert f.read() == datas[2]
+
+    # 削除後、保持期間を過ぎるとマーカーを含めて全て回収される
+    assert store.delete("a.bin")
+    bp._blueprint["rules"]["system"]["versions_max_age"] = 0.001
+    time.sleep(0.01)
+    stats = GarbageCollector(fs, bp, grace=0).run_cycle()
+    assert stats["versions"] == 1
+    assert store.list_versions("a.bin") == []
+    assert not fs.exists(bp.get_chunked_data_path(ids[3]))
+
+
+def test_packed_versions(versioned_store: MyStore):
+    store = versioned_store
+    bp = store._blueprint
+    fs = store._client
+    bp._blueprint["rules"]["system"]["pack_threshold"] = 100
+    v1 = store.write_file("a.bin", BytesIO(b"v1"))
+    v2 = PackWriter(fs, bp).write("a.bin", b"v2")
+    results = store.write_many([("a.bin", BytesIO(b"v3"), {})])
+    assert results["a.bin"]["system"]["chunks"]["layout"] == "pack"
+
+    # パックへの上書きも旧バージョンを退避する
+    ids = [v1["system"]["id"], v2["system"]["id"], results["a.bin"]["system"]["id"]]
+    assert store.list_versions("a.bin") == ids
+    for id, data in zip(ids, [b"v1", b"v2", b"v3"]):
+        with store.open_version("a.bin", id=id) as f:
+            assert f.read() == data
+
+    # バージョンが参照するセグメントは回収しない
+    GarbageCollector(fs, bp, grace=0).run_cycle()
+    with store.open_version("a.bin", id=ids[1]) as f:
+        assert f.read() == b"v2"
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime, timezone
 from dateutil import tz
 from amature_fs import tickers
@@ -193,3 +194,58 @@ def test_virtual_ticker(expected_interval=1, n=100, min_hit_rate=1):
     assert hit_rate >= min_hit_rate, (
         f"Hit rate too low: {hit_rate:.2%} < {min_hit_rate:.2%}  {hit_count} / {len(diffs)}"
     )
+
+
+def test_uuid7_ticker_take_batch():
+    # 時刻が進まない場合もカウンタで単調増加する
+    ticker = tickers.Uuid7Ticker(tickers.VirtualTicker(1747332558.664, 0))
+    results = ticker.take_batch(1000) + [ticker.tick()]
+    uuids = [u for _, u in results]
+    assert len(set(uuids)) == 1001
+    assert uuids == sorted(uuids)
+    assert {ts for ts, _ in results} == {1747332558.664}
+    for ts, u in results[:10]:
+        assert u.version == 7
+        assert tickers._uuid7.to_timestamp(u) == ts
+
+    # カウンタが桁あふれした場合はミリ秒を進める
+    ticker._counter = tickers._uuid7.COUNTER_MAX
+    (_, u1), (ts2, u2) = ticker.take_batch(2)
+    assert u1 < u2
+    assert ts2 == 1747332558.665
+
+    ticker = tickers.Uuid7Ticker(tickers.RealtimeTicker())
+    uuids = [u for _, u in ticker.take_batch(500) + ticker.take_batch(500)]
+    assert uuids == sorted(uuids) and len(set(uuids)) == 1000
+
+
+def test_sleeping_realtime_ticker():
+    ticker = tickers.SleepingRealtimeTicker(interval_sec=0.002)
+    results = ticker.take_batch(20)
+    diffs = [round(b - a, 3) for a, b in zip(results, results[1:])]
+    assert all(0.002 <= d for d in diffs)
+    assert results[-1] <= time.time()
+
+
+def test_uuid7_array():
+    np = pytest.importorskip("numpy")
+    from amature_fs.tickers import _array
+
+    timestamps = np.array([1747332558.664, 1747332558.664, 1747332558.665123, 1.1234])
+    array = _array.from_timestamps(timestamps)
+    assert array.shape == (4, 2)
+    assert list(_array.to_timestamps(array)) == [
+        1747332558.664,
+        1747332558.664,
+        1747332558.665,
+        1.123,
+    ]
+
+    uuids = _array.to_uuids(array)
+    assert [u.version for u in uuids] == [7] * 4
+    assert uuids[0] < uuids[1] < uuids[2]
+    for ts, u in zip(timestamps, uuids):
+        ts_, nanos = tickers._timestamp.to_uuid7_seed(ts)
+        assert tickers._uuid7.to_timestamp(u) == ts_ + nanos / 1e9
+    assert (_array.from_uuids(uuids) == array).all()
+    assert (_array.from_uuids([str(u) for u in uuids]) == array).all()